@@ -0,0 +1,75 @@
+"""
+Микробенчмарк разбора кадров WebSocket: кадров/сек до и после префильтра и быстрого декодера.
+
+Прогоняет записанные кадры Bybit и OKX (benchmarks/data/*_frames.jsonl: тикеры,
+сделки по неинтересным каналам, понги и подтверждения подписки) через
+`handle_message` адаптеров двумя путями:
+
+    baseline  — json.loads на каждом кадре (как было в BaseWSClient.listen)
+    optimized — байтовый префильтр + выбранный декодер (orjson/msgspec/json)
+
+Запуск:
+    python -m benchmarks.bench_decoder [--rounds 200] [--decoder auto]
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from core.decoder import get_decoder, make_prefilter
+from core.exchange_bybit import BybitWS
+from core.exchange_okx import OKXWS
+from core.ws_pool import TICKERS
+
+DATA_DIR = Path(__file__).parent / "data"
+SYMBOLS = ["BTC-USDT", "ETH-USDT", "XRP-USDT", "DOGE-USDT", "TON-USDT"]
+
+
+async def _noop_callback(**kwargs):
+    pass
+
+
+def load_frames(name: str) -> list[bytes]:
+    """Загружает записанные кадры биржи как сырые байты."""
+    with open(DATA_DIR / f"{name}_frames.jsonl", "rb") as f:
+        return [line.rstrip(b"\n") for line in f if line.strip()]
+
+
+async def run_path(frames: list[bytes], handler, decode, prefilter, rounds: int) -> float:
+    """
+    Прогоняет кадры `rounds` раз и возвращает пропускную способность в кадрах/сек.
+    """
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for frame in frames:
+            if prefilter is not None and not prefilter(frame):
+                continue
+            await handler(decode(frame))
+    elapsed = time.perf_counter() - start
+    return len(frames) * rounds / elapsed
+
+
+async def main(rounds: int, decoder: str):
+    decoder_name, decode = get_decoder(decoder)
+    adapters = {
+        # Образцы кадров — тикеры
+        "bybit": BybitWS(SYMBOLS, _noop_callback, mode=TICKERS),
+        "okx": OKXWS(SYMBOLS, _noop_callback, mode=TICKERS),
+    }
+    print(f"decoder={decoder_name} rounds={rounds}")
+    print(f"{'exchange':<8} {'frames':>7} {'baseline f/s':>14} {'optimized f/s':>14} {'speedup':>8}")
+    for name, adapter in adapters.items():
+        frames = load_frames(name)
+        prefilter = make_prefilter(adapter.pool.frame_markers)
+        baseline = await run_path(frames, adapter.handle_message, lambda frame: json.loads(frame.decode()), None, rounds)
+        optimized = await run_path(frames, adapter.handle_message, decode, prefilter, rounds)
+        print(f"{name:<8} {len(frames):>7} {baseline:>14,.0f} {optimized:>14,.0f} {optimized / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rounds", type=int, default=200, help="Сколько раз прогнать набор кадров")
+    parser.add_argument("--decoder", default="auto", help="auto | orjson | msgspec | json")
+    args = parser.parse_args()
+    asyncio.run(main(args.rounds, args.decoder))
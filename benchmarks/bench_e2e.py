@@ -0,0 +1,220 @@
+"""
+Сквозной бенчмарк бота на локальных заменителях Bybit/OKX.
+
+Поднимает `benchmarks.exchange_servers` в отдельном процессе, направляет на
+них `main.main()` через BYBIT_URL/OKX_URL и для каждой частоты пушей меряет:
+
+    latency_ms  p50/p99/p999 задержки тик→оценка (время биржи → вызов evaluate_venues);
+                разрешение 1 мс, как у поля `ts` бирж
+    throughput  принятых тиков/сек и долю от отправленных
+    cpu_percent загрузку процесса бота
+    rss_mb      резидентную память процесса бота
+
+Результаты пишутся в JSON (по умолчанию benchmarks/results/e2e-<commit>-<время>.json),
+`--baseline` сравнивает с предыдущим прогоном.
+
+Запуск:
+    python -m benchmarks.bench_e2e --symbols 50 --rates 1000,5000,20000 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def percentile(sorted_values: list[float], q: float) -> float | None:
+    """Перцентиль `q` (0..1) по отсортированному списку (метод ближайшего ранга)."""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values) + 0.5)) - 1))
+    return round(sorted_values[index], 3)
+
+
+def rss_mb() -> float:
+    """Резидентная память текущего процесса в МБ."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    import resource
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Probe:
+    """Собирает задержки и число тиков из подменённых компонентов бота."""
+
+    def __init__(self):
+        self.latencies_ms: list[float] = []
+        self.ticks = 0
+        self.evaluations = 0
+        self.opportunities = 0
+
+    def reset(self):
+        self.latencies_ms.clear()
+        self.ticks = self.evaluations = self.opportunities = 0
+
+
+def install_probe(main_module, probe: Probe):
+    """
+    Подменяет `PriceState` и `ArbitrageEvaluator` в main.py тонкими наследниками со счётчиками.
+    """
+    base_state = main_module.PriceState
+    base_evaluator = main_module.ArbitrageEvaluator
+
+    class ProbePriceState(base_state):
+        def update_by_id(self, *args, **kwargs):
+            probe.ticks += 1
+            return super().update_by_id(*args, **kwargs)
+
+    class ProbeEvaluator(base_evaluator):
+        def evaluate_venues(self, price_state, symbol_id):
+            opportunity = super().evaluate_venues(price_state, symbol_id)
+            newest = price_state.newest_timestamp(symbol_id) or 0
+            probe.latencies_ms.append((time.time() - newest) * 1000)
+            probe.evaluations += 1
+            if opportunity:
+                probe.opportunities += 1
+            return opportunity
+
+    main_module.PriceState = ProbePriceState
+    main_module.ArbitrageEvaluator = ProbeEvaluator
+
+
+async def measure(main_module, probe: Probe, counters, warmup: float, duration: float) -> dict:
+    """Запускает бота, ждёт прогрева и снимает метрики за `duration` секунд."""
+    bot = asyncio.create_task(main_module.main())
+    await asyncio.sleep(warmup)
+    probe.reset()
+    sent_before = {name: value.value for name, value in counters.items()}
+    cpu_before = time.process_time()
+    wall_before = time.perf_counter()
+    await asyncio.sleep(duration)
+    wall = time.perf_counter() - wall_before
+    cpu = time.process_time() - cpu_before
+    sent = sum(value.value - sent_before[name] for name, value in counters.items())
+
+    bot.cancel()
+    await asyncio.gather(bot, return_exceptions=True)
+
+    latencies = sorted(probe.latencies_ms)
+    return {
+        "sent": sent,
+        "received": probe.ticks,
+        "delivered_ratio": round(probe.ticks / sent, 4) if sent else None,
+        "throughput_per_s": round(probe.ticks / wall, 1),
+        "evaluations": probe.evaluations,
+        "opportunities": probe.opportunities,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5),
+            "p99": percentile(latencies, 0.99),
+            "p999": percentile(latencies, 0.999),
+            "max": round(latencies[-1], 3) if latencies else None,
+        },
+        "cpu_percent": round(cpu / wall * 100, 1),
+        "rss_mb": rss_mb(),
+    }
+
+
+def run(args) -> dict:
+    symbols = [f"SYM{i}-USDT" for i in range(args.symbols)]
+    os.environ.update({
+        "BYBIT_URL": f"ws://127.0.0.1:{args.bybit_port}",
+        "OKX_URL": f"ws://127.0.0.1:{args.okx_port}",
+        "SYMBOLS": ",".join(symbols),
+        "STATS_LOG_INTERVAL": "0",
+        "TELEGRAM_TOKEN": "",
+    })
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    import main as main_module
+    logging.getLogger().setLevel(logging.ERROR)
+
+    from benchmarks.exchange_servers import serve_forever
+
+    probe = Probe()
+    install_probe(main_module, probe)
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for rate in args.rates:
+        counters = {"bybit": context.Value("q", 0), "okx": context.Value("q", 0)}
+        ready = context.Event()
+        server = context.Process(
+            target=serve_forever,
+            args=(symbols, rate, args.bybit_port, args.okx_port),
+            kwargs={"ready": ready, "counters": counters},
+            daemon=True,
+        )
+        server.start()
+        try:
+            if not ready.wait(10):
+                raise RuntimeError("Заменители бирж не запустились")
+            result = asyncio.run(measure(main_module, probe, counters, args.warmup, args.duration))
+        finally:
+            server.terminate()
+            server.join()
+        result = {"rate_per_exchange": rate, **result}
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False))
+
+    return {
+        "benchmark": "e2e",
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "params": {"symbols": args.symbols, "duration_s": args.duration, "warmup_s": args.warmup},
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline_path: str):
+    """Печатает изменение p99 и пропускной способности относительно прошлого прогона."""
+    with open(baseline_path) as f:
+        baseline = {r["rate_per_exchange"]: r for r in json.load(f)["results"]}
+    for result in report["results"]:
+        previous = baseline.get(result["rate_per_exchange"])
+        if not previous:
+            continue
+        p99, old_p99 = result["latency_ms"]["p99"], previous["latency_ms"]["p99"]
+        print(
+            f"rate={result['rate_per_exchange']}: p99 {old_p99} -> {p99} мс, "
+            f"throughput {previous['throughput_per_s']} -> {result['throughput_per_s']}/с"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=20, help="Число синтетических пар")
+    parser.add_argument("--rates", type=lambda v: [float(x) for x in v.split(",")], default=[1000.0, 5000.0],
+                        help="Частоты пушей на биржу через запятую")
+    parser.add_argument("--duration", type=float, default=10, help="Длительность замера, секунды")
+    parser.add_argument("--warmup", type=float, default=2, help="Прогрев перед замером, секунды")
+    parser.add_argument("--bybit-port", type=int, default=18001)
+    parser.add_argument("--okx-port", type=int, default=18002)
+    parser.add_argument("--output", help="Файл для JSON-отчёта")
+    parser.add_argument("--baseline", help="JSON-отчёт прошлого прогона для сравнения")
+    args = parser.parse_args()
+
+    report = run(args)
+    output = Path(args.output) if args.output else RESULTS_DIR / f"e2e-{report['commit']}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Отчёт: {output}")
+    if args.baseline:
+        compare(report, args.baseline)
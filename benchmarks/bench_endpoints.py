@@ -0,0 +1,114 @@
+"""
+Выбор эндпоинта по задержке и переезд make-before-break на локальных заменителях.
+
+Поднимает заменитель Bybit в отдельном процессе и перед ним два `LatencyProxy`
+(зеркала A и B) плюс заведомо недоступный адрес. `BaseWSClient` получает все
+три URL, подписывается на тикеры одной пары и по ходу сценария задержки
+зеркал меняются местами:
+
+    start   A 30 мс, B 5 мс   — при подключении должен быть выбран B
+    swap    B 40 мс           — фоновый замер должен увести соединение на A
+    back    A 60 мс, B 2 мс   — и обратно на B
+
+У одной пары `cs` заменителя идёт подряд, поэтому по принятым кадрам видно
+потерянные, повторные и пришедшие не по порядку тики. По фазам печатаются
+эндпоинт, число переездов и задержка тика (время биржи → обработчик).
+
+Запуск:
+    python -m benchmarks.bench_endpoints [--rate 500] [--phase 6] [--probe-interval 1]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import time
+
+from benchmarks.exchange_servers import LatencyProxy, serve_forever
+from core.base_ws_client import BaseWSClient
+from core.exchange_bybit import BybitWS
+
+SYMBOL = "SYM0-USDT"
+TOPIC = f"tickers.{SYMBOL.replace('-', '')}"
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+async def scenario(args):
+    mirror_a = LatencyProxy(args.bybit_port, args.proxy_port, delay_ms=30)
+    mirror_b = LatencyProxy(args.bybit_port, args.proxy_port + 1, delay_ms=5)
+    for mirror in (mirror_a, mirror_b):
+        await mirror.start()
+    names = {mirror_a.url: "A", mirror_b.url: "B", "ws://127.0.0.1:1": "down"}
+
+    sequence = []
+    latencies = []
+
+    async def handle(msg):
+        if msg.get("topic") == TOPIC:
+            sequence.append(msg["cs"])
+            latencies.append(time.time() * 1000 - msg["ts"])
+
+    client = BaseWSClient(
+        url=list(names),
+        subscribe_payload={"op": "subscribe", "args": [TOPIC]},
+        name="Bybit",
+        message_handler=handle,
+        frame_markers=BybitWS.FRAME_MARKERS,
+        dedup_key=BybitWS.dedup_key,
+        probe_interval=args.probe_interval,
+        migration_min_gain_ms=5,
+    )
+    task = asyncio.create_task(client.connect())
+    phases = [
+        ("start", {}),
+        ("swap", {mirror_b: 40}),
+        ("back", {mirror_a: 60, mirror_b: 2}),
+    ]
+    print(f"{'phase':<6} {'endpoint':>8} {'migrations':>10} {'ticks':>7} {'p50 ms':>7} {'p99 ms':>7}")
+    try:
+        for phase, delays in phases:
+            for mirror, delay in delays.items():
+                mirror.delay_ms = delay
+            latencies.clear()
+            await asyncio.sleep(args.phase)
+            # Задержка по последней трети фазы — после переезда
+            tail = latencies[len(latencies) * 2 // 3:]
+            print(f"{phase:<6} {names[client.url]:>8} {client.migrations:>10} {len(latencies):>7} "
+                  f"{percentile(tail, 0.5):>7.1f} {percentile(tail, 0.99):>7.1f}")
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        for mirror in (mirror_a, mirror_b):
+            await mirror.stop()
+
+    received = set(sequence)
+    lost = (max(sequence) - min(sequence) + 1 - len(received)) if sequence else 0
+    duplicates = len(sequence) - len(received)
+    reordered = sum(1 for previous, current in zip(sequence, sequence[1:]) if current < previous)
+    print(f"ticks={len(sequence)} lost={lost} duplicates={duplicates} reordered={reordered}")
+
+
+def main(args):
+    context = multiprocessing.get_context("spawn")
+    ready = context.Event()
+    server = context.Process(target=serve_forever, args=([SYMBOL], args.rate, args.bybit_port, args.okx_port),
+                             kwargs={"ready": ready}, daemon=True)
+    server.start()
+    try:
+        ready.wait(10)
+        asyncio.run(scenario(args))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=500, help="Пушей в секунду")
+    parser.add_argument("--phase", type=float, default=6, help="Длительность фазы, секунды")
+    parser.add_argument("--probe-interval", type=float, default=1, help="Период фоновых замеров, секунды")
+    parser.add_argument("--bybit-port", type=int, default=18201)
+    parser.add_argument("--okx-port", type=int, default=18202)
+    parser.add_argument("--proxy-port", type=int, default=18211)
+    main(parser.parse_args())
@@ -0,0 +1,109 @@
+"""
+Задержка пути тика с логированием на каждом тике: выключено, синхронно и через очередь.
+
+Каждый тик — обновление `PriceState`, постановка пары в `CoalescingQueue` и
+предупреждение в лог (как при всплеске сообщений об устаревших данных или
+ошибках разбора во время инцидента). Режимы:
+
+    off        — логирование выключено (нижняя граница)
+    sync       — FileHandler на цикле событий (как было с basicConfig)
+    async      — очередь и поток записи (`setup_logging`) без подавления повторов
+    async+rate — то же с подавлением повторов по ключу
+
+`--write-delay-us` добавляет задержку к каждой записи в файл, имитируя
+медленный диск или переполненный терминал.
+
+Запуск:
+    python -m benchmarks.bench_logging [--ticks 50000] [--write-delay-us 50]
+"""
+import argparse
+import logging
+import tempfile
+import time
+
+from core.async_logging import TextFormatter, FILE_FORMAT, setup_logging, stop_logging
+from core.coalescing_queue import CoalescingQueue
+from core.price_state import PriceState
+
+SYMBOLS = [f"SYM{i}-USDT" for i in range(20)]
+
+
+class SlowFileHandler(logging.FileHandler):
+    """Файл, каждая запись в который стоит не меньше `delay` секунд."""
+
+    def __init__(self, path: str, delay: float):
+        super().__init__(path, encoding="utf-8")
+        self.delay = delay
+
+    def emit(self, record):
+        super().emit(record)
+        if self.delay:
+            deadline = time.perf_counter() + self.delay
+            while time.perf_counter() < deadline:
+                pass
+
+
+def configure(mode: str, directory: str, delay: float):
+    root = logging.getLogger()
+    stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    logging.disable(logging.NOTSET)
+    if mode == "off":
+        logging.disable(logging.CRITICAL)
+        return
+    handler = SlowFileHandler(f"{directory}/{mode}.log", delay)
+    handler.setFormatter(TextFormatter(FILE_FORMAT))
+    if mode == "sync":
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        return
+    listener = setup_logging(directory="", console=False, rate_limit=10 if mode == "async+rate" else 0)
+    # Вместо файлов по дням — файл с той же задержкой записи, что у sync
+    listener.handlers = (handler,)
+
+
+def run(ticks: int) -> list[int]:
+    price_state = PriceState(SYMBOLS)
+    evaluation_queue = CoalescingQueue()
+    latencies = []
+    symbol_count = len(SYMBOLS)
+    for tick in range(ticks):
+        symbol_id = tick % symbol_count
+        exchange_id = tick & 1
+        started = time.perf_counter_ns()
+        price_state.update_by_id(symbol_id, exchange_id, 100.0 + tick % 7, 100.1 + tick % 7, time.time())
+        evaluation_queue.put(symbol_id)
+        logging.warning(f"Котировка {price_state.exchanges[exchange_id]} для {SYMBOLS[symbol_id]} устарела")
+        latencies.append(time.perf_counter_ns() - started)
+    return latencies
+
+
+def percentile(values: list[int], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] / 1000
+
+
+def main(ticks: int, write_delay_us: float):
+    print(f"ticks={ticks} write_delay_us={write_delay_us:g}")
+    print(f"{'mode':<11} {'p50 µs':>8} {'p99 µs':>8} {'p99.9 µs':>9} {'max µs':>9} {'ticks/s':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in ("off", "sync", "async", "async+rate"):
+            configure(mode, directory, write_delay_us / 1_000_000)
+            started = time.perf_counter()
+            latencies = run(ticks)
+            elapsed = time.perf_counter() - started
+            print(f"{mode:<11} {percentile(latencies, 0.5):>8.2f} {percentile(latencies, 0.99):>8.2f} "
+                  f"{percentile(latencies, 0.999):>9.2f} {max(latencies) / 1000:>9.1f} {ticks / elapsed:>10,.0f}")
+            # Поток записи дописывает очередь вне замера
+            stop_logging()
+        logging.disable(logging.NOTSET)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ticks", type=int, default=50000, help="Число тиков на режим")
+    parser.add_argument("--write-delay-us", type=float, default=0, help="Задержка каждой записи в файл, мкс")
+    args = parser.parse_args()
+    main(args.ticks, args.write_delay_us)
@@ -0,0 +1,402 @@
+"""
+Локальные заменители публичных WebSocket API Bybit v5 и OKX v5.
+
+Серверы принимают подписки (с подтверждениями и ошибками для неизвестных
+каналов), отвечают на ping и рассылают пуши `tickers` и лучшего уровня
+стакана (`orderbook.1` у Bybit, `bbo-tbt` у OKX), цены которых берутся
+из общего случайного блуждания с независимым шумом на каждой бирже — так
+время от времени возникают арбитражные окна. Поле `ts` — время отправки,
+поэтому задержку тик→сигнал можно мерить на стороне бота.
+
+`--no-bbo` отклоняет подписку на каналы лучшего уровня, как биржа, где они
+недоступны, — для проверки перехода бота на тикеры.
+
+`LatencyProxy` — TCP-прокси с настраиваемой на ходу задержкой: несколько
+прокси перед одним заменителем изображают зеркала биржи с разным сетевым
+путём (задержка действует на рукопожатие, ping/pong и данные).
+
+Запуск отдельно:
+    python -m benchmarks.exchange_servers --symbols 50 --rate 2000
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from websockets.asyncio.server import broadcast, serve
+from websockets.exceptions import ConnectionClosed
+
+
+def format_price(price: float) -> str:
+    """Форматирует цену с числом знаков, типичным для её порядка."""
+    digits = 2 if price >= 100 else 4 if price >= 1 else 6
+    return f"{price:.{digits}f}"
+
+
+class RandomWalk:
+    """
+    Общая для всех бирж средняя цена по каждой паре + независимый шум биржи.
+    """
+
+    def __init__(self, symbols: list[str], seed: int = 1, volatility: float = 0.0002,
+                 venue_noise: float = 0.0008, spread: float = 0.0001):
+        self.random = random.Random(seed)
+        self.mid = {symbol: self.random.uniform(0.1, 50000) for symbol in symbols}
+        self.volatility = volatility
+        self.venue_noise = venue_noise
+        self.spread = spread
+
+    def quote(self, symbol: str) -> tuple[float, float]:
+        """Сдвигает среднюю цену пары и возвращает (bid, ask) для одной биржи."""
+        mid = self.mid[symbol] = self.mid[symbol] * (1 + self.random.gauss(0, self.volatility))
+        venue_mid = mid * (1 + self.random.gauss(0, self.venue_noise))
+        half_spread = venue_mid * self.spread / 2
+        return venue_mid - half_spread, venue_mid + half_spread
+
+
+class StandInExchange:
+    """
+    Базовый заменитель биржи: подписки, ping и рассылка тикеров с заданной частотой.
+
+    Attributes:
+        sent (int): Число отправленных пушей с данными
+        delay_ms (float): Искусственная задержка перед каждой рассылкой и ответом
+    """
+
+    name = "exchange"
+
+    def __init__(self, walk: RandomWalk, symbols: list[str], rate: float, delay_ms: float = 0, bbo: bool = True):
+        """
+        Args:
+            walk (RandomWalk): Источник цен
+            symbols (list[str]): Пары в формате "BTC-USDT"
+            rate (float): Суммарное число пушей в секунду по всем парам
+            delay_ms (float): Искусственная задержка сети
+            bbo (bool): Принимать подписку на канал лучшего уровня стакана
+        """
+        self.walk = walk
+        self.symbols = symbols
+        self.rate = rate
+        self.delay_ms = delay_ms
+        self.bbo = bbo
+        self.sent = 0
+        self.subscribers: dict[str, set] = {}
+        self.connections: set = set()
+        # Ключ подписки (топик/instId) -> пара
+        self.key_to_symbol: dict[str, str] = {}
+
+    # --- протокол, переопределяется в наследниках ---
+
+    async def handle_request(self, ws, request: str):
+        raise NotImplementedError
+
+    def ticker_frame(self, symbol: str, key: str, bid: float, ask: float, ts_ms: int) -> str:
+        raise NotImplementedError
+
+    # --- общая часть ---
+
+    async def _delay(self):
+        if self.delay_ms:
+            await asyncio.sleep(self.delay_ms / 1000)
+
+    async def handler(self, ws):
+        self.connections.add(ws)
+        ws.subscriptions = set()
+        try:
+            async for request in ws:
+                await self._delay()
+                await self.handle_request(ws, request)
+        except ConnectionClosed:
+            # Обрыв со стороны клиента (в том числе принудительное переподключение) — штатная ситуация
+            pass
+        finally:
+            self.connections.discard(ws)
+            for key in ws.subscriptions:
+                self.subscribers.get(key, set()).discard(ws)
+
+    def subscribe(self, ws, key: str):
+        self.subscribers.setdefault(key, set()).add(ws)
+        ws.subscriptions.add(key)
+
+    def unsubscribe(self, ws, key: str):
+        self.subscribers.get(key, set()).discard(ws)
+        ws.subscriptions.discard(key)
+
+    def mute(self, ws):
+        """Перестаёт слать соединению пуши, не закрывая его — имитация зависшего сокета."""
+        for key in list(ws.subscriptions):
+            self.unsubscribe(ws, key)
+
+    async def pump(self):
+        """Рассылает пуши равномерно с частотой `rate`, по кругу по подписанным ключам."""
+        started = time.perf_counter()
+        position = 0
+        while True:
+            await asyncio.sleep(0.001)
+            active = [key for key, connections in self.subscribers.items() if connections]
+            if not active:
+                started = time.perf_counter()
+                self.sent = 0
+                continue
+            due = int((time.perf_counter() - started) * self.rate) - self.sent
+            if due <= 0:
+                continue
+            await self._delay()
+            for _ in range(due):
+                key = active[position % len(active)]
+                position += 1
+                symbol = self.key_to_symbol[key]
+                bid, ask = self.walk.quote(symbol)
+                frame = self.ticker_frame(symbol, key, bid, ask, int(time.time() * 1000))
+                broadcast(self.subscribers[key], frame)
+                self.sent += 1
+
+
+class BybitStandIn(StandInExchange):
+    """Заменитель `wss://stream.bybit.com/v5/public/linear` (`tickers.*` и `orderbook.1.*`)."""
+
+    name = "bybit"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key_to_symbol = {f"tickers.{symbol.replace('-', '')}": symbol for symbol in self.symbols}
+        if self.bbo:
+            self.key_to_symbol.update({f"orderbook.1.{symbol.replace('-', '')}": symbol for symbol in self.symbols})
+        self._snapshot_sent: set = set()
+        # Топик orderbook.1 -> [последний update id, bid, ask] в отправленном виде
+        self._books: dict[str, list] = {}
+
+    def _reply(self, op: str, success: bool = True, ret_msg: str = "", req_id: str = ""):
+        return json.dumps({"success": success, "ret_msg": ret_msg, "conn_id": str(uuid.uuid4()),
+                           "req_id": req_id, "op": op}, separators=(",", ":"))
+
+    async def handle_request(self, ws, request: str):
+        try:
+            message = json.loads(request)
+        except ValueError:
+            return
+        op = message.get("op")
+        req_id = message.get("req_id", "")
+        if op == "ping":
+            await ws.send(self._reply("ping", ret_msg="pong", req_id=req_id))
+        elif op in ("subscribe", "unsubscribe"):
+            unknown = [topic for topic in message.get("args", []) if topic not in self.key_to_symbol]
+            if unknown:
+                await ws.send(self._reply(op, success=False, req_id=req_id,
+                                          ret_msg=f"error:handler not found,topic:{unknown[0]}"))
+                return
+            for topic in message.get("args", []):
+                if op == "subscribe":
+                    self.subscribe(ws, topic)
+                else:
+                    self.unsubscribe(ws, topic)
+            await ws.send(self._reply(op, req_id=req_id))
+
+    def ticker_frame(self, symbol: str, key: str, bid: float, ask: float, ts_ms: int) -> str:
+        if key.startswith("orderbook.1."):
+            return self.book_frame(symbol, key, bid, ask, ts_ms)
+        data = {
+            "symbol": symbol.replace("-", ""),
+            "bid1Price": format_price(bid), "bid1Size": "1.000",
+            "ask1Price": format_price(ask), "ask1Size": "1.000",
+        }
+        message_type = "delta"
+        if key not in self._snapshot_sent:
+            self._snapshot_sent.add(key)
+            message_type = "snapshot"
+            data.update({"lastPrice": format_price((bid + ask) / 2), "markPrice": format_price((bid + ask) / 2)})
+        return json.dumps({"topic": key, "type": message_type, "data": data, "cs": self.sent, "ts": ts_ms},
+                          separators=(",", ":"))
+
+    def book_frame(self, symbol: str, key: str, bid: float, ask: float, ts_ms: int) -> str:
+        """Первый пуш топика — снапшот, дальше дельты: старый уровень с объёмом "0" и новый."""
+        bid, ask = format_price(bid), format_price(ask)
+        book = self._books.get(key)
+        if book is None:
+            book = self._books[key] = [1, bid, ask]
+            message_type = "snapshot"
+            bids, asks = [[bid, "1.000"]], [[ask, "1.000"]]
+        else:
+            book[0] += 1
+            message_type = "delta"
+            bids = [[book[1], "0"], [bid, "1.000"]] if bid != book[1] else [[bid, "2.000"]]
+            asks = [[book[2], "0"], [ask, "1.000"]] if ask != book[2] else [[ask, "2.000"]]
+            book[1], book[2] = bid, ask
+        data = {"s": symbol.replace("-", ""), "b": bids, "a": asks, "u": book[0], "seq": self.sent}
+        return json.dumps({"topic": key, "type": message_type, "ts": ts_ms, "data": data, "cts": ts_ms},
+                          separators=(",", ":"))
+
+
+class OKXStandIn(StandInExchange):
+    """Заменитель `wss://ws.okx.com:8443/ws/v5/public` (каналы `tickers` и `bbo-tbt`)."""
+
+    name = "okx"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Ключ тикеров — instId, лучшего уровня — "bbo-tbt:<instId>"
+        self.key_to_symbol = {symbol: symbol for symbol in self.symbols}
+        if self.bbo:
+            self.key_to_symbol.update({f"bbo-tbt:{symbol}": symbol for symbol in self.symbols})
+
+    async def handle_request(self, ws, request: str):
+        if request == "ping":
+            await ws.send("pong")
+            return
+        try:
+            message = json.loads(request)
+        except ValueError:
+            await ws.send(json.dumps({"event": "error", "code": "60012", "msg": f"Invalid request: {request}"}))
+            return
+        op = message.get("op")
+        if op not in ("subscribe", "unsubscribe"):
+            return
+        for arg in message.get("args", []):
+            key = arg.get("instId") if arg.get("channel") == "tickers" else f"{arg.get('channel')}:{arg.get('instId')}"
+            if key not in self.key_to_symbol:
+                await ws.send(json.dumps({"event": "error", "code": "60018",
+                                          "msg": f"Wrong URL or channel:{arg.get('channel')},instId:{arg.get('instId')} doesn't exist.",
+                                          "connId": "a4d3ae55"}, separators=(",", ":")))
+                continue
+            if op == "subscribe":
+                self.subscribe(ws, key)
+            else:
+                self.unsubscribe(ws, key)
+            await ws.send(json.dumps({"event": op, "arg": arg, "connId": "a4d3ae55"}, separators=(",", ":")))
+
+    def ticker_frame(self, symbol: str, key: str, bid: float, ask: float, ts_ms: int) -> str:
+        if key != symbol:
+            data = {"asks": [[format_price(ask), "1", "0", "1"]], "bids": [[format_price(bid), "1", "0", "1"]],
+                    "ts": str(ts_ms), "seqId": self.sent}
+            return json.dumps({"arg": {"channel": "bbo-tbt", "instId": symbol}, "data": [data]},
+                              separators=(",", ":"))
+        data = {
+            "instType": "SPOT", "instId": symbol, "last": format_price((bid + ask) / 2), "lastSz": "0.1",
+            "askPx": format_price(ask), "askSz": "1", "bidPx": format_price(bid), "bidSz": "1",
+            "open24h": "0", "high24h": "0", "low24h": "0", "sodUtc0": "0", "sodUtc8": "0",
+            "volCcy24h": "0", "vol24h": "0", "ts": str(ts_ms),
+        }
+        return json.dumps({"arg": {"channel": "tickers", "instId": symbol}, "data": [data]}, separators=(",", ":"))
+
+
+class LatencyProxy:
+    """
+    TCP-прокси, задерживающий каждый фрагмент в обе стороны на `delay_ms`.
+
+    Порядок байтов сохраняется: фрагменты отдаются по очереди, а смена
+    задержки действует на фрагменты, принятые после неё.
+
+    Attributes:
+        delay_ms (float): Задержка в одну сторону, мс
+    """
+
+    def __init__(self, target_port: int, port: int, delay_ms: float = 0, host: str = "127.0.0.1"):
+        self.target_port = target_port
+        self.port = port
+        self.delay_ms = delay_ms
+        self.host = host
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}"
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handle(self, client_reader, client_writer):
+        try:
+            upstream_reader, upstream_writer = await asyncio.open_connection(self.host, self.target_port)
+        except OSError:
+            client_writer.close()
+            return
+        await asyncio.gather(self._pipe(client_reader, upstream_writer), self._pipe(upstream_reader, client_writer),
+                             return_exceptions=True)
+
+    async def _pipe(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue = asyncio.Queue()
+
+        async def deliver():
+            while True:
+                due, chunk = await chunks.get()
+                if chunk is None:
+                    break
+                wait = due - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                writer.write(chunk)
+                await writer.drain()
+
+        deliverer = asyncio.create_task(deliver())
+        try:
+            while chunk := await reader.read(65536):
+                chunks.put_nowait((loop.time() + self.delay_ms / 1000, chunk))
+            chunks.put_nowait((0, None))
+            await deliverer
+        finally:
+            deliverer.cancel()
+            writer.close()
+
+
+async def run_servers(symbols: list[str], rate: float, bybit_port: int, okx_port: int, seed: int = 1,
+                      delay_ms: float = 0, ready=None, counters=None, bbo: bool = True):
+    """
+    Запускает оба заменителя и рассылает тикеры до отмены.
+
+    Args:
+        symbols (list[str]): Пары в формате "BTC-USDT"
+        rate (float): Пушей в секунду на каждую биржу
+        bybit_port (int): Порт заменителя Bybit
+        okx_port (int): Порт заменителя OKX
+        seed (int): Зерно случайного блуждания
+        delay_ms (float): Искусственная задержка ответов и рассылки
+        ready (multiprocessing.Event, optional): Выставляется, когда серверы слушают
+        counters (dict[str, multiprocessing.Value], optional): Куда публиковать число отправленных пушей
+        bbo (bool): Принимать подписку на каналы лучшего уровня стакана
+    """
+    walk = RandomWalk(symbols, seed=seed)
+    exchanges = [BybitStandIn(walk, symbols, rate, delay_ms, bbo), OKXStandIn(walk, symbols, rate, delay_ms, bbo)]
+    async with serve(exchanges[0].handler, "127.0.0.1", bybit_port, compression=None), \
+            serve(exchanges[1].handler, "127.0.0.1", okx_port, compression=None):
+        pumps = [asyncio.create_task(exchange.pump()) for exchange in exchanges]
+        if ready is not None:
+            ready.set()
+        try:
+            while True:
+                await asyncio.sleep(0.1)
+                if counters is not None:
+                    for exchange in exchanges:
+                        counters[exchange.name].value = exchange.sent
+        finally:
+            for pump in pumps:
+                pump.cancel()
+
+
+def serve_forever(*args, **kwargs):
+    """Точка входа для отдельного процесса."""
+    try:
+        asyncio.run(run_servers(*args, **kwargs))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=10, help="Число синтетических пар")
+    parser.add_argument("--rate", type=float, default=1000, help="Пушей в секунду на биржу")
+    parser.add_argument("--bybit-port", type=int, default=18001)
+    parser.add_argument("--okx-port", type=int, default=18002)
+    parser.add_argument("--delay-ms", type=float, default=0, help="Искусственная задержка")
+    parser.add_argument("--no-bbo", action="store_true", help="Отклонять подписку на orderbook.1 и bbo-tbt")
+    args = parser.parse_args()
+    names = [f"SYM{i}-USDT" for i in range(args.symbols)]
+    print(f"Bybit: ws://127.0.0.1:{args.bybit_port}  OKX: ws://127.0.0.1:{args.okx_port}")
+    serve_forever(names, args.rate, args.bybit_port, args.okx_port, delay_ms=args.delay_ms, bbo=not args.no_bbo)
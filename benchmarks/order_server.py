@@ -0,0 +1,318 @@
+"""
+Локальный заменитель приватных REST API заявок Bybit v5 и OKX v5.
+
+Один сервер обслуживает оба API (пути не пересекаются): проверяет подписи
+так же, как биржи, принимает и отменяет заявки по клиентскому
+идентификатору, отвечает на запросы времени сервера, которыми исполнитель
+прогревает соединения. `delay_ms` задаёт задержку по биржам, `reject_rate` —
+долю отклонённых заявок. Считаются TCP-соединения, чтобы было видно
+переиспользование keep-alive.
+
+Запуск отдельно (исполнитель направляется через BYBIT_REST_URL/OKX_REST_URL):
+    python -m benchmarks.order_server --port 18090
+
+Прогон исполнителя против заменителя с задержками ног:
+    python -m benchmarks.order_server --bench 200 --bybit-delay-ms 5 --okx-delay-ms 8
+
+После замеров `--bench` проверяет, что подписи приняты, нога по таймауту
+отменяется, несбалансированная сделка распознаётся и блокирует пару, а
+ограничители `submit` не пропускают повторные сделки. Если проверка не
+прошла, процесс завершается с кодом 1.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import random
+import sys
+import time
+import uuid
+
+from aiohttp import web
+
+API_KEY = "standin-key"
+API_SECRET = "standin-secret"
+PASSPHRASE = "standin-passphrase"
+
+
+class OrderStandIn:
+    """
+    Заменитель API заявок обеих бирж.
+
+    Attributes:
+        orders (dict[str, dict]): Заявки по клиентскому идентификатору
+        cancelled (int): Число отменённых заявок
+        bad_signatures (int): Число запросов с неверной подписью
+        connections (set): Идентификаторы TCP-соединений, по которым приходили запросы
+    """
+
+    def __init__(self, delay_ms: dict = None, reject_rate: float = 0.0, seed: int = 1):
+        """
+        Args:
+            delay_ms (dict, optional): Задержка ответа по биржам, {"bybit": 5, "okx": 8}
+            reject_rate (float): Доля заявок, отклоняемых с ошибкой баланса
+            seed (int): Зерно генератора отклонений
+        """
+        self.delay_ms = delay_ms or {}
+        self.reject_rate = reject_rate
+        self.random = random.Random(seed)
+        self.orders: dict[str, dict] = {}
+        self.cancelled = 0
+        self.bad_signatures = 0
+        self.connections: set[int] = set()
+
+    async def _prepare(self, request: web.Request, exchange: str) -> bytes:
+        self.connections.add(id(request.transport))
+        # Тело читается до задержки: заявка доходит до биржи, даже если клиент не дождался ответа
+        body = await request.read()
+        delay = self.delay_ms.get(exchange)
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        return body
+
+    def _rejected(self) -> bool:
+        return self.reject_rate > 0 and self.random.random() < self.reject_rate
+
+    # --- Bybit v5 ---
+
+    def _bybit_signed(self, request: web.Request, body: bytes) -> bool:
+        headers = request.headers
+        payload = (headers.get("X-BAPI-TIMESTAMP", "") + headers.get("X-BAPI-API-KEY", "")
+                   + headers.get("X-BAPI-RECV-WINDOW", "")).encode() + body
+        expected = hmac.new(API_SECRET.encode(), payload, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, headers.get("X-BAPI-SIGN", ""))
+
+    @staticmethod
+    def _bybit_reply(ret_code: int, ret_msg: str, result: dict = None) -> web.Response:
+        return web.json_response({"retCode": ret_code, "retMsg": ret_msg, "result": result or {},
+                                  "retExtInfo": {}, "time": int(time.time() * 1000)})
+
+    async def bybit_time(self, request: web.Request) -> web.Response:
+        await self._prepare(request, "bybit")
+        now = time.time()
+        return self._bybit_reply(0, "OK", {"timeSecond": str(int(now)), "timeNano": str(int(now * 1e9))})
+
+    async def bybit_create(self, request: web.Request) -> web.Response:
+        body = await self._prepare(request, "bybit")
+        if not self._bybit_signed(request, body):
+            self.bad_signatures += 1
+            return self._bybit_reply(10004, "error sign!")
+        order = json.loads(body)
+        if self._rejected():
+            return self._bybit_reply(170131, "Insufficient balance.")
+        order_id = str(uuid.uuid4())
+        self.orders[order["orderLinkId"]] = {"exchange": "bybit", "order_id": order_id, **order}
+        return self._bybit_reply(0, "OK", {"orderId": order_id, "orderLinkId": order["orderLinkId"]})
+
+    async def bybit_cancel(self, request: web.Request) -> web.Response:
+        body = await self._prepare(request, "bybit")
+        if not self._bybit_signed(request, body):
+            self.bad_signatures += 1
+            return self._bybit_reply(10004, "error sign!")
+        order = self.orders.get(json.loads(body).get("orderLinkId"))
+        if order is None:
+            return self._bybit_reply(110001, "Order does not exist.")
+        self.cancelled += 1
+        return self._bybit_reply(0, "OK", {"orderId": order["order_id"], "orderLinkId": order["orderLinkId"]})
+
+    # --- OKX v5 ---
+
+    def _okx_signed(self, request: web.Request, body: bytes) -> bool:
+        headers = request.headers
+        payload = (headers.get("OK-ACCESS-TIMESTAMP", "") + request.method + request.path).encode() + body
+        expected = base64.b64encode(hmac.new(API_SECRET.encode(), payload, hashlib.sha256).digest()).decode()
+        return hmac.compare_digest(expected, headers.get("OK-ACCESS-SIGN", "")) \
+            and headers.get("OK-ACCESS-PASSPHRASE") == PASSPHRASE
+
+    @staticmethod
+    def _okx_reply(code: str, msg: str, data: list = None) -> web.Response:
+        return web.json_response({"code": code, "msg": msg, "data": data or []})
+
+    async def okx_time(self, request: web.Request) -> web.Response:
+        await self._prepare(request, "okx")
+        return self._okx_reply("0", "", [{"ts": str(int(time.time() * 1000))}])
+
+    async def okx_order(self, request: web.Request) -> web.Response:
+        body = await self._prepare(request, "okx")
+        if not self._okx_signed(request, body):
+            self.bad_signatures += 1
+            return self._okx_reply("50113", "Invalid Sign")
+        order = json.loads(body)
+        if self._rejected():
+            return self._okx_reply("1", "All operations failed", [{
+                "clOrdId": order["clOrdId"], "ordId": "", "sCode": "51008",
+                "sMsg": "Order failed. Insufficient balance.",
+            }])
+        order_id = str(random.getrandbits(60))
+        self.orders[order["clOrdId"]] = {"exchange": "okx", "order_id": order_id, **order}
+        return self._okx_reply("0", "", [{"clOrdId": order["clOrdId"], "ordId": order_id, "sCode": "0", "sMsg": ""}])
+
+    async def okx_cancel(self, request: web.Request) -> web.Response:
+        body = await self._prepare(request, "okx")
+        if not self._okx_signed(request, body):
+            self.bad_signatures += 1
+            return self._okx_reply("50113", "Invalid Sign")
+        client_id = json.loads(body).get("clOrdId")
+        order = self.orders.get(client_id)
+        if order is None:
+            return self._okx_reply("1", "", [{"clOrdId": client_id, "ordId": "", "sCode": "51400",
+                                             "sMsg": "Order does not exist"}])
+        self.cancelled += 1
+        return self._okx_reply("0", "", [{"clOrdId": client_id, "ordId": order["order_id"], "sCode": "0", "sMsg": ""}])
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v5/market/time", self.bybit_time)
+        app.router.add_post("/v5/order/create", self.bybit_create)
+        app.router.add_post("/v5/order/cancel", self.bybit_cancel)
+        app.router.add_get("/api/v5/public/time", self.okx_time)
+        app.router.add_post("/api/v5/trade/order", self.okx_order)
+        app.router.add_post("/api/v5/trade/cancel-order", self.okx_cancel)
+        return app
+
+
+async def start_server(stand_in: OrderStandIn, host: str = "127.0.0.1", port: int = 18090) -> web.AppRunner:
+    """
+    Запускает заменитель; вернувшийся раннер останавливается через `cleanup()`.
+    """
+    runner = web.AppRunner(stand_in.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else 0.0
+
+
+async def _checks(port: int) -> dict:
+    """
+    Сценарии исполнителя против заменителя.
+
+    Returns:
+        dict: Имя проверки -> прошла ли она
+    """
+    from core.live_trading import ACCEPTED, TIMEOUT, BybitOrderClient, LiveTradeExecutor, OKXOrderClient
+
+    # OKX отвечает дольше таймаута ноги: нога OKX уходит в таймаут и отменяется, Bybit принимается
+    stand_in = OrderStandIn({"okx": 200})
+    runner = await start_server(stand_in, port=port)
+    url = f"http://127.0.0.1:{port}"
+    executor = LiveTradeExecutor(
+        [BybitOrderClient(url, API_KEY, API_SECRET), OKXOrderClient(url, API_KEY, API_SECRET, PASSPHRASE)],
+        notional=100, leg_timeout_ms=50, cooldown=0, max_trades=2, blocked_path="",
+    )
+    opportunity = {"symbol": "BTC-USDT", "buy_exchange": "bybit", "sell_exchange": "okx",
+                   "buy_price": 64000.1, "sell_price": 64100.2, "profit_percent": 0.15}
+    checks = {}
+    try:
+        await executor.start(["BTC-USDT", "ETH-USDT"])
+        result = await executor.execute(opportunity)
+        # Отмена идёт в фоне и ждёт ту же задержку OKX
+        for _ in range(100):
+            if stand_in.cancelled:
+                break
+            await asyncio.sleep(0.01)
+        client_id = result["legs"][1]["client_id"]
+        checks["signature_accepted"] = stand_in.bad_signatures == 0 and result["legs"][0]["status"] == ACCEPTED
+        checks["cancel_on_timeout"] = result["legs"][1]["status"] == TIMEOUT and stand_in.cancelled == 1 \
+            and client_id in stand_in.orders
+        checks["legged_detected"] = result["legged"] and executor.legged == 1 and "BTC-USDT" in executor.blocked
+
+        # Заблокированная пара не торгуется до сброса оператором
+        executor.submit(opportunity)
+        checks["legged_blocks_symbol"] = executor.trades == 1 and not executor._in_flight
+        executor.unblock(["BTC-USDT"])
+
+        # Одно окно — одна сделка, даже когда прошлая уже завершилась
+        stand_in.delay_ms = {}
+        window = object()
+        executor.submit(opportunity, window)
+        await asyncio.gather(*list(executor._tasks))
+        executor.submit(opportunity, window)
+        checks["once_per_window"] = executor.trades == 2 and not executor._in_flight
+
+        # Предел сделок: max_trades=2 уже выбран (execute напрямую не считается, submit — считается)
+        executor.submit({**opportunity, "symbol": "ETH-USDT"}, object())
+        executor.submit(opportunity, object())
+        await asyncio.gather(*list(executor._tasks))
+        checks["max_trades"] = executor.trades == 3 and executor.skipped >= 2
+    finally:
+        await executor.close()
+        await runner.cleanup()
+    return checks
+
+
+async def _bench(args):
+    from core.live_trading import BybitOrderClient, LiveTradeExecutor, OKXOrderClient
+
+    stand_in = OrderStandIn({"bybit": args.bybit_delay_ms, "okx": args.okx_delay_ms}, args.reject_rate)
+    runner = await start_server(stand_in, port=args.port)
+    url = f"http://127.0.0.1:{args.port}"
+    executor = LiveTradeExecutor(
+        [BybitOrderClient(url, API_KEY, API_SECRET), OKXOrderClient(url, API_KEY, API_SECRET, PASSPHRASE)],
+        notional=100, leg_timeout_ms=args.leg_timeout_ms, blocked_path="",
+    )
+    try:
+        await executor.start(["BTC-USDT"])
+        opportunity = {"symbol": "BTC-USDT", "buy_exchange": "bybit", "sell_exchange": "okx",
+                       "buy_price": 64000.1, "sell_price": 64100.2, "profit_percent": 0.15}
+        results = [await executor.execute(opportunity) for _ in range(args.bench)]
+    finally:
+        await executor.close()
+        await runner.cleanup()
+
+    report = {"trades": len(results), "legged": executor.legged, "cancelled": stand_in.cancelled,
+              "bad_signatures": stand_in.bad_signatures, "connections": len(stand_in.connections)}
+    for name, values in (("trade", [r["latency_ms"] for r in results]),
+                         ("bybit", [r["legs"][0]["latency_ms"] for r in results]),
+                         ("okx", [r["legs"][1]["latency_ms"] for r in results])):
+        report[name] = {"p50_ms": _percentile(values, 0.5), "p99_ms": _percentile(values, 0.99)}
+    statuses = {}
+    for result in results:
+        for leg in result["legs"]:
+            statuses[leg["status"]] = statuses.get(leg["status"], 0) + 1
+    report["statuses"] = statuses
+    report["checks"] = await _checks(args.port + 1)
+    if not args.reject_rate:
+        report["checks"]["all_legs_accepted"] = statuses == {"accepted": 2 * len(results)} \
+            and stand_in.bad_signatures == 0
+    print(json.dumps(report, indent=2))
+    failed = [name for name, passed in report["checks"].items() if not passed]
+    if failed:
+        print(f"Проверки не прошли: {failed}", file=sys.stderr)
+        return 1
+    return 0
+
+
+async def _serve(args):
+    stand_in = OrderStandIn({"bybit": args.bybit_delay_ms, "okx": args.okx_delay_ms}, args.reject_rate)
+    runner = await start_server(stand_in, port=args.port)
+    print(f"Bybit/OKX orders: http://127.0.0.1:{args.port} (key={API_KEY}, secret={API_SECRET})")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await runner.cleanup()
+        print(json.dumps({"orders": len(stand_in.orders), "cancelled": stand_in.cancelled,
+                          "bad_signatures": stand_in.bad_signatures}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=18090)
+    parser.add_argument("--bybit-delay-ms", type=float, default=0, help="Задержка ответа Bybit")
+    parser.add_argument("--okx-delay-ms", type=float, default=0, help="Задержка ответа OKX")
+    parser.add_argument("--reject-rate", type=float, default=0.0, help="Доля отклоняемых заявок")
+    parser.add_argument("--bench", type=int, default=0, help="Прогнать столько сделок исполнителем и выйти")
+    parser.add_argument("--leg-timeout-ms", type=float, default=1500, help="Таймаут ноги для --bench")
+    arguments = parser.parse_args()
+    try:
+        if arguments.bench:
+            sys.exit(asyncio.run(_bench(arguments)))
+        asyncio.run(_serve(arguments))
+    except KeyboardInterrupt:
+        pass
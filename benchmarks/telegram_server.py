@@ -0,0 +1,112 @@
+"""
+Локальный заменитель Telegram Bot API для проверки отправки уведомлений.
+
+Принимает `POST /bot<token>/sendMessage`, сохраняет сообщения и, как
+настоящий API, отвечает 429 с `parameters.retry_after`, если в один чат
+пишут чаще `chat_rate` сообщений в секунду. `delay_ms` имитирует медленный
+API. Полученные сообщения доступны в `messages` и по `GET /messages`.
+
+Запуск отдельно (бот направляется на него через TELEGRAM_API_URL):
+    python -m benchmarks.telegram_server --port 18081 --chat-rate 1
+    TELEGRAM_API_URL=http://127.0.0.1:18081/bot python main.py
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+
+class TelegramStandIn:
+    """
+    Заменитель Bot API с лимитом частоты на чат.
+
+    Attributes:
+        messages (list[dict]): Принятые сообщения: chat_id, text, время приёма
+        rejected (int): Число ответов 429
+    """
+
+    def __init__(self, chat_rate: float = 1.0, delay_ms: float = 0, retry_after: int = 1):
+        """
+        Args:
+            chat_rate (float): Допустимая частота сообщений в один чат, в секунду
+            delay_ms (float): Искусственная задержка ответа
+            retry_after (int): Значение retry_after в ответе 429, секунды
+        """
+        self.chat_rate = chat_rate
+        self.delay_ms = delay_ms
+        self.retry_after = retry_after
+        self.messages: list[dict] = []
+        self.rejected = 0
+        self._last_accepted: dict[str, float] = {}
+
+    async def handle_send_message(self, request: web.Request) -> web.Response:
+        if self.delay_ms:
+            await asyncio.sleep(self.delay_ms / 1000)
+        data = await request.post() if request.content_type != "application/json" else await request.json()
+        chat_id = str(data.get("chat_id", ""))
+        text = data.get("text", "")
+        if not chat_id or not text:
+            return web.json_response({"ok": False, "error_code": 400,
+                                      "description": "Bad Request: message text is empty"}, status=400)
+
+        now = time.monotonic()
+        last = self._last_accepted.get(chat_id)
+        if self.chat_rate > 0 and last is not None and now - last < 1 / self.chat_rate:
+            self.rejected += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        self._last_accepted[chat_id] = now
+        message = {"message_id": len(self.messages) + 1, "chat_id": chat_id, "text": text, "date": time.time()}
+        self.messages.append(message)
+        return web.json_response({"ok": True, "result": {
+            "message_id": message["message_id"], "chat": {"id": chat_id}, "date": int(message["date"]), "text": text,
+        }})
+
+    async def handle_messages(self, request: web.Request) -> web.Response:
+        return web.json_response({"messages": self.messages, "rejected": self.rejected})
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/bot{token}/sendMessage", self.handle_send_message)
+        app.router.add_get("/messages", self.handle_messages)
+        return app
+
+
+async def start_server(stand_in: TelegramStandIn, host: str = "127.0.0.1", port: int = 18081) -> web.AppRunner:
+    """
+    Запускает заменитель; вернувшийся раннер останавливается через `cleanup()`.
+    """
+    runner = web.AppRunner(stand_in.app(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+async def _serve(args):
+    stand_in = TelegramStandIn(args.chat_rate, args.delay_ms, args.retry_after)
+    runner = await start_server(stand_in, port=args.port)
+    print(f"Telegram: http://127.0.0.1:{args.port}/bot")
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await runner.cleanup()
+        print(json.dumps({"messages": len(stand_in.messages), "rejected": stand_in.rejected}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="Сообщений в секунду в один чат")
+    parser.add_argument("--delay-ms", type=float, default=0, help="Искусственная задержка ответа")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after в ответе 429")
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
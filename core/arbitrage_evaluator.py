@@ -1,23 +1,43 @@
+import heapq
 import os
 from dotenv import load_dotenv
 
+import numpy as np
+
+from core.order_book import walk_notional, walk_quantity
+from core.price_state import DEFAULT_EXCHANGES
+
 load_dotenv()
 
 # Загрузка комиссий и минимального процента из переменных окружения
 TAKER_FEE_BYBIT = float(os.getenv("TAKER_FEE_BYBIT", 0.001))
 TAKER_FEE_OKX = float(os.getenv("TAKER_FEE_OKX", 0.001))
 THRESHOLD_PERCENT = float(os.getenv("THRESHOLD_PERCENT", 0.1))
+# Минимальный z-score спреда относительно скользящего окна (0 — фильтр выключен)
+SPREAD_ZSCORE_MIN = float(os.getenv("SPREAD_ZSCORE_MIN", 0))
+
+
+def taker_fee(exchange: str) -> float:
+    """Комиссия тейкера биржи из TAKER_FEE_<БИРЖА> (по умолчанию 0.001)."""
+    return float(os.getenv(f"TAKER_FEE_{exchange.upper()}", 0.001))
+
 
 class ArbitrageEvaluator:
     """
-    Оценивает возможность арбитража между двумя биржами для одной валютной пары.
+    Оценивает возможность арбитража между биржами для одной или всех валютных пар.
     """
-    def __init__(self):
-        self.fees = {
-            "bybit": TAKER_FEE_BYBIT,
-            "okx": TAKER_FEE_OKX
-        }
+    def __init__(self, exchanges: tuple[str, ...] = DEFAULT_EXCHANGES):
+        """
+        Args:
+            exchanges (tuple[str, ...]): Биржи, для которых загружаются комиссии.
+        """
+        self.fees = {exchange: taker_fee(exchange) for exchange in exchanges}
         self.min_profit_percent = THRESHOLD_PERCENT
+        self.zscore_min = SPREAD_ZSCORE_MIN
+        # Множители комиссий считаются один раз, а не на каждый вызов
+        self.buy_multipliers = {exchange: 1 + fee for exchange, fee in self.fees.items()}
+        self.sell_multipliers = {exchange: 1 - fee for exchange, fee in self.fees.items()}
+        self._vector_cache = {}
 
     def evaluate(self, symbol: str, prices: dict):
         """
@@ -29,52 +49,259 @@ class ArbitrageEvaluator:
                          {"bybit": {"ask": 1, "bid": 2}, "okx": {"ask": 1, "bid": 2}}
 
         Returns:
-            dict or None: Словарь с деталями арбитража или None, если возможности нет.
+            dict or None: Словарь с деталями самой прибыльной связки или None, если возможности нет.
         """
-        # Проверяем все возможные комбинации покупки и продажи
-        exchanges = list(prices.keys())
-        for i in range(len(exchanges)):
-            for j in range(len(exchanges)):
-                if i == j:
+        # Один проход: две лучшие биржи для покупки (минимальный ask с комиссией)
+        # и для продажи (максимальный bid с комиссией) вместо перебора всех пар бирж
+        asks = []
+        bids = []
+        for exchange_name, price_info in prices.items():
+            ask_price = price_info.get("ask")
+            if ask_price is not None:
+                asks.append((ask_price * self.buy_multipliers.get(exchange_name, 1), exchange_name, ask_price))
+            bid_price = price_info.get("bid")
+            if bid_price is not None:
+                bids.append((bid_price * self.sell_multipliers.get(exchange_name, 1), exchange_name, bid_price))
+        if not asks or not bids:
+            return None
+        asks = heapq.nsmallest(2, asks, key=lambda item: item[0])
+        bids = heapq.nlargest(2, bids, key=lambda item: item[0])
+
+        best = None
+        best_profit = self.min_profit_percent
+        for adjusted_ask, buy_exchange_name, ask_price in asks:
+            for adjusted_bid, sell_exchange_name, bid_price in bids:
+                # Проверка на возможность арбитража
+                if sell_exchange_name == buy_exchange_name or adjusted_ask >= adjusted_bid:
                     continue
+                profit_percent = ((adjusted_bid - adjusted_ask) / adjusted_ask) * 100
+                if profit_percent >= best_profit:
+                    best_profit = profit_percent
+                    best = self._opportunity(symbol, buy_exchange_name, sell_exchange_name, ask_price, bid_price,
+                                             profit_percent)
+        return best
 
-                buy_exchange_name = exchanges[i]
-                sell_exchange_name = exchanges[j]
+    @staticmethod
+    def _opportunity(symbol: str, buy_exchange: str, sell_exchange: str, buy_price: float, sell_price: float,
+                     profit_percent: float) -> dict:
+        return {
+            "symbol": symbol,
+            "buy_exchange": buy_exchange,
+            "sell_exchange": sell_exchange,
+            "buy_price": buy_price,
+            "sell_price": sell_price,
+            "profit_percent": round(profit_percent, 4)
+        }
 
-                buy_price_info = prices[buy_exchange_name]
-                sell_price_info = prices[sell_exchange_name]
+    def evaluate_venues(self, price_state, symbol_id: int):
+        """
+        Оценивает пару по кучам лучших бирж `price_state.venues` за O(1).
 
-                # Убедимся, что у нас есть и ask и bid цены
-                if "ask" not in buy_price_info or "bid" not in sell_price_info:
-                    continue
-                
-                ask_price = buy_price_info["ask"]
-                bid_price = sell_price_info["bid"]
+        Если подключена статистика спредов `price_state.spreads` и задан
+        SPREAD_ZSCORE_MIN, вместо фиксированного THRESHOLD_PERCENT положительный
+        спред должен отклоняться от среднего окна направления не меньше чем на
+        `zscore_min` стандартных отклонений. Пока окно не набрано, действует порог.
 
-                if ask_price is None or bid_price is None:
-                    continue
+        Args:
+            price_state (PriceState): Состояние цен с подключённым `BestVenues`.
+            symbol_id (int): Индекс пары.
+
+        Returns:
+            dict or None: Лучшая связка в формате `evaluate` или None.
+        """
+        best = price_state.venues.best(symbol_id)
+        if best is None:
+            return None
+        ratio, buy_id, sell_id = best
+        return self._venue_opportunity(price_state, symbol_id, buy_id, sell_id, (ratio - 1) * 100)
 
-                # Расчет с учетом комиссий
-                fee_buy = self.fees.get(buy_exchange_name, 0)
-                fee_sell = self.fees.get(sell_exchange_name, 0)
+    def evaluate_direction(self, price_state, symbol_id: int, buy_exchange: str, sell_exchange: str):
+        """
+        Оценивает одно направление пары по текущим ценам `price_state`.
 
-                adjusted_ask = ask_price * (1 + fee_buy)
-                adjusted_bid = bid_price * (1 - fee_sell)
+        Нужна, чтобы проверить направления с открытыми окнами, которые
+        перестали быть лучшими: пороги те же, что у `evaluate_venues`.
 
-                # Проверка на возможность арбитража
-                if adjusted_ask >= adjusted_bid:
+        Args:
+            price_state (PriceState): Состояние цен.
+            symbol_id (int): Индекс пары.
+            buy_exchange (str): Биржа покупки.
+            sell_exchange (str): Биржа продажи.
+
+        Returns:
+            dict or None: Связка в формате `evaluate` или None.
+        """
+        buy_id = price_state.exchange_id(buy_exchange)
+        sell_id = price_state.exchange_id(sell_exchange)
+        if buy_id is None or sell_id is None:
+            return None
+        row = symbol_id * len(price_state.exchanges)
+        adjusted_ask = price_state._ask[row + buy_id] * self.buy_multipliers.get(buy_exchange, 1)
+        adjusted_bid = price_state._bid[row + sell_id] * self.sell_multipliers.get(sell_exchange, 1)
+        # NaN (нет цены) не проходит ни одно сравнение
+        if not adjusted_ask > 0 or not adjusted_bid > adjusted_ask:
+            return None
+        return self._venue_opportunity(price_state, symbol_id, buy_id, sell_id,
+                                       (adjusted_bid / adjusted_ask - 1) * 100)
+
+    def _venue_opportunity(self, price_state, symbol_id: int, buy_id: int, sell_id: int, profit_percent: float):
+        """Применяет порог или z-score к доходности направления и собирает возможность."""
+        if profit_percent <= 0:
+            return None
+        zscore = None
+        if self.zscore_min > 0 and price_state.spreads is not None:
+            zscore = price_state.spreads.zscore(symbol_id, buy_id, sell_id, profit_percent)
+        if zscore is None:
+            if profit_percent < self.min_profit_percent:
+                return None
+        elif zscore < self.zscore_min:
+            return None
+        exchanges = price_state.exchanges
+        row = symbol_id * len(exchanges)
+        opportunity = self._opportunity(price_state.symbols[symbol_id], exchanges[buy_id], exchanges[sell_id],
+                                        price_state._ask[row + buy_id], price_state._bid[row + sell_id],
+                                        profit_percent)
+        if zscore is not None:
+            opportunity["zscore"] = round(zscore, 2)
+        return opportunity
+
+    def _fee_vectors(self, exchanges: tuple[str, ...]) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Возвращает (и кэширует) векторы множителей комиссий для набора бирж.
+        """
+        vectors = self._vector_cache.get(exchanges)
+        if vectors is None:
+            buy = np.array([self.buy_multipliers.get(ex, 1.0) for ex in exchanges], dtype=np.float64)
+            sell = np.array([self.sell_multipliers.get(ex, 1.0) for ex in exchanges], dtype=np.float64)
+            vectors = self._vector_cache[exchanges] = (buy, sell)
+        return vectors
+
+    def evaluate_batch(self, symbols: list[str], exchanges: tuple[str, ...], bid: np.ndarray, ask: np.ndarray,
+                       mask: np.ndarray = None, all_directions: bool = False) -> list[dict]:
+        """
+        Оценивает все пары и все связки бирж за один проход NumPy.
+
+        Args:
+            symbols (list[str]): Валютные пары, соответствующие строкам матриц.
+            exchanges (tuple[str, ...]): Биржи, соответствующие столбцам матриц.
+            bid (np.ndarray): Матрица bid формы (пары × биржи), NaN — нет цены.
+            ask (np.ndarray): Матрица ask той же формы.
+            mask (np.ndarray, optional): Булева маска пар, которые нужно оценивать.
+            all_directions (bool): Вернуть все направления, прошедшие порог, а не только лучшее.
+
+        Returns:
+            list[dict]: Лучшая возможность по каждой паре, прошедшая `THRESHOLD_PERCENT`,
+                в формате `evaluate`. С `all_directions` — все такие направления,
+                у каждой пары первым идёт лучшее.
+        """
+        n_symbols, n_exchanges = bid.shape
+        if n_symbols == 0 or n_exchanges < 2:
+            return []
+        buy_mult, sell_mult = self._fee_vectors(tuple(exchanges))
+
+        adjusted_ask = ask * buy_mult            # (S, E): покупка на бирже i
+        adjusted_bid = bid * sell_mult           # (S, E): продажа на бирже j
+        # profit[s, i, j] — доходность покупки на i и продажи на j
+        with np.errstate(invalid="ignore", divide="ignore"):
+            profit = (adjusted_bid[:, None, :] / adjusted_ask[:, :, None] - 1.0) * 100
+        profit = np.nan_to_num(profit, nan=-np.inf, posinf=-np.inf)
+        diagonal = np.arange(n_exchanges)
+        profit[:, diagonal, diagonal] = -np.inf
+        if mask is not None:
+            profit[~mask] = -np.inf
+
+        flat = profit.reshape(n_symbols, -1)
+        best_index = flat.argmax(axis=1)
+        best_profit = flat[np.arange(n_symbols), best_index]
+
+        opportunities = []
+        for s in np.flatnonzero((best_profit > 0) & (best_profit >= self.min_profit_percent)):
+            if all_directions:
+                passed = np.flatnonzero((flat[s] > 0) & (flat[s] >= self.min_profit_percent))
+                indexes = passed[np.argsort(-flat[s, passed], kind="stable")]
+            else:
+                indexes = (best_index[s],)
+            for index in indexes:
+                buy_i, sell_j = divmod(int(index), n_exchanges)
+                opportunities.append({
+                    "symbol": symbols[s],
+                    "buy_exchange": exchanges[buy_i],
+                    "sell_exchange": exchanges[sell_j],
+                    "buy_price": float(ask[s, buy_i]),
+                    "sell_price": float(bid[s, sell_j]),
+                    "profit_percent": round(float(flat[s, index]), 4)
+                })
+        return opportunities
+
+    def evaluate_state(self, price_state, stale_timeout: float = None, all_directions: bool = False) -> list[dict]:
+        """
+        Полный пересчёт по всему `PriceState`.
+
+        Args:
+            price_state (PriceState): Состояние цен.
+            stale_timeout (float, optional): Если задан, пары с устаревшими котировками пропускаются.
+            all_directions (bool): Вернуть все прошедшие порог направления (см. `evaluate_batch`).
+
+        Returns:
+            list[dict]: Лучшая возможность по каждой готовой паре.
+        """
+        mask = price_state.ready_mask()
+        if stale_timeout is not None:
+            mask &= ~price_state.stale_mask(stale_timeout)
+        return self.evaluate_batch(price_state.symbols, price_state.exchanges, price_state.bid, price_state.ask, mask,
+                                   all_directions)
+
+    def evaluate_depth(self, symbol: str, books: dict, notional: float):
+        """
+        Оценивает исполнимость арбитража на заданную сумму по локальным L2 стаканам.
+
+        Для каждой связки покупка проходит по ask-уровням на `notional`, продажа —
+        по bid-уровням на купленный объём. Если глубины продажи не хватает, объём
+        урезается до исполнимого. Стаканы не копируются.
+
+        Args:
+            symbol (str): Валютная пара.
+            books (dict): Стаканы по биржам: {"bybit": OrderBook, "okx": OrderBook}.
+            notional (float): Сумма покупки в котируемой валюте (например, USDT).
+
+        Returns:
+            dict or None: Детали самой прибыльной связки с VWAP-ценами и исполнимым
+                объёмом или None, если прибыль ниже `THRESHOLD_PERCENT`.
+        """
+        best = None
+        best_profit = self.min_profit_percent
+        for buy_exchange_name, buy_book in books.items():
+            if not buy_book.ready:
+                continue
+            for sell_exchange_name, sell_book in books.items():
+                if sell_exchange_name == buy_exchange_name or not sell_book.ready:
                     continue
 
-                profit_percent = ((adjusted_bid - adjusted_ask) / adjusted_ask) * 100
+                quantity, spent = walk_notional(buy_book.asks, notional)
+                if quantity <= 0:
+                    continue
+                sold, proceeds = walk_quantity(sell_book.bids, quantity)
+                if sold <= 0:
+                    continue
+                if sold < quantity:
+                    # Продать весь объём нельзя — пересчитываем покупку на исполнимый объём
+                    quantity, spent = walk_quantity(buy_book.asks, sold)
+
+                cost = spent * self.buy_multipliers.get(buy_exchange_name, 1)
+                revenue = proceeds * self.sell_multipliers.get(sell_exchange_name, 1)
+                profit_percent = (revenue / cost - 1) * 100
 
-                if profit_percent >= self.min_profit_percent:
-                    return {
+                if profit_percent >= best_profit and revenue > cost:
+                    best_profit = profit_percent
+                    best = {
                         "symbol": symbol,
                         "buy_exchange": buy_exchange_name,
                         "sell_exchange": sell_exchange_name,
-                        "buy_price": ask_price,
-                        "sell_price": bid_price,
-                        "profit_percent": round(profit_percent, 4)
+                        "buy_price": spent / quantity,
+                        "sell_price": proceeds / quantity,
+                        "profit_percent": round(profit_percent, 4),
+                        "quantity": quantity,
+                        "notional": spent,
+                        "profit": revenue - cost,
                     }
-        
-        return None
+        return best
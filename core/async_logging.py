@@ -0,0 +1,233 @@
+"""
+Логирование без записи на цикле событий: очередь, фоновый поток, JSON и ротация файлов.
+
+`setup_logging` ставит на корневой логгер единственный `QueueHandler`: вызов
+`logging.*` на горячем пути только кладёт запись в очередь, а форматирование
+и запись в консоль и файл делает поток `QueueListener`. Повторы одного
+сообщения подавляются ещё до очереди (`RateLimitFilter`): по ключу проходит
+одна запись за окно, а следующая после окна сообщает, сколько повторов было
+отброшено. Ключ — текст сообщения или явный `extra={"log_key": ...}` для
+сообщений, текст которых меняется от раза к разу.
+
+Файлы пишутся в LOG_DIR по дням (`2025-08-06.log`), старше LOG_RETENTION_DAYS
+удаляются. LOG_JSON=True переключает файл и консоль на JSON по строке.
+"""
+import atexit
+import datetime
+import glob
+import json
+import logging
+import os
+import queue
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Каталог файлов логов по дням (пусто — только консоль)
+LOG_DIR = os.getenv("LOG_DIR", "logs")
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", 14))
+LOG_JSON = os.getenv("LOG_JSON", "False").lower() == "true"
+# Окно подавления повторов одного сообщения, секунды (0 — без подавления)
+LOG_RATE_LIMIT_SECONDS = float(os.getenv("LOG_RATE_LIMIT_SECONDS", 10))
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+FILE_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Пропускает по ключу одну запись за `interval` секунд.
+
+    Attributes:
+        suppressed (int): Всего подавленных записей
+    """
+
+    def __init__(self, interval: float = LOG_RATE_LIMIT_SECONDS, max_keys: int = 10000):
+        super().__init__()
+        self.interval = interval
+        self.max_keys = max_keys
+        self.suppressed = 0
+        # Ключ -> [время последней пропущенной записи, подавлено с тех пор]
+        self._seen: dict = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "log_key", None)
+        if key is None:
+            key = (record.levelno, record.getMessage())
+        now = record.created
+        seen = self._seen.get(key)
+        if seen is not None and now - seen[0] < self.interval:
+            seen[1] += 1
+            self.suppressed += 1
+            return False
+        if seen is not None and seen[1]:
+            record.suppressed = seen[1]
+        if seen is None and len(self._seen) >= self.max_keys:
+            # Ключи с уникальным текстом не должны копиться бесконечно
+            self._seen.clear()
+        self._seen[key] = [now, 0]
+        return True
+
+
+class FastQueueHandler(QueueHandler):
+    """
+    `QueueHandler` без форматирования в вызывающем потоке.
+
+    Очередь внутри процесса, поэтому запись не нужно готовить к сериализации:
+    стандартный `prepare` форматирует сообщение и трассировку исключения прямо
+    на цикле событий, здесь это делает поток записи.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: ts, level, logger, msg, process и поля `extra`."""
+
+    RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "log_key"}
+
+    def __init__(self, prefix: str = ""):
+        super().__init__()
+        self.prefix = prefix
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if self.prefix:
+            entry["process"] = self.prefix
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Текстовый формат с префиксом процесса и числом подавленных повторов."""
+
+    def __init__(self, fmt: str, prefix: str = ""):
+        super().__init__(fmt.replace("%(message)s", f"[{prefix}] %(message)s") if prefix else fmt)
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            line += f" (повторов подавлено: {suppressed})"
+        return line
+
+
+class DailyFileHandler(logging.FileHandler):
+    """
+    Файл `<каталог>/<ГГГГ-ММ-ДД>.log`, новый файл с началом дня; старые удаляются.
+    """
+
+    def __init__(self, directory: str, retention_days: int = LOG_RETENTION_DAYS):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.retention_days = retention_days
+        self.day = time.strftime("%Y-%m-%d")
+        super().__init__(self._path(self.day), encoding="utf-8", delay=True)
+
+    def _path(self, day: str) -> str:
+        return os.path.join(self.directory, f"{day}.log")
+
+    def emit(self, record: logging.LogRecord):
+        day = time.strftime("%Y-%m-%d", time.localtime(record.created))
+        if day != self.day:
+            self.day = day
+            self.close()
+            self.baseFilename = os.path.abspath(self._path(day))
+            self._cleanup()
+        super().emit(record)
+
+    def _cleanup(self):
+        if self.retention_days <= 0:
+            return
+        cutoff = time.strftime("%Y-%m-%d", time.localtime(time.time() - self.retention_days * 86400))
+        for path in glob.glob(os.path.join(self.directory, "????-??-??.log")):
+            if os.path.basename(path)[:10] < cutoff:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_logging(prefix: str = "", level: str = LOG_LEVEL, directory: str = LOG_DIR, json_output: bool = LOG_JSON,
+                  rate_limit: float = LOG_RATE_LIMIT_SECONDS, console: bool = True) -> QueueListener:
+    """
+    Заменяет обработчики корневого логгера очередью с фоновым потоком записи.
+
+    Повторный вызов (например, в процессе-воркере) перенастраивает логирование.
+
+    Args:
+        prefix (str): Метка процесса в каждой строке, например "W0"
+        level (str): Уровень корневого логгера
+        directory (str): Каталог файлов по дням (пусто — только консоль)
+        json_output (bool): Писать JSON вместо текста
+        rate_limit (float): Окно подавления повторов, секунды (0 — без подавления)
+        console (bool): Дублировать записи в stderr
+
+    Returns:
+        QueueListener: Запущенный поток записи; останавливается `stop_logging`.
+    """
+    global _listener
+    stop_logging()
+    # Ни один формат не выводит файл/строку вызова и имена потоков/процессов:
+    # без них создание записи не обходит стек и не опрашивает threading/multiprocessing
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    handlers = []
+    if console:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(JsonFormatter(prefix) if json_output else TextFormatter(TEXT_FORMAT, prefix))
+        handlers.append(stream_handler)
+    if directory:
+        file_handler = DailyFileHandler(directory)
+        file_handler.setFormatter(JsonFormatter(prefix) if json_output else TextFormatter(FILE_FORMAT, prefix))
+        handlers.append(file_handler)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = FastQueueHandler(log_queue)
+    if rate_limit > 0:
+        queue_handler.addFilter(RateLimitFilter(rate_limit))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Дописывает очередь и останавливает поток записи."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
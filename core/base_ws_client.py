@@ -1,43 +1,239 @@
 import asyncio
 import json
 import logging
+import random
+import statistics
+import time
+from typing import Callable, Optional
 
 import websockets
 import websockets.protocol
 
+from core.decoder import get_decoder, make_prefilter
+from core.frame_recorder import create_recorder
+from core.metrics import frame_clock
+
+# Число ping на замер RTT эндпоинта (берётся медиана)
+PROBE_PINGS = 3
+# Таймаут замера одного эндпоинта, секунды
+PROBE_TIMEOUT = 5.0
+
+
+async def measure_rtt(ws, pings: int = PROBE_PINGS) -> float:
+    """
+    Медианный RTT ping/pong по открытому соединению, мс.
+    """
+    samples = []
+    for _ in range(pings):
+        started = time.perf_counter()
+        pong = await ws.ping()
+        await pong
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def probe_endpoint(url: str, pings: int = PROBE_PINGS, timeout: float = PROBE_TIMEOUT) -> Optional[tuple[float, float]]:
+    """
+    Открывает пробное соединение и меряет время подключения и RTT до эндпоинта.
+
+    Returns:
+        tuple[float, float] | None: (время подключения, медианный RTT) в мс или None, если эндпоинт недоступен.
+    """
+    async def probe():
+        started = time.perf_counter()
+        async with websockets.connect(url, ping_interval=None) as ws:
+            connect_ms = (time.perf_counter() - started) * 1000
+            return connect_ms, await measure_rtt(ws, pings)
+
+    try:
+        return await asyncio.wait_for(probe(), timeout)
+    except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+        logging.warning(f"[Probe] Эндпоинт {url} недоступен: {e!r}")
+        return None
+
+
+class StreamHandover:
+    """
+    Передача потоков со старого соединения на новое без потерь и без повторов.
+
+    Пока идёт перекрытие, оба соединения подписаны. Поток (топик/инструмент)
+    остаётся за старым соединением, пока оно не доставит кадр, который новое
+    уже доставило: с этого места поток переходит к новому, а кадры нового,
+    пришедшие раньше, отдаются из буфера по порядку. Если новое соединение
+    медленнее, поток переходит к нему на первом кадре, уже отданном старым,
+    и повторы отбрасываются, пока новое не догонит последний кадр старого.
+    Кадры без ключа сверки (ответы на подписку и т.п.) отдаются от обоих соединений.
+
+    Attributes:
+        transferred (int): Потоков, перешедших на новое соединение
+    """
+
+    def __init__(self, handler, dedup_key: Callable[[dict], Optional[tuple]]):
+        self.handler = handler
+        self.dedup_key = dedup_key
+        self.transferred = 0
+        # Поток -> [перешёл к новому, ключи, отданные старым, последний ключ старого, буфер (ключ, кадр) нового]
+        self._streams: dict = {}
+
+    def _stream(self, stream) -> list:
+        state = self._streams.get(stream)
+        if state is None:
+            state = self._streams[stream] = [False, set(), None, []]
+        return state
+
+    async def from_old(self, data):
+        key = self.dedup_key(data)
+        if key is None:
+            await self.handler(data)
+            return
+        state = self._stream(key[0])
+        if state[0]:
+            return
+        await self.handler(data)
+        state[1].add(key)
+        state[2] = key
+        buffered = state[3]
+        for position, (buffered_key, _) in enumerate(buffered):
+            if buffered_key == key:
+                # Новое соединение опередило старое: отдаём то, что оно доставило после этого кадра
+                state[0] = True
+                state[1] = set()
+                state[3] = []
+                self.transferred += 1
+                for _, frame in buffered[position + 1:]:
+                    await self.handler(frame)
+                return
+
+    async def from_new(self, data):
+        key = self.dedup_key(data)
+        if key is None:
+            await self.handler(data)
+            return
+        state = self._stream(key[0])
+        if key in state[1]:
+            # Кадр уже отдан старым: поток переходит к новому, повтор отбрасывается
+            if not state[0]:
+                state[0] = True
+                state[3] = []
+                self.transferred += 1
+            if key == state[2]:
+                # Новое догнало последний кадр старого — повторов больше не будет
+                state[1] = set()
+            return
+        if state[0]:
+            await self.handler(data)
+        else:
+            state[3].append((key, data))
+
+    def complete(self) -> bool:
+        """Все потоки, по которым были кадры, перешли на новое соединение и догнали старое."""
+        return bool(self._streams) and all(state[0] and not state[1] for state in self._streams.values())
+
+    async def finish(self):
+        """
+        Завершает передачу после закрытия старого соединения: отдаёт буферы непереданных потоков.
+        """
+        pending = [state for state in self._streams.values() if not state[0]]
+        for state in pending:
+            state[0] = True
+        for state in pending:
+            buffered, state[3] = state[3], []
+            for _, frame in buffered:
+                await self.handler(frame)
+
 
 class BaseWSClient:
     """
     Базовый класс для работы с WebSocket соединениями.
     Обеспечивает подключение, переподключение, подписку и обработку сообщений.
 
+    Если передано несколько URL (зеркала одного API), перед каждым подключением
+    все они замеряются (время подключения и RTT ping/pong) и выбирается эндпоинт
+    с наименьшим RTT. При `probe_interval` > 0 замеры повторяются в фоне; если
+    другой эндпоинт быстрее текущего соединения не меньше чем на `migration_min_gain_ms`,
+    клиент переезжает на него по схеме make-before-break: открывает и подписывает
+    новое соединение, передаёт потоки через `StreamHandover` и только потом
+    закрывает старое. Переезд требует `dedup_key`; без него эндпоинт выбирается
+    только при подключении.
+
     Attributes:
-        url (str): URL для WebSocket подключения
+        url (str): Текущий URL для WebSocket подключения
+        urls (list[str]): Эндпоинты-кандидаты
         subscribe_payload (dict): Данные для отправки при подписке
         name (str): Имя клиента для логирования
         message_handler (callable): Функция обработки входящих сообщений
         ws (websockets.WebSocketClientProtocol): Объект WebSocket соединения
+        decoder_name (str): Имя используемого JSON-декодера
+        frames_received (int): Число полученных кадров
+        frames_filtered (int): Число кадров, отброшенных префильтром до декодирования
+        reconnects (int): Число переподключений после ошибок
+        silent_reconnects (int): Число принудительных переподключений молчащего сокета
+        wins (int): Кадров, доставленных этим соединением первым (в режиме гонки соединений)
+        duplicates (int): Кадров, уже доставленных другим соединением раньше
+        recorder (FrameRecorder | None): Запись сырых кадров; создаётся при первом подключении,
+            если задан RECORD_FRAMES_DIR
+        endpoint_rtt (dict[str, float]): Последний замер RTT по эндпоинтам, мс
+        endpoint_connect (dict[str, float]): Последнее время пробного подключения по эндпоинтам, мс
+        migrations (int): Число переездов на более быстрый эндпоинт
     """
 
-    def __init__(self, url: str, subscribe_payload: dict, name: str, message_handler):
+    def __init__(self, url: str | list[str], subscribe_payload: dict, name: str, message_handler,
+                 frame_markers: tuple[bytes, ...] = None, silence_timeout: float = 0,
+                 fast_reconnect_delay: float = 0.5, dedup_key: Optional[Callable[[dict], Optional[tuple]]] = None,
+                 probe_interval: float = 0, migration_min_gain_ms: float = 5.0, migration_overlap: float = 2.0,
+                 journal_metadata: Optional[dict] = None):
         """
         Инициализация WebSocket клиента.
 
         Args:
-            url (str): URL для подключения к WebSocket серверу
+            url (str | list[str]): URL или список эндпоинтов-кандидатов
             subscribe_payload (dict): Данные для отправки при подписке
             name (str): Имя клиента для идентификации в логах
             message_handler (callable): Функция обработки входящих сообщений
+            frame_markers (tuple[bytes, ...], optional): Байтовые маркеры интересующих топиков/каналов.
+                Кадры без них отбрасываются до декодирования (понги, подтверждения подписки и т.п.)
+            silence_timeout (float): Соединение без кадров дольше стольких секунд
+                закрывается и переподключается (0 — выключено)
+            fast_reconnect_delay (float): Верхняя граница случайной задержки переподключения
+                после молчания, секунды
+            dedup_key (Callable, optional): (поток, время, отпечаток) кадра для передачи потоков при переезде
+            probe_interval (float): Период фоновых замеров эндпоинтов, секунды (0 — только при подключении)
+            migration_min_gain_ms (float): Минимальный выигрыш RTT для переезда, мс
+            migration_overlap (float): Максимальная длительность перекрытия соединений при переезде, секунды
+            journal_metadata (dict, optional): Метаданные журнала кадров (режим канала и т.п.)
         """
-        self.url = url
+        self.urls = [url] if isinstance(url, str) else list(url)
+        self.url = self.urls[0]
         self.subscribe_payload = subscribe_payload
         self.name = name
         self.message_handler = message_handler
         self.ws = None
-        
+        self.decoder_name, self.decode = get_decoder()
+        self.prefilter = make_prefilter(frame_markers) if frame_markers else None
+        self.frames_received = 0
+        self.frames_filtered = 0
+        self.reconnects = 0
+        self.silent_reconnects = 0
+        self.wins = 0
+        self.duplicates = 0
+        self.recorder = None
+        self.journal_metadata = journal_metadata
+        self.silence_timeout = silence_timeout
+        self.fast_reconnect_delay = fast_reconnect_delay
+        self.dedup_key = dedup_key
+        self.probe_interval = probe_interval
+        self.migration_min_gain_ms = migration_min_gain_ms
+        self.migration_overlap = migration_overlap
+        self.endpoint_rtt: dict[str, float] = {}
+        self.endpoint_connect: dict[str, float] = {}
+        self.migrations = 0
+        # Обработчик задачи приёма текущего соединения; при переезде подменяется на время передачи потоков
+        self._route = [message_handler]
+
         self._initial_reconnect_delay = 5
         self._max_reconnect_delay = 60
         self._current_reconnect_delay = self._initial_reconnect_delay
+        self._silenced = False
 
     def is_connected(self) -> bool:
         """Проверяет, активно ли WebSocket соединение."""
@@ -47,25 +243,206 @@ class BaseWSClient:
         """
         Устанавливает и поддерживает WebSocket соединение.
         
-        Автоматически переподключается при обрыве связи с экспоненциальной задержкой.
-        Настраивает ping/pong для проверки активности соединения.
+        Автоматически переподключается при обрыве связи с экспоненциальной задержкой
+        со случайным разбросом. Настраивает ping/pong для проверки активности соединения;
+        если задан `silence_timeout`, сторож закрывает соединение, которое открыто,
+        но перестало присылать кадры, и оно переподключается почти сразу.
+        При нескольких эндпоинтах перед подключением выбирается самый быстрый.
         """
+        if self.recorder is None:
+            self.recorder = create_recorder(self.name, self.journal_metadata)
         while True:
             try:
-                async with websockets.connect(self.url, ping_interval=20, ping_timeout=10) as ws:
-                    self.ws = ws
-                    # Сбрасываем задержку после успешного подключения
-                    self._current_reconnect_delay = self._initial_reconnect_delay
-                    logging.info(f"[{self.name}] Подключено к {self.url}")
-                    await self.subscribe()
-                    await self.listen()
+                if len(self.urls) > 1:
+                    await self._select_endpoint()
+                ws = await websockets.connect(self.url, ping_interval=20, ping_timeout=10)
+                listener = None
+                # После переезда сессия продолжается на новом соединении
+                while ws is not None:
+                    ws, listener = await self._session(ws, listener)
             except Exception as e:
-                logging.warning(f"[{self.name}] Ошибка подключения: {e}")
                 self.ws = None # Убедимся, что состояние консистентно
-                logging.info(f"[{self.name}] Повторное подключение через {self._current_reconnect_delay} секунд...")
-                await asyncio.sleep(self._current_reconnect_delay)
-                # Увеличиваем задержку для следующей попытки
-                self._current_reconnect_delay = min(self._current_reconnect_delay * 2, self._max_reconnect_delay)
+                self.reconnects += 1
+                if self._silenced:
+                    # Молчащий сокет переподключается сразу, с разбросом, чтобы реплики не шли в ногу
+                    self._silenced = False
+                    delay = random.uniform(0, self.fast_reconnect_delay)
+                else:
+                    logging.warning(f"[{self.name}] Ошибка подключения: {e}")
+                    delay = self._current_reconnect_delay * random.uniform(0.5, 1.0)
+                    # Увеличиваем задержку для следующей попытки
+                    self._current_reconnect_delay = min(self._current_reconnect_delay * 2, self._max_reconnect_delay)
+                logging.info(f"[{self.name}] Повторное подключение через {delay:.2f} секунд...")
+                await asyncio.sleep(delay)
+
+    def can_migrate(self) -> bool:
+        """Фоновые замеры и переезд включены: несколько эндпоинтов, период замеров и ключ сверки кадров."""
+        return len(self.urls) > 1 and self.probe_interval > 0 and self.dedup_key is not None
+
+    async def _session(self, ws, listener: Optional[asyncio.Task] = None):
+        """
+        Обслуживает соединение до его закрытия или переезда на другой эндпоинт.
+
+        Args:
+            ws: Открытое соединение
+            listener (asyncio.Task, optional): Задача приёма, если соединение уже подписано (после переезда)
+
+        Returns:
+            tuple: (новое соединение, его задача приёма) после переезда или (None, None),
+                если соединение штатно закрылось.
+        """
+        self.ws = ws
+        # Сбрасываем задержку после успешного подключения
+        self._current_reconnect_delay = self._initial_reconnect_delay
+        watchdog = asyncio.create_task(self._watch_silence(ws)) if self.silence_timeout > 0 else None
+        migrated = None
+        try:
+            if listener is None:
+                logging.info(f"[{self.name}] Подключено к {self.url}")
+                await self.subscribe()
+                self._route = [self.message_handler]
+                listener = asyncio.create_task(self.listen(ws, self._route))
+            while self.can_migrate():
+                prober = asyncio.create_task(self._probe_loop(ws))
+                try:
+                    await asyncio.wait({listener, prober}, return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    prober.cancel()
+                if listener.done():
+                    break
+                migrated = await self._migrate(ws, listener, prober.result())
+                if migrated is not None:
+                    return migrated
+            await listener
+            return None, None
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+            if migrated is None:
+                if listener is not None:
+                    listener.cancel()
+                await ws.close()
+
+    def _record_probes(self, urls: list[str], results: list):
+        for url, result in zip(urls, results):
+            if result is None:
+                self.endpoint_rtt.pop(url, None)
+                self.endpoint_connect.pop(url, None)
+            else:
+                self.endpoint_connect[url], self.endpoint_rtt[url] = result
+
+    def _fastest(self, urls: list[str]) -> Optional[str]:
+        reachable = [url for url in urls if url in self.endpoint_rtt]
+        return min(reachable, key=self.endpoint_rtt.__getitem__) if reachable else None
+
+    async def _select_endpoint(self):
+        """
+        Замеряет все эндпоинты и выбирает с наименьшим RTT; если недоступны все, остаётся текущий.
+        """
+        results = await asyncio.gather(*(probe_endpoint(url) for url in self.urls))
+        self._record_probes(self.urls, results)
+        best = self._fastest(self.urls)
+        if best is not None:
+            self.url = best
+        summary = ", ".join(
+            f"{url}: подключение {self.endpoint_connect[url]:.1f} мс, RTT {self.endpoint_rtt[url]:.1f} мс"
+            if url in self.endpoint_rtt else f"{url}: недоступен"
+            for url in self.urls
+        )
+        logging.info(f"[{self.name}] Замер эндпоинтов: {summary}; выбран {self.url}")
+
+    async def _probe_loop(self, ws) -> str:
+        """
+        Периодически сравнивает RTT текущего соединения с остальными эндпоинтами.
+
+        Returns:
+            str: Эндпоинт, который быстрее текущего не меньше чем на `migration_min_gain_ms`.
+        """
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            try:
+                # RTT живого соединения меряется по нему же: pong идёт в одной очереди с данными
+                current = await asyncio.wait_for(measure_rtt(ws), PROBE_TIMEOUT)
+            except (asyncio.TimeoutError, websockets.WebSocketException):
+                # Соединением займутся задача приёма и сторож молчания
+                continue
+            self.endpoint_rtt[self.url] = current
+            candidates = [url for url in self.urls if url != self.url]
+            self._record_probes(candidates, await asyncio.gather(*(probe_endpoint(url) for url in candidates)))
+            best = self._fastest(candidates)
+            if best is not None and current - self.endpoint_rtt[best] >= self.migration_min_gain_ms:
+                logging.info(f"[{self.name}] {best} быстрее текущего {self.url}: "
+                             f"RTT {self.endpoint_rtt[best]:.1f} мс против {current:.1f} мс, переезд")
+                return best
+
+    async def _migrate(self, ws, listener: asyncio.Task, url: str):
+        """
+        Переезд make-before-break: новое соединение подписывается и принимает кадры
+        параллельно со старым, потоки передаются через `StreamHandover`, затем старое закрывается.
+
+        Returns:
+            tuple | None: (новое соединение, его задача приёма) или None, если переезд не удался
+                и работа продолжается на старом соединении.
+        """
+        try:
+            new_ws = await asyncio.wait_for(websockets.connect(url, ping_interval=20, ping_timeout=10), PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+            logging.warning(f"[{self.name}] Не удалось подключиться к {url} для переезда: {e!r}")
+            return None
+        handler = self.message_handler
+        handover = StreamHandover(handler, self.dedup_key)
+        old_route, new_route = self._route, [handover.from_new]
+        old_route[0] = handover.from_old
+        old_url = self.url
+        # Операции подписки во время перекрытия уходят уже в новое соединение
+        self.ws, self.url = new_ws, url
+        new_listener = asyncio.create_task(self.listen(new_ws, new_route))
+        try:
+            await self.subscribe()
+            deadline = time.monotonic() + self.migration_overlap
+            while time.monotonic() < deadline and not handover.complete():
+                if new_listener.done():
+                    raise ConnectionError("новое соединение закрылось во время перекрытия")
+                await asyncio.sleep(0.01)
+        except Exception as e:
+            logging.warning(f"[{self.name}] Переезд на {url} прерван: {e!r}, остаёмся на {old_url}")
+            old_route[0] = handler
+            new_listener.cancel()
+            new_ws.transport.abort()
+            self.ws, self.url = ws, old_url
+            return None
+        except BaseException:
+            new_listener.cancel()
+            new_ws.transport.abort()
+            raise
+
+        await ws.close()
+        await asyncio.gather(listener, return_exceptions=True)
+        await handover.finish()
+        new_route[0] = handler
+        self._route = new_route
+        self.migrations += 1
+        logging.info(f"[{self.name}] Переезд {old_url} -> {url} завершён, потоков передано: {handover.transferred}")
+        return new_ws, new_listener
+
+    async def _watch_silence(self, ws):
+        """
+        Сторож молчания: сравнивает счётчик кадров, не трогая горячий путь приёма.
+        """
+        frames = self.frames_received
+        last_change = time.monotonic()
+        while True:
+            await asyncio.sleep(self.silence_timeout / 4)
+            now = time.monotonic()
+            if self.frames_received != frames:
+                frames = self.frames_received
+                last_change = now
+            elif now - last_change >= self.silence_timeout:
+                logging.warning(f"[{self.name}] Нет кадров {self.silence_timeout:g} с, принудительное переподключение")
+                self.silent_reconnects += 1
+                self._silenced = True
+                ws.transport.abort()
+                return
 
 
     async def subscribe(self):
@@ -75,21 +452,59 @@ class BaseWSClient:
         Сериализует payload в JSON и отправляет через WebSocket соединение.
         Логирует отправленные данные.
         """
+        if not self.subscribe_payload.get("args"):
+            # Все символы шарда убраны — подписываться не на что
+            return
         msg = json.dumps(self.subscribe_payload)
         await self.ws.send(msg)
         logging.info(f"[{self.name}] Подписка с payload: {msg}")
 
-    async def listen(self):
+    async def send_json(self, payload: dict):
+        """
+        Отправляет произвольное сообщение (например, переподписку) в активное соединение.
+
+        Args:
+            payload (dict): Данные для сериализации в JSON.
+        """
+        if not self.is_connected():
+            return
+        await self.ws.send(json.dumps(payload))
+
+    async def listen(self, ws=None, route: Optional[list] = None):
         """
         Прослушивает входящие сообщения.
         
-        Асинхронно читает сообщения из WebSocket соединения,
-        десериализует их из JSON и передает в handler.
-        Обрабатывает ошибки при получении и обработке сообщений.
+        Асинхронно читает сырые кадры из WebSocket соединения, отбрасывает
+        неинтересные префильтром, десериализует остальные выбранным декодером
+        и передает в handler. Обрабатывает ошибки при обработке сообщений.
+
+        Args:
+            ws: Соединение (по умолчанию текущее)
+            route (list, optional): Одноэлементный список с обработчиком; читается на каждом
+                кадре, чтобы переезд мог подменить обработчик на время передачи потоков
         """
-        async for message in self.ws:
+        ws = ws if ws is not None else self.ws
+        route = route if route is not None else [self.message_handler]
+        decode = self.decode
+        recorder = self.recorder
+        clock = frame_clock
+        while True:
+            try:
+                message = await ws.recv(decode=False)
+            except websockets.ConnectionClosedOK:
+                return
+            # Время приёма для метрик задержек по стадиям
+            clock.received_at = time.time()
+            self.frames_received += 1
+            if recorder is not None:
+                recorder.record(message)
+            # Префильтр читается на каждом кадре: пул может сменить канал на живом соединении
+            prefilter = self.prefilter
+            if prefilter is not None and not prefilter(message):
+                self.frames_filtered += 1
+                continue
             try:
-                data = json.loads(message)
-                await self.message_handler(data)
+                data = decode(message)
+                await route[0](data)
             except Exception as e:
                 logging.error(f"[{self.name}] Ошибка обработки сообщения: {e}")
@@ -0,0 +1,185 @@
+"""
+Лучшие биржи для покупки и продажи по каждой паре за O(log N) на тик.
+
+Для каждой пары хранятся две индексированные кучи по биржам: bid с учётом
+комиссии продажи (максимум сверху) и ask с учётом комиссии покупки (минимум
+сверху, хранится со знаком минус). У каждой биржи свой слот, поэтому тик
+меняет ключ на месте и просеивает его за O(log N), а лучший спред читается
+за O(1) с вершин куч. Если лучшие bid и ask на одной бирже, берётся второй
+элемент одной из куч — он всегда среди детей корня.
+"""
+from typing import Optional
+
+
+class IndexedMaxHeap:
+    """
+    Двоичная max-куча с фиксированными слотами и позицией каждого слота.
+    """
+    __slots__ = ("keys", "slots", "position")
+
+    def __init__(self, capacity: int):
+        self.keys: list[float] = []
+        self.slots: list[int] = []
+        # Позиция слота в куче, -1 — слота в куче нет
+        self.position = [-1] * capacity
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def update(self, slot: int, key: float):
+        """Вставляет слот или меняет его ключ за O(log N)."""
+        position = self.position[slot]
+        if position < 0:
+            self.keys.append(key)
+            self.slots.append(slot)
+            self.position[slot] = len(self.keys) - 1
+            self._sift_up(len(self.keys) - 1)
+            return
+        old = self.keys[position]
+        self.keys[position] = key
+        if key > old:
+            self._sift_up(position)
+        elif key < old:
+            self._sift_down(position)
+
+    def remove(self, slot: int):
+        """Убирает слот из кучи за O(log N)."""
+        position = self.position[slot]
+        if position < 0:
+            return
+        last = len(self.keys) - 1
+        self._swap(position, last)
+        self.keys.pop()
+        self.slots.pop()
+        self.position[slot] = -1
+        if position < last:
+            self._sift_up(position)
+            self._sift_down(position)
+
+    def top(self) -> tuple[float, int]:
+        """(ключ, слот) вершины кучи."""
+        return self.keys[0], self.slots[0]
+
+    def second(self) -> Optional[tuple[float, int]]:
+        """(ключ, слот) второго по величине элемента или None."""
+        size = len(self.keys)
+        if size < 2:
+            return None
+        index = 2 if size > 2 and self.keys[2] > self.keys[1] else 1
+        return self.keys[index], self.slots[index]
+
+    def _swap(self, i: int, j: int):
+        keys, slots = self.keys, self.slots
+        keys[i], keys[j] = keys[j], keys[i]
+        slots[i], slots[j] = slots[j], slots[i]
+        self.position[slots[i]] = i
+        self.position[slots[j]] = j
+
+    def _sift_up(self, index: int):
+        keys = self.keys
+        while index > 0:
+            parent = (index - 1) >> 1
+            if keys[parent] >= keys[index]:
+                return
+            self._swap(index, parent)
+            index = parent
+
+    def _sift_down(self, index: int):
+        keys = self.keys
+        size = len(keys)
+        while True:
+            left = 2 * index + 1
+            if left >= size:
+                return
+            child = left + 1 if left + 1 < size and keys[left + 1] > keys[left] else left
+            if keys[index] >= keys[child]:
+                return
+            self._swap(index, child)
+            index = child
+
+
+class BestVenues:
+    """
+    Лучшие с учётом комиссий bid/ask по биржам для каждой пары `PriceState`.
+
+    Множители комиссий берутся у `ArbitrageEvaluator` один раз при создании.
+    """
+
+    def __init__(self, symbol_count: int, exchanges: tuple[str, ...], buy_multipliers: dict,
+                 sell_multipliers: dict):
+        """
+        Args:
+            symbol_count (int): Число пар
+            exchanges (tuple[str, ...]): Биржи в порядке exchange_id
+            buy_multipliers (dict): Биржа -> 1 + комиссия покупки
+            sell_multipliers (dict): Биржа -> 1 - комиссия продажи
+        """
+        self.exchanges = tuple(exchanges)
+        self.buy_multipliers = [buy_multipliers.get(exchange, 1.0) for exchange in self.exchanges]
+        self.sell_multipliers = [sell_multipliers.get(exchange, 1.0) for exchange in self.exchanges]
+        self.bids = [IndexedMaxHeap(len(self.exchanges)) for _ in range(symbol_count)]
+        # ask хранится со знаком минус, чтобы min-куча была той же max-кучей
+        self.asks = [IndexedMaxHeap(len(self.exchanges)) for _ in range(symbol_count)]
+
+    @classmethod
+    def for_price_state(cls, price_state, evaluator) -> "BestVenues":
+        """
+        Создаёт структуру под размеры `price_state` и подключает её к обновлениям.
+        """
+        venues = cls(len(price_state.symbols), price_state.exchanges, evaluator.buy_multipliers,
+                     evaluator.sell_multipliers)
+        price_state.venues = venues
+        return venues
+
+    def resize(self, symbol_count: int):
+        """Добавляет кучи под новые пары `PriceState`."""
+        while len(self.bids) < symbol_count:
+            self.bids.append(IndexedMaxHeap(len(self.exchanges)))
+            self.asks.append(IndexedMaxHeap(len(self.exchanges)))
+
+    def clear_symbol(self, symbol_id: int):
+        """Очищает кучи убранной пары."""
+        self.bids[symbol_id] = IndexedMaxHeap(len(self.exchanges))
+        self.asks[symbol_id] = IndexedMaxHeap(len(self.exchanges))
+
+    def update(self, symbol_id: int, exchange_id: int, bid: float, ask: float):
+        """
+        Обновляет слоты биржи после тика; NaN убирает сторону биржи из кучи.
+        """
+        if bid == bid:
+            self.bids[symbol_id].update(exchange_id, bid * self.sell_multipliers[exchange_id])
+        else:
+            self.bids[symbol_id].remove(exchange_id)
+        if ask == ask:
+            self.asks[symbol_id].update(exchange_id, -ask * self.buy_multipliers[exchange_id])
+        else:
+            self.asks[symbol_id].remove(exchange_id)
+
+    def best(self, symbol_id: int) -> Optional[tuple[float, int, int]]:
+        """
+        Лучшая межбиржевая связка пары за O(1).
+
+        Returns:
+            tuple[float, int, int] | None: (отношение скорректированных bid/ask,
+                биржа покупки, биржа продажи) или None, если двух бирж с ценами нет.
+        """
+        bids = self.bids[symbol_id]
+        asks = self.asks[symbol_id]
+        if not bids or not asks:
+            return None
+        bid, sell_id = bids.top()
+        ask, buy_id = asks.top()
+        if sell_id != buy_id:
+            return bid / -ask, buy_id, sell_id
+
+        # Лучшие цены на одной бирже: сравниваем замену одной из сторон вторым элементом
+        best = None
+        second_bid = bids.second()
+        if second_bid is not None:
+            best = (second_bid[0] / -ask, buy_id, second_bid[1])
+        second_ask = asks.second()
+        if second_ask is not None:
+            candidate = bid / -second_ask[0]
+            if best is None or candidate > best[0]:
+                best = (candidate, second_ask[1], sell_id)
+        return best
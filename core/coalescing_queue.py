@@ -0,0 +1,72 @@
+import asyncio
+from typing import Hashable
+
+
+class CoalescingQueue:
+    """
+    Очередь "последний побеждает" между приёмом тиков и их оценкой.
+
+    Хранит не сами котировки, а множество "грязных" ключей (пар): актуальная
+    цена уже лежит в `PriceState`, поэтому повторная отметка ключа до того, как
+    его забрал обработчик, просто схлопывается. Обработчик всегда видит
+    свежайшее состояние, а не накопившийся хвост тиков.
+
+    Attributes:
+        enqueued (int): Число отметок, поставивших новый ключ в очередь
+        coalesced (int): Число отметок, схлопнутых с уже ожидающим ключом
+        shed (int): Число тиков, отброшенных как слишком старые
+    """
+
+    def __init__(self):
+        # dict вместо set сохраняет порядок поступления ключей
+        self._dirty: dict[Hashable, None] = {}
+        self._event = asyncio.Event()
+        self.enqueued = 0
+        self.coalesced = 0
+        self.shed = 0
+
+    def __len__(self) -> int:
+        return len(self._dirty)
+
+    def put(self, key: Hashable):
+        """
+        Помечает ключ как требующий оценки.
+        """
+        if key in self._dirty:
+            self.coalesced += 1
+            return
+        self._dirty[key] = None
+        self.enqueued += 1
+        self._event.set()
+
+    def record_shed(self):
+        """
+        Учитывает тик, отброшенный до попадания в очередь.
+        """
+        self.shed += 1
+
+    async def drain(self) -> list[Hashable]:
+        """
+        Ожидает хотя бы один ключ и забирает все накопившиеся.
+
+        Returns:
+            list[Hashable]: Ключи в порядке первой отметки.
+        """
+        while not self._dirty:
+            self._event.clear()
+            await self._event.wait()
+        keys = list(self._dirty)
+        self._dirty.clear()
+        self._event.clear()
+        return keys
+
+    def stats(self) -> dict:
+        """
+        Возвращает счётчики очереди.
+        """
+        return {
+            "pending": len(self._dirty),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "shed": self.shed,
+        }
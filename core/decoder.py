@@ -0,0 +1,84 @@
+import json
+import logging
+import os
+from typing import Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Предпочитаемый декодер: auto | orjson | msgspec | json
+WS_DECODER = os.getenv("WS_DECODER", "auto").lower()
+
+# Сколько первых байт кадра просматривает префильтр
+PREFILTER_WINDOW = 64
+
+
+def _orjson_decoder() -> Callable:
+    import orjson
+    return orjson.loads
+
+
+def _msgspec_decoder() -> Callable:
+    import msgspec
+    return msgspec.json.Decoder().decode
+
+
+def _json_decoder() -> Callable:
+    return json.loads
+
+
+_DECODERS = {
+    "orjson": _orjson_decoder,
+    "msgspec": _msgspec_decoder,
+    "json": _json_decoder,
+}
+
+
+def get_decoder(name: str = None) -> tuple[str, Callable]:
+    """
+    Возвращает самый быстрый доступный JSON-декодер.
+
+    Args:
+        name (str, optional): auto | orjson | msgspec | json. По умолчанию — `WS_DECODER`.
+            В режиме auto перебираются orjson, msgspec и stdlib json, пока один не импортируется.
+
+    Returns:
+        tuple[str, Callable]: Имя выбранного декодера и функция bytes/str -> объект.
+    """
+    name = (name or WS_DECODER).lower()
+    candidates = ["orjson", "msgspec", "json"] if name == "auto" else [name, "json"]
+    for candidate in candidates:
+        factory = _DECODERS.get(candidate)
+        if factory is None:
+            continue
+        try:
+            return candidate, factory()
+        except ImportError:
+            logging.debug(f"[Decoder] {candidate} не установлен")
+    return "json", json.loads
+
+
+def make_prefilter(markers: tuple[bytes, ...]) -> Callable:
+    """
+    Строит дешёвую байтовую проверку кадра до декодирования.
+
+    Кадр проходит, если один из маркеров встречается в первых `PREFILTER_WINDOW`
+    байтах. Ключи топика/канала у бирж идут в начале сообщения, поэтому поиск
+    не просматривает тело с данными.
+
+    Args:
+        markers (tuple[bytes, ...]): Байтовые подстроки, например b'"topic":"tickers.'.
+
+    Returns:
+        Callable: Функция bytes -> bool.
+    """
+    if len(markers) == 1:
+        marker = markers[0]
+        return lambda frame: frame.find(marker, 0, PREFILTER_WINDOW) != -1
+    if len(markers) == 2:
+        # Данные и отказ в подписке (режим bbo) — без генератора на каждом кадре
+        first, second = markers
+        return lambda frame: (frame.find(first, 0, PREFILTER_WINDOW) != -1
+                              or frame.find(second, 0, PREFILTER_WINDOW) != -1)
+    return lambda frame: any(frame.find(marker, 0, PREFILTER_WINDOW) != -1 for marker in markers)
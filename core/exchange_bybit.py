@@ -1,59 +1,199 @@
-from core.base_ws_client import BaseWSClient
+from core.order_book import OrderBook
+from core.ws_pool import BBO, TICKERS, WS_FEED_REDUNDANCY, WSConnectionPool
 import os
 from dotenv import load_dotenv
 import logging
+from typing import Optional
 
 load_dotenv()
 
 # URL для подключения к WebSocket API биржи Bybit
+# Несколько эндпоинтов — через запятую: выбирается самый быстрый по RTT
 BYBIT_URL = os.getenv("BYBIT_URL", "wss://stream.bybit.com/v5/public/linear")
+BYBIT_URLS = [url.strip() for url in BYBIT_URL.split(",") if url.strip()]
+# Максимум символов на одно соединение (0 — все символы на одном соединении)
+BYBIT_SHARD_SIZE = int(os.getenv("BYBIT_SHARD_SIZE", 0))
+# Канал котировок: tickers или bbo (orderbook.1 — лучший уровень стакана без троттлинга тикеров)
+BYBIT_FEED_MODE = os.getenv("BYBIT_FEED_MODE", "tickers").lower()
+
+# Опустевшая сторона стакана уходит в состояние цен как NaN
+NAN = float("nan")
 
 class BybitWS:
     """
     Клиент для работы с WebSocket API биржи Bybit.
     Получает реал-тайм котировки для нескольких криптовалютных пар.
+
+    В режиме `bbo` подписывается на `orderbook.1.*`: первый пуш — снапшот
+    лучшего уровня, дальше дельты, где объём "0" удаляет уровень, а новый
+    уровень приходит в той же дельте. Снапшот приходит и повторно (после
+    рестарта сервиса биржи или при отсутствии изменений) и заменяет уровень
+    целиком. Если биржа отклоняет сам канал, клиент переходит на `tickers`
+    на всех соединениях без переподключения. Отказы по отдельным парам
+    (неверный символ, повторная подписка) только логируются: после первого
+    пуша `orderbook.1` канал считается рабочим.
     """
-    
-    def __init__(self, symbols: list[str], price_callback):
+
+    # Кадры без этого маркера (понги, подтверждения подписки) не декодируются
+    FRAME_MARKERS = (b'"topic":"tickers.',)
+    # В режиме bbo пропускаются и отказы в подписке — по ним включается запасной канал
+    BBO_FRAME_MARKERS = (b'"topic":"orderbook.1.', b'"success":false')
+
+    def __init__(self, symbols: list[str], price_callback, price_state=None, shard_size: int = BYBIT_SHARD_SIZE,
+                 redundancy: int = WS_FEED_REDUNDANCY, mode: str = BYBIT_FEED_MODE):
         """
         Инициализация WebSocket клиента Bybit.
         
         Args:
             symbols (list[str]): Список торговых пар для подписки (например, ["BTC-USDT", "ETH-USDT"])
             price_callback (callable): Функция обратного вызова для обработки цен.
-                Принимает параметры: symbol(str), exchange (str), bid (float), ask (float), timestamp (float)
+                Принимает параметры: symbol(str), exchange (str), bid (float), ask (float), timestamp (float),
+                symbol_id (int | None), exchange_id (int | None)
+            price_state (PriceState, optional): Состояние цен, из которого один раз при подписке
+                берутся целочисленные индексы пар и биржи.
+            shard_size (int): Максимум символов на одно соединение (0 — без шардирования)
+            redundancy (int): Число гоняющихся соединений на шард
+            mode (str): Канал котировок: "tickers" или "bbo"
         """
-        channels = [f"tickers.{symbol.replace('-', '')}" for symbol in symbols]
-        self.client = BaseWSClient(
-            url=BYBIT_URL,
-            subscribe_payload={
-                "op": "subscribe",
-                "args": channels
-            },
+        if mode not in (TICKERS, BBO):
+            logging.warning(f"[BybitWS] Неизвестный режим канала {mode!r}, используется {TICKERS}")
+            mode = TICKERS
+        self.mode = mode
+        self.topic_prefix = "tickers." if mode == TICKERS else "orderbook.1."
+        # Биржа прислала данные orderbook.1 — канал рабочий
+        self.bbo_confirmed = False
+        self.handle_data = self.handle_ticker if mode == TICKERS else self.handle_bbo
+        self.pool = WSConnectionPool(
+            url=BYBIT_URLS,
+            symbols=symbols,
+            build_payload=self.build_payload,
             name="Bybit",
-            message_handler=self.handle_message
+            message_handler=self.handle_message,
+            shard_size=shard_size,
+            frame_markers=self.FRAME_MARKERS if mode == TICKERS else self.BBO_FRAME_MARKERS,
+            redundancy=redundancy,
+            dedup_key=self.dedup_key,
         )
+        # Режим канала пишется в журнал кадров, чтобы воспроизведение собрало адаптер так же
+        self.pool.journal_metadata["feed_mode"] = mode
         self.price_callback = price_callback
         # Для обратного маппинга из топика в символ
-        self.topic_to_symbol = {channel: symbol for channel, symbol in zip(channels, symbols)}
+        self.topic_to_symbol = {self.topic(symbol): symbol for symbol in symbols}
+        # Лучший уровень по парам в режиме bbo: [bid, ask], None — сторона пуста
+        self.bbo: dict[str, list] = {}
+        # Индексы в PriceState резолвятся один раз, а не на каждом тике
+        self.price_state = price_state
+        self.symbol_ids = {symbol: price_state.symbol_id(symbol) for symbol in symbols} if price_state else {}
+        self.exchange_id = price_state.exchange_id("bybit") if price_state else None
+
+    def topic(self, symbol: str) -> str:
+        return self.topic_prefix + symbol.replace("-", "")
+
+    def build_payload(self, symbols: list[str]) -> dict:
+        return {"op": "subscribe", "args": [self.topic(symbol) for symbol in symbols]}
+
+    async def add_symbols(self, symbols: list[str]):
+        """
+        Подписывается на котировки новых пар на живых соединениях.
+
+        Пары должны быть уже добавлены в `price_state`, чтобы получить их индексы.
+        """
+        for symbol in symbols:
+            self.topic_to_symbol[self.topic(symbol)] = symbol
+            if self.price_state is not None:
+                self.symbol_ids[symbol] = self.price_state.symbol_id(symbol)
+        await self.pool.add_symbols(symbols)
+
+    async def remove_symbols(self, symbols: list[str]):
+        """
+        Отписывается от котировок пар; кадры, пришедшие после этого, отбрасываются.
+        """
+        for symbol in symbols:
+            self.topic_to_symbol.pop(self.topic(symbol), None)
+            self.symbol_ids.pop(symbol, None)
+            self.bbo.pop(symbol, None)
+        await self.pool.remove_symbols(symbols)
+
+    async def fall_back_to_tickers(self, reason: str):
+        """
+        Переводит все соединения с orderbook.1 на tickers без переподключения.
+        """
+        if self.mode == TICKERS:
+            return
+        logging.warning(f"[BybitWS] Подписка на orderbook.1 отклонена ({reason}), переход на tickers")
+        old_prefix = self.topic_prefix
+        self.mode = TICKERS
+        self.pool.journal_metadata["feed_mode"] = TICKERS
+        self.topic_prefix = "tickers."
+        self.handle_data = self.handle_ticker
+        self.topic_to_symbol = {self.topic(symbol): symbol for symbol in self.topic_to_symbol.values()}
+        self.bbo.clear()
+        await self.pool.resubscribe(self.FRAME_MARKERS, lambda shard: {
+            "op": "unsubscribe", "args": [old_prefix + symbol.replace("-", "") for symbol in shard]
+        })
+
+    @staticmethod
+    def dedup_key(msg):
+        """
+        Ключ сверки копий кадра между соединениями: (топик, ts, cross sequence или update id стакана).
+        """
+        topic = msg.get("topic")
+        if topic is None:
+            return None
+        sequence = msg.get("cs")
+        if sequence is None:
+            sequence = msg["data"].get("u")
+        return topic, msg.get("ts") or 0, sequence
 
     async def handle_message(self, msg):
         """
         Обработка входящих WebSocket сообщений.
         """
-        if "topic" not in msg or not msg.get("data"):
+        topic = msg.get("topic")
+        if topic is None:
+            # В режиме bbo префильтр пропускает отказы в подписке
+            if msg.get("success") is False:
+                await self.handle_rejection(msg)
+            return
+        if not msg.get("data"):
             return
 
-        topic = msg["topic"]
         symbol = self.topic_to_symbol.get(topic)
         if not symbol:
             return
+        await self.handle_data(symbol, msg)
+
+    async def handle_rejection(self, msg: dict):
+        """
+        Отказ в режиме bbo: переход на tickers, только если отклонён сам канал orderbook.1.
 
+        Отказ относится к каналу, если это подписка, в тексте упомянут топик
+        orderbook.1, а канал ещё ни разу не прислал данных. Отказы в отписке,
+        по другим топикам и после подтверждения канала — ошибки отдельных пар.
+        """
+        if self.mode == TICKERS:
+            return
+        ret_msg = msg.get("ret_msg", "")
+        if msg.get("op") == "subscribe" and self.topic_prefix in ret_msg and not self.bbo_confirmed:
+            await self.fall_back_to_tickers(ret_msg)
+        else:
+            logging.warning(f"[BybitWS] Отказ {msg.get('op')}: {ret_msg}", extra={"log_key": ("bybit-reject", ret_msg)})
+
+    async def handle_ticker(self, symbol: str, msg: dict):
+        """
+        Разбор пуша `tickers`: в дельте приходят только изменившиеся поля.
+        """
         data = msg["data"]
         try:
             ts = msg.get("ts")
             timestamp = float(ts) / 1000 if ts is not None else None
-            update = {"symbol": symbol, "exchange": "bybit", "timestamp": timestamp}
+            update = {
+                "symbol": symbol,
+                "exchange": "bybit",
+                "timestamp": timestamp,
+                "symbol_id": self.symbol_ids.get(symbol),
+                "exchange_id": self.exchange_id,
+            }
             
             if "ask1Price" in data:
                 update["ask"] = float(data["ask1Price"])
@@ -64,10 +204,178 @@ class BybitWS:
                 await self.price_callback(**update)
 
         except Exception as e:
-            logging.error(f"[BybitWS] Ошибка парсинга для {symbol}: {e}")
+            logging.error(f"[BybitWS] Ошибка парсинга для {symbol}: {e}", extra={"log_key": ("bybit-parse", symbol)})
+
+    async def handle_bbo(self, symbol: str, msg: dict):
+        """
+        Разбор пуша `orderbook.1`: снапшот заменяет лучший уровень, дельта правит его.
+
+        В дельте уровень с объёмом "0" удаляется, только если это текущий
+        лучший уровень; новый уровень с ненулевым объёмом становится лучшим.
+        Наружу уходят только изменившиеся стороны; опустевшая сторона уходит
+        как NaN, чтобы состояние цен не держало удалённый уровень.
+        """
+        self.bbo_confirmed = True
+        data = msg["data"]
+        try:
+            bids = data.get("b") or ()
+            asks = data.get("a") or ()
+            # u == 1 — снапшот после рестарта сервиса биржи
+            if msg.get("type") == "snapshot" or data.get("u") == 1:
+                bbo = self.bbo[symbol] = [float(bids[0][0]) if bids else None, float(asks[0][0]) if asks else None]
+                bid, ask = (NAN if price is None else price for price in bbo)
+            else:
+                bbo = self.bbo.get(symbol)
+                if bbo is None:
+                    # Дельта до снапшота не к чему применять
+                    return
+                bid = self._apply_level(bbo, 0, bids)
+                ask = self._apply_level(bbo, 1, asks)
+            if bid is None and ask is None:
+                return
+            ts = msg.get("ts")
+            await self.price_callback(
+                symbol=symbol,
+                exchange="bybit",
+                bid=bid,
+                ask=ask,
+                timestamp=float(ts) / 1000 if ts is not None else None,
+                symbol_id=self.symbol_ids.get(symbol),
+                exchange_id=self.exchange_id,
+            )
+        except Exception as e:
+            logging.error(f"[BybitWS] Ошибка парсинга orderbook.1 для {symbol}: {e}",
+                          extra={"log_key": ("bybit-parse", symbol)})
+
+    @staticmethod
+    def _apply_level(bbo: list, side: int, levels) -> Optional[float]:
+        """
+        Применяет уровни дельты к стороне.
+
+        Returns:
+            float | None: Новая лучшая цена, NaN, если сторона опустела, или None без изменений.
+        """
+        changed = False
+        for price, size in levels:
+            price = float(price)
+            if float(size) == 0:
+                if bbo[side] == price:
+                    bbo[side] = None
+                    changed = True
+            else:
+                bbo[side] = price
+                changed = True
+        if not changed:
+            return None
+        return NAN if bbo[side] is None else bbo[side]
+
+    async def start(self):
+        """
+        Запускает WebSocket клиент.
+        """
+        await self.pool.start()
+
+class BybitOrderBookWS:
+    """
+    Клиент стаканов Bybit (`orderbook.N`): поддерживает локальные L2 стаканы
+    по снапшотам и дельтам, при разрыве последовательности `u` переподписывается.
+    """
+
+    FRAME_MARKERS = (b'"topic":"orderbook.',)
+
+    def __init__(self, symbols: list[str], book_callback=None, depth: int = 50, shard_size: int = BYBIT_SHARD_SIZE):
+        """
+        Инициализация клиента стаканов Bybit.
+
+        Args:
+            symbols (list[str]): Список торговых пар для подписки (например, ["BTC-USDT", "ETH-USDT"])
+            book_callback (callable, optional): Асинхронная функция, вызываемая после каждого изменения стакана.
+                Принимает параметры: symbol (str), exchange (str), book (OrderBook)
+            depth (int): Глубина стакана (1, 50, 200, 500)
+            shard_size (int): Максимум символов на одно соединение (0 — без шардирования)
+        """
+        channels = [f"orderbook.{depth}.{symbol.replace('-', '')}" for symbol in symbols]
+        self.pool = WSConnectionPool(
+            url=BYBIT_URLS,
+            symbols=symbols,
+            build_payload=lambda shard: {
+                "op": "subscribe",
+                "args": [f"orderbook.{depth}.{symbol.replace('-', '')}" for symbol in shard]
+            },
+            name="BybitBook",
+            message_handler=self.handle_message,
+            shard_size=shard_size,
+            frame_markers=self.FRAME_MARKERS
+        )
+        self.book_callback = book_callback
+        self.depth = depth
+        self.topic_to_symbol = {channel: symbol for channel, symbol in zip(channels, symbols)}
+        self.books = {symbol: OrderBook(symbol, "bybit") for symbol in symbols}
+
+    async def add_symbols(self, symbols: list[str]):
+        """
+        Подписывается на стаканы новых пар на живых соединениях.
+        """
+        for symbol in symbols:
+            self.topic_to_symbol[f"orderbook.{self.depth}.{symbol.replace('-', '')}"] = symbol
+            self.books.setdefault(symbol, OrderBook(symbol, "bybit"))
+        await self.pool.add_symbols(symbols)
+
+    async def remove_symbols(self, symbols: list[str]):
+        """
+        Отписывается от стаканов пар и удаляет их локальные стаканы.
+        """
+        for symbol in symbols:
+            self.topic_to_symbol.pop(f"orderbook.{self.depth}.{symbol.replace('-', '')}", None)
+            self.books.pop(symbol, None)
+        await self.pool.remove_symbols(symbols)
+
+    async def resync(self, topic: str):
+        """
+        Сбрасывает стакан и переподписывается на топик, чтобы получить новый снапшот.
+        """
+        symbol = self.topic_to_symbol[topic]
+        self.books[symbol].reset()
+        logging.warning(f"[BybitBook] Разрыв последовательности для {symbol}, переподписка")
+        client = self.pool.client_for(symbol)
+        await client.send_json({"op": "unsubscribe", "args": [topic]})
+        await client.send_json({"op": "subscribe", "args": [topic]})
+
+    async def handle_message(self, msg):
+        """
+        Обработка снапшотов и дельт стакана.
+        """
+        topic = msg.get("topic")
+        symbol = self.topic_to_symbol.get(topic)
+        if not symbol or not msg.get("data"):
+            return
+
+        data = msg["data"]
+        book = self.books[symbol]
+        try:
+            ts = msg.get("ts")
+            timestamp = float(ts) / 1000 if ts is not None else None
+            update_id = data.get("u")
+            # u == 1 — снапшот после рестарта сервиса биржи
+            if msg.get("type") == "snapshot" or update_id == 1:
+                book.apply_snapshot(data.get("b", []), data.get("a", []), update_id, timestamp)
+            else:
+                if not book.ready:
+                    return
+                if book.sequence is not None and update_id is not None and update_id != book.sequence + 1:
+                    await self.resync(topic)
+                    return
+                book.apply_delta(data.get("b", []), data.get("a", []), update_id, timestamp)
+
+            if self.book_callback:
+                await self.book_callback(symbol=symbol, exchange="bybit", book=book)
+
+        except Exception as e:
+            logging.error(f"[BybitBook] Ошибка обработки стакана для {symbol}: {e}",
+                          extra={"log_key": ("bybit-book", symbol)})
 
     async def start(self):
         """
         Запускает WebSocket клиент.
         """
-        await self.client.connect()
\ No newline at end of file
+        await self.pool.start()
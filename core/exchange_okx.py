@@ -1,4 +1,5 @@
-from core.base_ws_client import BaseWSClient
+from core.order_book import OrderBook
+from core.ws_pool import BBO, TICKERS, WS_FEED_REDUNDANCY, WSConnectionPool
 import os
 from dotenv import load_dotenv
 import logging
@@ -6,54 +7,178 @@ import logging
 load_dotenv()
 
 # URL для подключения к WebSocket API биржи OKX
+# Несколько эндпоинтов — через запятую: выбирается самый быстрый по RTT
 OKX_URL = os.getenv("OKX_URL", "wss://ws.okx.com:8443/ws/v5/public")
+OKX_URLS = [url.strip() for url in OKX_URL.split(",") if url.strip()]
+# Максимум символов на одно соединение (0 — все символы на одном соединении)
+OKX_SHARD_SIZE = int(os.getenv("OKX_SHARD_SIZE", 0))
+# Канал котировок: tickers или bbo (bbo-tbt — лучший уровень на каждое изменение)
+OKX_FEED_MODE = os.getenv("OKX_FEED_MODE", "tickers").lower()
+
+# Пустая сторона bbo-tbt уходит в состояние цен как NaN
+NAN = float("nan")
 
 class OKXWS:
     """
     Клиент для работы с WebSocket API биржи OKX.
     Получает реал-тайм котировки для нескольких криптовалютных пар.
+
+    В режиме `bbo` подписывается на `bbo-tbt`: каждый пуш — полный лучший
+    уровень обеих сторон, поэтому состояние между пушами не ведётся. Если
+    биржа отклоняет сам канал, клиент переходит на `tickers` на всех
+    соединениях без переподключения. Ошибки по отдельным инструментам
+    (неверный instId, неудачная отписка) только логируются: после первого
+    подтверждения или пуша `bbo-tbt` канал считается рабочим.
     """
-    
-    def __init__(self, symbols: list[str], price_callback):
+
+    # Пуши данных начинаются с "arg", подтверждения подписки — с "event"
+    FRAME_MARKERS = (b'{"arg":{"channel":"tickers"',)
+    # В режиме bbo пропускаются и подтверждения и ошибки подписки — по ним решается, рабочий ли канал
+    BBO_FRAME_MARKERS = (b'{"arg":{"channel":"bbo-tbt"', b'{"event":"subscribe","arg":{"channel":"bbo-tbt"',
+                         b'{"event":"error"')
+    # Ошибки доступа к каналу целиком: нужен вход или уровень комиссий не позволяет
+    BBO_CHANNEL_ERROR_CODES = ("60011", "64003")
+
+    def __init__(self, symbols: list[str], price_callback, price_state=None, shard_size: int = OKX_SHARD_SIZE,
+                 redundancy: int = WS_FEED_REDUNDANCY, mode: str = OKX_FEED_MODE):
         """
         Инициализация WebSocket клиента OKX.
         
         Args:
             symbols (list[str]): Список торговых пар для подписки (например, ["BTC-USDT", "ETH-USDT"])
             price_callback (callable): Функция обратного вызова для обработки цен.
-                Принимает параметры: symbol(str), exchange (str), bid (float), ask (float), timestamp (float)
-        """
-        # Формируем аргументы для подписки на несколько пар
-        args = [
-            {
-                "channel": "tickers",
-                "instId": symbol
-            }
-            for symbol in symbols
-        ]
-        
-        self.client = BaseWSClient(
-            url=OKX_URL,
-            subscribe_payload={
-                "op": "subscribe",
-                "args": args
-            },
+                Принимает параметры: symbol(str), exchange (str), bid (float), ask (float), timestamp (float),
+                symbol_id (int | None), exchange_id (int | None)
+            price_state (PriceState, optional): Состояние цен, из которого один раз при подписке
+                берутся целочисленные индексы пар и биржи.
+            shard_size (int): Максимум символов на одно соединение (0 — без шардирования)
+            redundancy (int): Число гоняющихся соединений на шард
+            mode (str): Канал котировок: "tickers" или "bbo"
+        """
+        if mode not in (TICKERS, BBO):
+            logging.warning(f"[OKXWS] Неизвестный режим канала {mode!r}, используется {TICKERS}")
+            mode = TICKERS
+        self.mode = mode
+        self.channel = "tickers" if mode == TICKERS else "bbo-tbt"
+        # Биржа подтвердила подписку на bbo-tbt или прислала по нему данные
+        self.bbo_confirmed = False
+        self.handle_data = self.handle_ticker if mode == TICKERS else self.handle_bbo
+        self.pool = WSConnectionPool(
+            url=OKX_URLS,
+            symbols=symbols,
+            build_payload=self.build_payload,
             name="OKX",
-            message_handler=self.handle_message
+            message_handler=self.handle_message,
+            shard_size=shard_size,
+            frame_markers=self.FRAME_MARKERS if mode == TICKERS else self.BBO_FRAME_MARKERS,
+            redundancy=redundancy,
+            dedup_key=self.dedup_key,
         )
+        # Режим канала пишется в журнал кадров, чтобы воспроизведение собрало адаптер так же
+        self.pool.journal_metadata["feed_mode"] = mode
         self.price_callback = price_callback
+        # Индексы в PriceState резолвятся один раз, а не на каждом тике
+        self.price_state = price_state
+        self.symbol_ids = {symbol: price_state.symbol_id(symbol) for symbol in symbols} if price_state else {}
+        self.exchange_id = price_state.exchange_id("okx") if price_state else None
+
+    def build_payload(self, symbols: list[str], op: str = "subscribe", channel: str = None) -> dict:
+        # Формируем аргументы для подписки на пары шарда
+        channel = channel or self.channel
+        return {"op": op, "args": [{"channel": channel, "instId": symbol} for symbol in symbols]}
+
+    async def add_symbols(self, symbols: list[str]):
+        """
+        Подписывается на котировки новых пар на живых соединениях.
+
+        Пары должны быть уже добавлены в `price_state`, чтобы получить их индексы.
+        """
+        if self.price_state is not None:
+            for symbol in symbols:
+                self.symbol_ids[symbol] = self.price_state.symbol_id(symbol)
+        await self.pool.add_symbols(symbols)
+
+    async def remove_symbols(self, symbols: list[str]):
+        """
+        Отписывается от котировок пар; кадры, пришедшие после этого, отбрасываются.
+        """
+        for symbol in symbols:
+            self.symbol_ids.pop(symbol, None)
+        await self.pool.remove_symbols(symbols)
+
+    async def fall_back_to_tickers(self, reason: str):
+        """
+        Переводит все соединения с bbo-tbt на tickers без переподключения.
+        """
+        if self.mode == TICKERS:
+            return
+        logging.warning(f"[OKXWS] Подписка на bbo-tbt отклонена ({reason}), переход на tickers")
+        old_channel = self.channel
+        self.mode = TICKERS
+        self.pool.journal_metadata["feed_mode"] = TICKERS
+        self.channel = "tickers"
+        self.handle_data = self.handle_ticker
+        await self.pool.resubscribe(self.FRAME_MARKERS,
+                                    lambda shard: self.build_payload(shard, "unsubscribe", old_channel))
+
+    @staticmethod
+    def dedup_key(msg):
+        """
+        Ключ сверки копий кадра между соединениями: (instId, ts, seqId bbo-tbt или лучшие цены и объёмы тикера).
+        """
+        data = msg.get("data")
+        if not data:
+            return None
+        ticker = data[0]
+        fingerprint = ticker.get("seqId")
+        if fingerprint is None:
+            fingerprint = (ticker.get("bidPx"), ticker.get("bidSz"), ticker.get("askPx"), ticker.get("askSz"))
+        return msg.get("arg", {}).get("instId"), int(ticker.get("ts") or 0), fingerprint
 
     async def handle_message(self, msg):
         """
         Обработка входящих WebSocket сообщений.
         """
-        arg = msg.get("arg", {})
-        if arg.get("channel") != "tickers" or "instId" not in arg:
+        arg = msg.get("arg")
+        if arg is None:
+            # В режиме bbo префильтр пропускает ошибки подписки
+            if msg.get("event") == "error":
+                await self.handle_error(msg)
+            return
+        if arg.get("channel") != self.channel or "instId" not in arg:
             return
         if "data" not in msg or not msg["data"]:
+            if msg.get("event") == "subscribe":
+                self.bbo_confirmed = True
             return
 
         symbol = arg["instId"]
+        if self.price_state is not None and symbol not in self.symbol_ids:
+            # Пара уже убрана, а кадр был в пути
+            return
+        await self.handle_data(symbol, msg)
+
+    async def handle_error(self, msg: dict):
+        """
+        Ошибка подписки в режиме bbo: переход на tickers, только если отклонён сам канал.
+
+        Канал считается отклонённым по кодам `BBO_CHANNEL_ERROR_CODES` или по
+        ошибке с упоминанием bbo-tbt, пока канал ни разу не подтвердился.
+        Остальное — ошибки отдельных инструментов, они только логируются.
+        """
+        if self.mode == TICKERS:
+            return
+        code = msg.get("code")
+        text = msg.get("msg", "")
+        if code in self.BBO_CHANNEL_ERROR_CODES or (not self.bbo_confirmed and self.channel in text):
+            await self.fall_back_to_tickers(f"{code}: {text}")
+        else:
+            logging.warning(f"[OKXWS] Ошибка подписки {code}: {text}", extra={"log_key": ("okx-error", code)})
+
+    async def handle_ticker(self, symbol: str, msg: dict):
+        """
+        Разбор пуша `tickers`.
+        """
         try:
             data = msg["data"][0]
             bid = float(data["bidPx"])
@@ -67,13 +192,149 @@ class OKXWS:
                 exchange="okx",
                 bid=bid,
                 ask=ask,
-                timestamp=timestamp
+                timestamp=timestamp,
+                symbol_id=self.symbol_ids.get(symbol),
+                exchange_id=self.exchange_id,
             )
         except Exception as e:
-            logging.error(f"[OKXWS] Ошибка парсинга для {symbol}: {e}")
+            logging.error(f"[OKXWS] Ошибка парсинга для {symbol}: {e}", extra={"log_key": ("okx-parse", symbol)})
+
+    async def handle_bbo(self, symbol: str, msg: dict):
+        """
+        Разбор пуша `bbo-tbt`: [цена, объём, -, число заявок] лучшего уровня каждой стороны.
+
+        Пуш несёт обе стороны целиком, поэтому пустая сторона уходит как NaN.
+        """
+        self.bbo_confirmed = True
+        try:
+            data = msg["data"][0]
+            bids = data.get("bids")
+            asks = data.get("asks")
+            bid = float(bids[0][0]) if bids else NAN
+            ask = float(asks[0][0]) if asks else NAN
+            ts = data.get("ts")
+            await self.price_callback(
+                symbol=symbol,
+                exchange="okx",
+                bid=bid,
+                ask=ask,
+                timestamp=float(ts) / 1000 if ts is not None else None,
+                symbol_id=self.symbol_ids.get(symbol),
+                exchange_id=self.exchange_id,
+            )
+        except Exception as e:
+            logging.error(f"[OKXWS] Ошибка парсинга bbo-tbt для {symbol}: {e}", extra={"log_key": ("okx-parse", symbol)})
+
+    async def start(self):
+        """
+        Запускает WebSocket клиент.
+        """
+        await self.pool.start()
+
+class OKXOrderBookWS:
+    """
+    Клиент стаканов OKX (`books` / `books5`): поддерживает локальные L2 стаканы,
+    проверяет CRC32 контрольную сумму и `prevSeqId`, при расхождении переподписывается.
+    """
+
+    def __init__(self, symbols: list[str], book_callback=None, channel: str = "books", shard_size: int = OKX_SHARD_SIZE):
+        """
+        Инициализация клиента стаканов OKX.
+
+        Args:
+            symbols (list[str]): Список торговых пар для подписки (например, ["BTC-USDT", "ETH-USDT"])
+            book_callback (callable, optional): Асинхронная функция, вызываемая после каждого изменения стакана.
+                Принимает параметры: symbol (str), exchange (str), book (OrderBook)
+            channel (str): "books" (400 уровней, снапшот + дельты) или "books5" (5 уровней, всегда снапшот)
+            shard_size (int): Максимум символов на одно соединение (0 — без шардирования)
+        """
+        self.channel = channel
+        self.pool = WSConnectionPool(
+            url=OKX_URLS,
+            symbols=symbols,
+            build_payload=lambda shard: {
+                "op": "subscribe",
+                "args": [{"channel": channel, "instId": symbol} for symbol in shard]
+            },
+            name="OKXBook",
+            message_handler=self.handle_message,
+            shard_size=shard_size,
+            frame_markers=(f'{{"arg":{{"channel":"{channel}"'.encode(),)
+        )
+        self.book_callback = book_callback
+        self.books = {symbol: OrderBook(symbol, "okx") for symbol in symbols}
+
+    async def add_symbols(self, symbols: list[str]):
+        """
+        Подписывается на стаканы новых пар на живых соединениях.
+        """
+        for symbol in symbols:
+            self.books.setdefault(symbol, OrderBook(symbol, "okx"))
+        await self.pool.add_symbols(symbols)
+
+    async def remove_symbols(self, symbols: list[str]):
+        """
+        Отписывается от стаканов пар и удаляет их локальные стаканы.
+        """
+        for symbol in symbols:
+            self.books.pop(symbol, None)
+        await self.pool.remove_symbols(symbols)
+
+    async def resync(self, symbol: str, reason: str):
+        """
+        Сбрасывает стакан и переподписывается на канал, чтобы получить новый снапшот.
+        """
+        self.books[symbol].reset()
+        logging.warning(f"[OKXBook] {reason} для {symbol}, переподписка")
+        arg = {"channel": self.channel, "instId": symbol}
+        client = self.pool.client_for(symbol)
+        await client.send_json({"op": "unsubscribe", "args": [arg]})
+        await client.send_json({"op": "subscribe", "args": [arg]})
+
+    async def handle_message(self, msg):
+        """
+        Обработка снапшотов и дельт стакана.
+        """
+        arg = msg.get("arg", {})
+        if arg.get("channel") != self.channel or not msg.get("data"):
+            return
+        symbol = arg.get("instId")
+        book = self.books.get(symbol)
+        if book is None:
+            return
+
+        try:
+            data = msg["data"][0]
+            ts = data.get("ts")
+            timestamp = float(ts) / 1000 if ts is not None else None
+            seq_id = data.get("seqId")
+            prev_seq_id = data.get("prevSeqId")
+
+            # books5 не содержит action: каждое сообщение — полный снимок
+            if msg.get("action", "snapshot") == "snapshot":
+                book.apply_snapshot(data.get("bids", []), data.get("asks", []), seq_id, timestamp)
+            else:
+                if not book.ready:
+                    return
+                if prev_seq_id is not None and book.sequence is not None and prev_seq_id != book.sequence:
+                    await self.resync(symbol, "Разрыв последовательности")
+                    return
+                book.apply_delta(data.get("bids", []), data.get("asks", []), seq_id, timestamp)
+
+            checksum = data.get("checksum")
+            if checksum is not None and book.okx_checksum() != checksum:
+                await self.resync(symbol, "Неверная контрольная сумма")
+                return
+
+            if self.book_callback:
+                await self.book_callback(symbol=symbol, exchange="okx", book=book)
+
+        except Exception as e:
+            logging.error(f"[OKXBook] Ошибка обработки стакана для {symbol}: {e}",
+                          extra={"log_key": ("okx-book", symbol)})
 
     async def start(self):
         """
         Запускает WebSocket клиент.
         """
-        await self.client.connect()
\ No newline at end of file
+        await self.pool.start()
@@ -0,0 +1,212 @@
+"""
+Запись сырых кадров WebSocket в сжатый бинарный журнал и чтение его обратно.
+
+Формат файла: gzip-поток, начинающийся с MAGIC_V2, длины (u32) и JSON с
+метаданными журнала (например, режим канала котировок `feed_mode`), за
+которыми идут записи вида (время приёма f64, длина u32, little-endian) +
+байты кадра. Файлы первой версии (MAGIC) метаданных не содержат и тоже
+читаются. Файлы ротируются по размеру и по времени; имя содержит имя
+клиента и время открытия, поэтому сортировка по имени восстанавливает порядок.
+"""
+import atexit
+import glob
+import gzip
+import heapq
+import json
+import logging
+import os
+import queue
+import re
+import struct
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Каталог для записи кадров (пусто — запись выключена)
+RECORD_FRAMES_DIR = os.getenv("RECORD_FRAMES_DIR", "")
+RECORD_MAX_BYTES = int(os.getenv("RECORD_MAX_BYTES", 256 * 1024 * 1024))
+RECORD_MAX_SECONDS = float(os.getenv("RECORD_MAX_SECONDS", 3600))
+
+MAGIC = b"OSHTENF1"
+MAGIC_V2 = b"OSHTENF2"
+_RECORD = struct.Struct("<dI")
+_METADATA_LENGTH = struct.Struct("<I")
+_STOP = object()
+
+
+class FrameRecorder:
+    """
+    Асинхронно пишет сырые кадры одного клиента в ротируемые gzip-файлы.
+
+    `record` только кладёт (время, кадр) в очередь; сжатие и запись на диск
+    выполняет фоновый поток, поэтому цикл событий не ждёт диск.
+    """
+
+    def __init__(self, directory: str, name: str, max_bytes: int = RECORD_MAX_BYTES,
+                 max_seconds: float = RECORD_MAX_SECONDS, metadata: Optional[dict] = None):
+        """
+        Args:
+            directory (str): Каталог для файлов журнала
+            name (str): Имя клиента, используется как префикс файлов
+            max_bytes (int): Размер сжатого файла, после которого начинается новый
+            max_seconds (float): Время жизни файла, после которого начинается новый
+            metadata (dict, optional): Метаданные журнала; словарь читается при открытии
+                каждого файла, поэтому изменения владельца попадают в следующий файл
+        """
+        self.directory = directory
+        # Имена шардов и реплик (Bybit#0/1) содержат # и разделители пути
+        self.name = re.sub(r"[#/\\]", "-", name)
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.metadata = metadata if metadata is not None else {}
+        self.frames_recorded = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._raw = None
+        self._gz = None
+        self._opened_at = 0.0
+        self._thread = threading.Thread(target=self._run, name=f"FrameRecorder-{self.name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, frame: bytes):
+        """
+        Ставит кадр в очередь на запись вместе с локальным временем приёма.
+        """
+        self._queue.put((time.time(), frame))
+
+    def _open(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = os.path.join(self.directory, f"{self.name}-{stamp}-{time.time_ns() % 1_000_000:06d}.frames.gz")
+        self._raw = open(path, "wb")
+        self._gz = gzip.GzipFile(fileobj=self._raw, mode="wb", compresslevel=6)
+        header = json.dumps(dict(self.metadata), ensure_ascii=False).encode()
+        self._gz.write(MAGIC_V2 + _METADATA_LENGTH.pack(len(header)) + header)
+        self._opened_at = time.monotonic()
+        logging.info(f"[FrameRecorder] Запись кадров {self.name} в {path}")
+
+    def _close_file(self):
+        if self._gz is not None:
+            self._gz.close()
+            self._raw.close()
+            self._gz = self._raw = None
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch = [item]
+            # Забираем всё накопившееся, чтобы писать пачками
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                stop = self._write_batch(batch)
+            except Exception as e:
+                logging.error(f"[FrameRecorder] Ошибка записи кадров {self.name}: {e}")
+                stop = any(entry is _STOP for entry in batch)
+            if stop:
+                self._close_file()
+                return
+
+    def _write_batch(self, batch: list) -> bool:
+        for entry in batch:
+            if entry is _STOP:
+                return True
+            if self._gz is None or self._raw.tell() >= self.max_bytes \
+                    or time.monotonic() - self._opened_at >= self.max_seconds:
+                self._close_file()
+                self._open()
+            received_at, frame = entry
+            if isinstance(frame, str):
+                frame = frame.encode()
+            self._gz.write(_RECORD.pack(received_at, len(frame)))
+            self._gz.write(frame)
+            self.frames_recorded += 1
+        self._gz.flush()
+        return False
+
+    def close(self):
+        """Дописывает очередь и закрывает текущий файл."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=5)
+
+
+def create_recorder(name: str, metadata: Optional[dict] = None):
+    """
+    Возвращает `FrameRecorder`, если задан RECORD_FRAMES_DIR, иначе None.
+    """
+    if not RECORD_FRAMES_DIR:
+        return None
+    return FrameRecorder(RECORD_FRAMES_DIR, name, metadata=metadata)
+
+
+def _read_header(f, path: str) -> dict:
+    """Проверяет магию файла и возвращает его метаданные (пустые у первой версии)."""
+    magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        return {}
+    if magic != MAGIC_V2:
+        raise ValueError(f"{path} не является журналом кадров")
+    length, = _METADATA_LENGTH.unpack(f.read(_METADATA_LENGTH.size))
+    return json.loads(f.read(length))
+
+
+def read_metadata(path: str) -> dict:
+    """
+    Метаданные файла журнала.
+
+    Raises:
+        ValueError: Если файл не является журналом кадров.
+    """
+    with gzip.open(path, "rb") as f:
+        return _read_header(f, path)
+
+
+def read_frames(path: str) -> Iterator[tuple[float, bytes]]:
+    """
+    Читает записи (время приёма, кадр) из одного файла журнала.
+
+    Raises:
+        ValueError: Если файл не является журналом кадров.
+    """
+    with gzip.open(path, "rb") as f:
+        _read_header(f, path)
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            received_at, length = _RECORD.unpack(header)
+            frame = f.read(length)
+            if len(frame) < length:
+                # Файл обрезан при аварийной остановке — последнюю запись пропускаем
+                return
+            yield received_at, frame
+
+
+def expand_paths(patterns: Iterable[str]) -> list[str]:
+    """
+    Раскрывает glob-шаблоны в отсортированный список файлов журнала.
+    """
+    paths = []
+    for pattern in patterns:
+        paths.extend(glob.glob(pattern) or [pattern])
+    return sorted(set(paths))
+
+
+def read_all(patterns: Iterable[str]) -> Iterator[tuple[float, bytes]]:
+    """
+    Читает все файлы, подходящие под шаблоны, слиянием по времени приёма.
+
+    Одна биржа пишет несколько журналов одновременно (шарды и реплики), поэтому
+    файлы не читаются подряд: каждый отсортирован сам по себе, и их записи
+    сливаются в общий поток по времени приёма.
+    """
+    yield from heapq.merge(*(read_frames(path) for path in expand_paths(patterns)), key=lambda item: item[0])
@@ -0,0 +1,599 @@
+"""
+Реальное исполнение арбитража: обе ноги отправляются одновременно через постоянные HTTP-сессии.
+
+Для каждой биржи держится своя `aiohttp.ClientSession` с keep-alive
+соединениями, которые прогреваются при старте и поддерживаются
+периодическим запросом времени сервера, поэтому заявка не ждёт TCP/TLS
+рукопожатие. Тела заявок по каждой паре и стороне сериализуются заранее
+в куски байтов, на горячем пути в них подставляются только цена, объём и
+идентификатор. Подпись HMAC считается копированием заранее созданного
+объекта с ключом.
+
+Ноги — IOC-лимитки по ценам возможности. Каждая ограничена LIVE_LEG_TIMEOUT_MS;
+по таймауту заявка отменяется по клиентскому идентификатору. Статус ноги
+`accepted` означает, что биржа приняла заявку; факт исполнения IOC
+проверяется по приватному потоку/истории ордеров и здесь не отслеживается.
+
+Ограничители: по паре — одна сделка в полёте, не чаще LIVE_SYMBOL_COOLDOWN_SECONDS
+и (LIVE_ONCE_PER_WINDOW) не больше одной сделки на окно возможности
+`OpportunityTracker`; всего — не больше LIVE_MAX_TRADES сделок за запуск. Пара,
+по которой принята только одна нога, блокируется до сброса оператором;
+блокировки хранятся в LIVE_BLOCKED_PATH и переживают перезапуск:
+
+    python -m core.live_trading blocked
+    python -m core.live_trading unblock BTC-USDT    # без пар — снять все блокировки
+"""
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+from decimal import Decimal
+from typing import Optional
+
+import aiohttp
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LIVE_TRADING = os.getenv("LIVE_TRADING", "False").lower() == "true"
+# Сумма покупки на одну сделку в котируемой валюте
+LIVE_ORDER_NOTIONAL_USDT = float(os.getenv("LIVE_ORDER_NOTIONAL_USDT", 0))
+LIVE_LEG_TIMEOUT_MS = float(os.getenv("LIVE_LEG_TIMEOUT_MS", 1500))
+# Период запроса, поддерживающего соединения тёплыми, секунды
+LIVE_KEEPALIVE_SECONDS = float(os.getenv("LIVE_KEEPALIVE_SECONDS", 15))
+# Пауза между сделками по одной паре, секунды
+LIVE_SYMBOL_COOLDOWN_SECONDS = float(os.getenv("LIVE_SYMBOL_COOLDOWN_SECONDS", 5))
+# Не больше одной сделки на окно возможности (пару и направление)
+LIVE_ONCE_PER_WINDOW = os.getenv("LIVE_ONCE_PER_WINDOW", "True").lower() == "true"
+# Предел сделок за запуск (0 — без ограничения)
+LIVE_MAX_TRADES = int(os.getenv("LIVE_MAX_TRADES", 100))
+# Файл блокировок пар после несбалансированных сделок (пусто — только в памяти)
+LIVE_BLOCKED_PATH = os.getenv("LIVE_BLOCKED_PATH", "logs/live_blocked.json")
+# Как часто перечитывать файл блокировок, секунды
+BLOCKED_POLL_SECONDS = 1.0
+
+BYBIT_REST_URL = os.getenv("BYBIT_REST_URL", "https://api.bybit.com")
+BYBIT_API_KEY = os.getenv("BYBIT_API_KEY", "")
+BYBIT_API_SECRET = os.getenv("BYBIT_API_SECRET", "")
+# Категория инструментов Bybit: linear (как у потока тикеров) или spot
+BYBIT_CATEGORY = os.getenv("BYBIT_CATEGORY", "linear")
+BYBIT_RECV_WINDOW = os.getenv("BYBIT_RECV_WINDOW", "5000")
+
+OKX_REST_URL = os.getenv("OKX_REST_URL", "https://www.okx.com")
+OKX_API_KEY = os.getenv("OKX_API_KEY", "")
+OKX_API_SECRET = os.getenv("OKX_API_SECRET", "")
+OKX_API_PASSPHRASE = os.getenv("OKX_API_PASSPHRASE", "")
+OKX_TD_MODE = os.getenv("OKX_TD_MODE", "cash")
+
+# Статусы ноги
+ACCEPTED = "accepted"
+REJECTED = "rejected"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+
+def load_blocked(path: str = LIVE_BLOCKED_PATH) -> dict[str, str]:
+    """
+    Читает блокировки пар.
+
+    Returns:
+        dict[str, str]: Пара -> причина блокировки; пусто, если файла нет.
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding="utf-8") as file:
+            blocked = json.load(file)["blocked"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.error(f"[LIVE] Не удалось прочитать блокировки из {path}: {e}")
+        return {}
+    return {str(symbol): str(reason) for symbol, reason in blocked.items()}
+
+
+def save_blocked(blocked: dict[str, str], path: str = LIVE_BLOCKED_PATH):
+    """
+    Атомарно сохраняет блокировки пар (через временный файл и замену).
+    """
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump({"blocked": blocked}, file, ensure_ascii=False, indent=2)
+    os.replace(temporary, path)
+
+
+def format_decimal(value: float, step: Optional[float] = None) -> str:
+    """Число для тела заявки: округление вниз к шагу и запись без экспоненты."""
+    if step:
+        step_decimal = Decimal(str(step))
+        return str((Decimal(str(value)) // step_decimal) * step_decimal)
+    return format(Decimal(repr(value)).normalize(), "f")
+
+
+class OrderTemplate:
+    """
+    Заранее сериализованное тело заявки: неизменная часть хранится кусками байтов.
+
+    `build` склеивает куски с ценой, объёмом и идентификатором без json.dumps.
+    """
+    __slots__ = ("pieces",)
+
+    def __init__(self, fields: dict, qty_key: str, price_key: str, id_key: str):
+        """
+        Args:
+            fields (dict): Постоянные поля заявки
+            qty_key (str): Имя поля объёма
+            price_key (str): Имя поля цены
+            id_key (str): Имя поля клиентского идентификатора
+        """
+        marker = "\x00{}\x00"
+        body = json.dumps({**fields, qty_key: marker.format(0), price_key: marker.format(1),
+                           id_key: marker.format(2)}, separators=(",", ":"))
+        pieces = body.replace("\\u0000", "\x00").split("\x00")
+        # Нечётные куски — номера подстановок, чётные — неизменные байты
+        self.pieces = tuple(int(piece) if i % 2 else piece.encode() for i, piece in enumerate(pieces))
+
+    def build(self, qty: str, price: str, client_id: str) -> bytes:
+        values = (qty.encode(), price.encode(), client_id.encode())
+        return b"".join(values[piece] if isinstance(piece, int) else piece for piece in self.pieces)
+
+
+class ExchangeOrderClient:
+    """
+    Базовый клиент заявок одной биржи: постоянная сессия, шаблоны и подпись.
+
+    Attributes:
+        name (str): Имя биржи, как в `PriceState.exchanges`
+        base_url (str): Адрес REST API
+        session (aiohttp.ClientSession | None): Постоянная сессия, создаётся в `start`
+    """
+
+    name = "exchange"
+    order_path = ""
+    cancel_path = ""
+    time_path = ""
+
+    def __init__(self, base_url: str, api_key: str, api_secret: str):
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        # Объект HMAC с ключом создаётся один раз; на каждую подпись — только copy()
+        self._mac = hmac.new(api_secret.encode(), digestmod=hashlib.sha256)
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.templates: dict[tuple[str, str], OrderTemplate] = {}
+        self._keepalive_task = None
+
+    # --- протокол биржи, переопределяется в наследниках ---
+
+    def make_template(self, symbol: str, side: str) -> OrderTemplate:
+        raise NotImplementedError
+
+    def cancel_body(self, symbol: str, client_id: str) -> bytes:
+        raise NotImplementedError
+
+    def headers(self, path: str, body: bytes) -> dict:
+        raise NotImplementedError
+
+    def parse_response(self, payload: dict) -> tuple[bool, Optional[str], Optional[str]]:
+        """(принята ли заявка, id биржи, текст ошибки)."""
+        raise NotImplementedError
+
+    # --- общая часть ---
+
+    def sign(self, message: bytes) -> hmac.HMAC:
+        mac = self._mac.copy()
+        mac.update(message)
+        return mac
+
+    def prepare(self, symbols: list[str]):
+        """Строит шаблоны заявок для всех пар и обеих сторон."""
+        for symbol in symbols:
+            for side in ("buy", "sell"):
+                self.templates[(symbol, side)] = self.make_template(symbol, side)
+
+    async def start(self):
+        """Открывает сессию, прогревает соединения и запускает поддержку keep-alive."""
+        connector = aiohttp.TCPConnector(limit=8, keepalive_timeout=LIVE_KEEPALIVE_SECONDS * 4, ttl_dns_cache=300)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=10))
+        await asyncio.gather(*(self._touch() for _ in range(2)))
+        self._keepalive_task = asyncio.create_task(self._keepalive())
+
+    async def _touch(self):
+        try:
+            async with self.session.get(self.base_url + self.time_path) as resp:
+                await resp.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logging.warning(f"[{self.name}] Не удалось прогреть соединение: {e}")
+
+    async def _keepalive(self):
+        while True:
+            await asyncio.sleep(LIVE_KEEPALIVE_SECONDS)
+            await self._touch()
+
+    async def _post(self, path: str, body: bytes) -> dict:
+        async with self.session.post(self.base_url + path, data=body, headers=self.headers(path, body)) as resp:
+            return await resp.json(content_type=None)
+
+    async def place(self, symbol: str, side: str, qty: str, price: str, client_id: str) -> dict:
+        """
+        Отправляет IOC-лимитку по шаблону.
+
+        Returns:
+            dict: Результат ноги: exchange, side, status, order_id, client_id, latency_ms, error
+        """
+        template = self.templates.get((symbol, side))
+        if template is None:
+            template = self.templates[(symbol, side)] = self.make_template(symbol, side)
+        body = template.build(qty, price, client_id)
+        started = time.perf_counter()
+        result = {"exchange": self.name, "side": side, "client_id": client_id, "order_id": None, "error": None}
+        try:
+            accepted, order_id, error = self.parse_response(await self._post(self.order_path, body))
+            result.update(status=ACCEPTED if accepted else REJECTED, order_id=order_id, error=error)
+        except asyncio.CancelledError:
+            result.update(status=TIMEOUT)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            result.update(status=ERROR, error=str(e))
+        finally:
+            result["latency_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        return result
+
+    async def cancel(self, symbol: str, client_id: str) -> bool:
+        """Отменяет заявку по клиентскому идентификатору."""
+        try:
+            accepted, _, error = self.parse_response(await self._post(self.cancel_path,
+                                                                      self.cancel_body(symbol, client_id)))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            accepted, error = False, str(e)
+        if not accepted:
+            logging.warning(f"[{self.name}] Отмена {client_id} не подтверждена: {error}")
+        return accepted
+
+    async def close(self):
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+
+class BybitOrderClient(ExchangeOrderClient):
+    """Заявки Bybit v5: POST /v5/order/create, подпись HMAC-SHA256 в hex."""
+
+    name = "bybit"
+    order_path = "/v5/order/create"
+    cancel_path = "/v5/order/cancel"
+    time_path = "/v5/market/time"
+
+    def __init__(self, base_url: str = BYBIT_REST_URL, api_key: str = BYBIT_API_KEY,
+                 api_secret: str = BYBIT_API_SECRET, category: str = BYBIT_CATEGORY,
+                 recv_window: str = BYBIT_RECV_WINDOW):
+        super().__init__(base_url, api_key, api_secret)
+        self.category = category
+        self.recv_window = recv_window
+        self._sign_prefix = api_key + recv_window
+
+    def make_template(self, symbol: str, side: str) -> OrderTemplate:
+        fields = {"category": self.category, "symbol": symbol.replace("-", ""), "side": side.capitalize(),
+                  "orderType": "Limit", "timeInForce": "IOC"}
+        return OrderTemplate(fields, "qty", "price", "orderLinkId")
+
+    def cancel_body(self, symbol: str, client_id: str) -> bytes:
+        return json.dumps({"category": self.category, "symbol": symbol.replace("-", ""), "orderLinkId": client_id},
+                          separators=(",", ":")).encode()
+
+    def headers(self, path: str, body: bytes) -> dict:
+        timestamp = str(int(time.time() * 1000))
+        signature = self.sign((timestamp + self._sign_prefix).encode() + body).hexdigest()
+        return {
+            "Content-Type": "application/json",
+            "X-BAPI-API-KEY": self.api_key,
+            "X-BAPI-TIMESTAMP": timestamp,
+            "X-BAPI-RECV-WINDOW": self.recv_window,
+            "X-BAPI-SIGN": signature,
+        }
+
+    def parse_response(self, payload: dict) -> tuple[bool, Optional[str], Optional[str]]:
+        if payload.get("retCode") == 0:
+            return True, (payload.get("result") or {}).get("orderId"), None
+        return False, None, f"{payload.get('retCode')}: {payload.get('retMsg')}"
+
+
+class OKXOrderClient(ExchangeOrderClient):
+    """Заявки OKX v5: POST /api/v5/trade/order, подпись HMAC-SHA256 в base64."""
+
+    name = "okx"
+    order_path = "/api/v5/trade/order"
+    cancel_path = "/api/v5/trade/cancel-order"
+    time_path = "/api/v5/public/time"
+
+    def __init__(self, base_url: str = OKX_REST_URL, api_key: str = OKX_API_KEY, api_secret: str = OKX_API_SECRET,
+                 passphrase: str = OKX_API_PASSPHRASE, td_mode: str = OKX_TD_MODE):
+        super().__init__(base_url, api_key, api_secret)
+        self.passphrase = passphrase
+        self.td_mode = td_mode
+
+    def make_template(self, symbol: str, side: str) -> OrderTemplate:
+        fields = {"instId": symbol, "tdMode": self.td_mode, "side": side, "ordType": "ioc"}
+        return OrderTemplate(fields, "sz", "px", "clOrdId")
+
+    def cancel_body(self, symbol: str, client_id: str) -> bytes:
+        return json.dumps({"instId": symbol, "clOrdId": client_id}, separators=(",", ":")).encode()
+
+    def headers(self, path: str, body: bytes) -> dict:
+        now = time.time()
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(now)) + f".{int(now * 1000) % 1000:03d}Z"
+        signature = base64.b64encode(self.sign((timestamp + "POST" + path).encode() + body).digest()).decode()
+        return {
+            "Content-Type": "application/json",
+            "OK-ACCESS-KEY": self.api_key,
+            "OK-ACCESS-SIGN": signature,
+            "OK-ACCESS-TIMESTAMP": timestamp,
+            "OK-ACCESS-PASSPHRASE": self.passphrase,
+        }
+
+    def parse_response(self, payload: dict) -> tuple[bool, Optional[str], Optional[str]]:
+        data = (payload.get("data") or [{}])[0]
+        if payload.get("code") == "0" and data.get("sCode", "0") == "0":
+            return True, data.get("ordId"), None
+        return False, None, f"{data.get('sCode') or payload.get('code')}: {data.get('sMsg') or payload.get('msg')}"
+
+
+class LiveTradeExecutor:
+    """
+    Исполняет возможности двумя одновременными IOC-заявками на биржах покупки и продажи.
+
+    Attributes:
+        clients (dict[str, ExchangeOrderClient]): Клиенты заявок по биржам
+        notional (float): Сумма покупки на сделку в котируемой валюте
+        leg_timeout (float): Предельное время ноги в секундах
+        trades (int): Число отправленных сделок
+        legged (int): Сделок, где принята только одна нога
+        skipped (int): Возможностей, отброшенных ограничителями
+        blocked (dict[str, str]): Заблокированные пары и причины
+    """
+
+    def __init__(self, clients: list[ExchangeOrderClient], notional: float = LIVE_ORDER_NOTIONAL_USDT,
+                 leg_timeout_ms: float = LIVE_LEG_TIMEOUT_MS, qty_steps: dict = None, metrics=None,
+                 cooldown: float = LIVE_SYMBOL_COOLDOWN_SECONDS, once_per_window: bool = LIVE_ONCE_PER_WINDOW,
+                 max_trades: int = LIVE_MAX_TRADES, blocked_path: str = LIVE_BLOCKED_PATH):
+        """
+        Args:
+            clients (list[ExchangeOrderClient]): Клиенты заявок
+            notional (float): Сумма покупки на сделку
+            leg_timeout_ms (float): Предельное время ноги
+            qty_steps (dict, optional): Шаг объёма по парам, {"BTC-USDT": 0.001}
+            metrics (Metrics, optional): Реестр для гистограмм задержек ног
+            cooldown (float): Пауза между сделками по одной паре, секунды
+            once_per_window (bool): Не больше одной сделки на окно возможности
+            max_trades (int): Предел сделок (0 — без ограничения)
+            blocked_path (str): Файл блокировок пар (пусто — только в памяти)
+        """
+        self.clients = {client.name: client for client in clients}
+        self.notional = notional
+        self.leg_timeout = leg_timeout_ms / 1000
+        self.qty_steps = qty_steps or {}
+        self.metrics = metrics
+        self.cooldown = cooldown
+        self.once_per_window = once_per_window
+        self.max_trades = max_trades
+        self.blocked_path = blocked_path
+        self.blocked = load_blocked(blocked_path)
+        self.trades = 0
+        self.legged = 0
+        self.skipped = 0
+        # Сделки, принятые к исполнению (для LIVE_MAX_TRADES считаются и те, что ещё в полёте)
+        self._submitted = 0
+        self._limit_reached = False
+        self._in_flight: set[str] = set()
+        # Пара -> время окончания последней сделки (monotonic) и окно, на котором она была
+        self._last_trade_at: dict[str, float] = {}
+        self._last_window: dict[str, object] = {}
+        self._blocked_mtime = self._mtime()
+        self._tasks: set[asyncio.Task] = set()
+        self._ids = itertools.count()
+        self._id_prefix = f"osh{int(time.time()):x}"
+
+    async def start(self, symbols: list[str]):
+        """Строит шаблоны заявок и открывает постоянные сессии."""
+        for client in self.clients.values():
+            client.prepare(symbols)
+        await asyncio.gather(*(client.start() for client in self.clients.values()))
+        if self.blocked:
+            logging.warning(f"[LIVE] Заблокированы до сброса оператором: {self.blocked}")
+        if self.blocked_path:
+            self._spawn(self._watch_blocked())
+
+    def add_symbols(self, symbols: list[str]):
+        """Строит шаблоны заявок для пар, добавленных на ходу."""
+        for client in self.clients.values():
+            client.prepare(symbols)
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*(client.close() for client in self.clients.values()))
+
+    def submit(self, opportunity: dict, window=None):
+        """
+        Запускает исполнение в фоне, если его пропускают ограничители.
+
+        Треугольные возможности (с полем `legs`) пропускаются: исполнитель двуногий.
+        Пара пропускается, пока по ней есть сделка в полёте, идёт пауза после
+        прошлой сделки, окно `window` уже торговалось, пара заблокирована или
+        исчерпан предел сделок.
+
+        Args:
+            opportunity (dict): Возможность в формате `ArbitrageEvaluator.evaluate`
+            window (OpportunityWindow, optional): Окно возможности из `OpportunityTracker`
+        """
+        symbol = opportunity["symbol"]
+        if "legs" in opportunity or symbol in self._in_flight or opportunity["buy_exchange"] not in self.clients \
+                or opportunity["sell_exchange"] not in self.clients:
+            return
+        if symbol in self.blocked \
+                or (self.once_per_window and window is not None and self._last_window.get(symbol) is window) \
+                or time.monotonic() - self._last_trade_at.get(symbol, -self.cooldown) < self.cooldown:
+            self.skipped += 1
+            return
+        if self.max_trades and self._submitted >= self.max_trades:
+            if not self._limit_reached:
+                self._limit_reached = True
+                logging.error(f"[LIVE] Достигнут предел LIVE_MAX_TRADES={self.max_trades}: новые сделки не отправляются")
+            self.skipped += 1
+            return
+        self._submitted += 1
+        self._in_flight.add(symbol)
+        self._last_window[symbol] = window
+        self._spawn(self.execute(opportunity)).add_done_callback(lambda _: self._finish(symbol))
+
+    def _finish(self, symbol: str):
+        self._in_flight.discard(symbol)
+        self._last_trade_at[symbol] = time.monotonic()
+
+    def block(self, symbol: str, reason: str):
+        """Блокирует пару до сброса оператором и сохраняет блокировку."""
+        self.blocked[symbol] = reason
+        self._save_blocked()
+        logging.error(f"[LIVE] {symbol} заблокирована до сброса оператором: {reason}")
+
+    def unblock(self, symbols: list[str] = None) -> list[str]:
+        """
+        Снимает блокировки пар (без аргумента — все).
+
+        Returns:
+            list[str]: Пары, с которых блокировка снята.
+        """
+        released = [symbol for symbol in (symbols if symbols is not None else list(self.blocked))
+                    if self.blocked.pop(symbol, None) is not None]
+        if released:
+            self._save_blocked()
+            logging.warning(f"[LIVE] Блокировка снята: {released}")
+        return released
+
+    def _save_blocked(self):
+        try:
+            save_blocked(self.blocked, self.blocked_path)
+        except OSError as e:
+            logging.error(f"[LIVE] Не удалось сохранить блокировки в {self.blocked_path}: {e}")
+        self._blocked_mtime = self._mtime()
+
+    def _mtime(self) -> Optional[float]:
+        try:
+            return os.stat(self.blocked_path).st_mtime_ns if self.blocked_path else None
+        except OSError:
+            return None
+
+    async def _watch_blocked(self):
+        """Подхватывает изменения файла блокировок, сделанные оператором."""
+        while True:
+            await asyncio.sleep(BLOCKED_POLL_SECONDS)
+            mtime = self._mtime()
+            if mtime == self._blocked_mtime:
+                continue
+            self._blocked_mtime = mtime
+            blocked = load_blocked(self.blocked_path)
+            released = [symbol for symbol in self.blocked if symbol not in blocked]
+            if released:
+                logging.warning(f"[LIVE] Блокировка снята оператором: {released}")
+            self.blocked = blocked
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _leg(self, client: ExchangeOrderClient, symbol: str, side: str, qty: str, price: str,
+                   client_id: str) -> dict:
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(client.place(symbol, side, qty, price, client_id), self.leg_timeout)
+        except asyncio.TimeoutError:
+            result = {"exchange": client.name, "side": side, "client_id": client_id, "order_id": None,
+                      "status": TIMEOUT, "error": None,
+                      "latency_ms": round((time.perf_counter() - started) * 1000, 3)}
+            # Заявка могла дойти до биржи — отменяем по клиентскому идентификатору, не задерживая вторую ногу
+            self._spawn(client.cancel(symbol, client_id))
+        if self.metrics is not None:
+            self.metrics.histogram("order_leg", exchange=client.name).record(result["latency_ms"] / 1000)
+            self.metrics.inc("oshten_order_legs_total", exchange=client.name, status=result["status"])
+        return result
+
+    async def execute(self, opportunity: dict, quantity: float = None) -> dict:
+        """
+        Отправляет обе ноги одновременно.
+
+        Args:
+            opportunity (dict): Возможность в формате `ArbitrageEvaluator.evaluate`
+            quantity (float, optional): Объём в базовой валюте; по умолчанию notional / buy_price
+
+        Returns:
+            dict: symbol, quantity, legs (результаты ног), latency_ms, legged
+        """
+        symbol = opportunity["symbol"]
+        if quantity is None:
+            quantity = self.notional / opportunity["buy_price"]
+        qty = format_decimal(quantity, self.qty_steps.get(symbol))
+        sequence = next(self._ids)
+        buy_client = self.clients[opportunity["buy_exchange"]]
+        sell_client = self.clients[opportunity["sell_exchange"]]
+
+        started = time.perf_counter()
+        legs = await asyncio.gather(
+            self._leg(buy_client, symbol, "buy", qty, format_decimal(opportunity["buy_price"]),
+                      f"{self._id_prefix}b{sequence}"),
+            self._leg(sell_client, symbol, "sell", qty, format_decimal(opportunity["sell_price"]),
+                      f"{self._id_prefix}s{sequence}"),
+        )
+        latency_ms = round((time.perf_counter() - started) * 1000, 3)
+        self.trades += 1
+
+        accepted = [leg["status"] == ACCEPTED for leg in legs]
+        legged = any(accepted) and not all(accepted)
+        if legged:
+            self.legged += 1
+            logging.error(f"[LIVE] {symbol}: принята только одна нога, нужна ручная проверка позиции: {legs}")
+            self.block(symbol, f"принята только одна нога: {[(leg['exchange'], leg['status']) for leg in legs]}")
+        else:
+            logging.info(f"[LIVE] {symbol}: {[leg['status'] for leg in legs]} за {latency_ms} мс")
+        return {"symbol": symbol, "quantity": qty, "legs": legs, "latency_ms": latency_ms, "legged": legged}
+
+    def stats(self) -> dict:
+        return {"trades": self.trades, "legged": self.legged, "in_flight": len(self._in_flight),
+                "skipped": self.skipped, "blocked": list(self.blocked)}
+
+
+def create_executor(metrics=None) -> Optional[LiveTradeExecutor]:
+    """
+    Возвращает `LiveTradeExecutor` для Bybit и OKX, если LIVE_TRADING включён и задан объём.
+    """
+    if not LIVE_TRADING:
+        return None
+    if LIVE_ORDER_NOTIONAL_USDT <= 0:
+        logging.warning("LIVE_TRADING включён, но LIVE_ORDER_NOTIONAL_USDT не задан — реальная торговля выключена.")
+        return None
+    return LiveTradeExecutor([BybitOrderClient(), OKXOrderClient()], metrics=metrics)
+
+
+if __name__ == "__main__":
+    # Сброс блокировок оператором: python -m core.live_trading blocked | unblock [пары...]
+    command, symbols = (sys.argv[1], sys.argv[2:]) if len(sys.argv) > 1 else ("blocked", [])
+    current = load_blocked()
+    if command == "blocked":
+        for blocked_symbol, blocked_reason in current.items():
+            print(f"{blocked_symbol:<14}{blocked_reason}")
+    elif command == "unblock":
+        remaining = {symbol: reason for symbol, reason in current.items() if symbols and symbol not in symbols}
+        save_blocked(remaining)
+        print(f"Блокировка снята: {[symbol for symbol in current if symbol not in remaining]}")
+    else:
+        sys.exit("Использование: python -m core.live_trading blocked | unblock [пары...]")
@@ -0,0 +1,191 @@
+"""
+Задержка цикла событий и выборочный профилировщик по сигналу.
+
+`LoopLagMonitor` — задача, которая засыпает на `interval` и меряет, насколько
+позже она проснулась: это время, которое готовые колбэки ждали своей
+очереди. Отдельный поток-сторож следит за отметкой задачи; если цикл стоит
+дольше `slow_threshold`, он снимает стек потока цикла через
+`sys._current_frames()` — так в лог попадает код, который блокировал цикл, без
+обёртки каждого колбэка.
+
+`SamplingProfiler` по SIGUSR1 запускает поток, который `seconds` секунд с
+частотой `hz` снимает стеки всех потоков и пишет их в свёрнутом формате
+(`поток;файл:функция;... число`), который понимают flamegraph.pl и
+speedscope. Без сигнала поток не существует, поэтому накладных расходов нет:
+    kill -USR1 <pid>
+"""
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Период замера задержки цикла, мс (0 — выключено)
+LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", 100))
+# Остановка цикла дольше этого времени пишется в лог со стеком, мс
+LOOP_SLOW_CALLBACK_MS = float(os.getenv("LOOP_SLOW_CALLBACK_MS", 100))
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", 10))
+PROFILE_HZ = float(os.getenv("PROFILE_HZ", 100))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse_stack(frame, root: str = None) -> str:
+    """Стек кадра в свёрнутом формате flamegraph: от корня к листу через `;`."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    if root:
+        names.append(root)
+    return ";".join(reversed(names))
+
+
+class LoopLagMonitor:
+    """
+    Замер задержки планирования цикла событий и поиск блокирующего кода.
+
+    Attributes:
+        interval (float): Период замера в секундах
+        slow_threshold (float): Порог остановки цикла в секундах
+        max_lag (float): Наибольшая задержка с запуска
+        slow_callbacks (int): Число остановок дольше порога
+    """
+
+    def __init__(self, interval: float = LOOP_MONITOR_INTERVAL_MS / 1000,
+                 slow_threshold: float = LOOP_SLOW_CALLBACK_MS / 1000, histogram=None):
+        """
+        Args:
+            interval (float): Период замера в секундах
+            slow_threshold (float): Порог остановки цикла в секундах
+            histogram (LatencyHistogram, optional): Гистограмма задержек для /metrics
+        """
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.histogram = histogram
+        self.max_lag = 0.0
+        self.slow_callbacks = 0
+        self._heartbeat = time.monotonic()
+        self._blocked_stack: Optional[str] = None
+        self._loop_thread = None
+        self._stopped = threading.Event()
+
+    async def run(self):
+        """Замеряет задержку, пока задача не будет отменена; запускает поток-сторож."""
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        watchdog.start()
+        try:
+            while True:
+                expected = time.monotonic() + self.interval
+                await asyncio.sleep(self.interval)
+                now = time.monotonic()
+                self._heartbeat = now
+                self._record(max(0.0, now - expected))
+        finally:
+            self._stopped.set()
+
+    def _record(self, lag: float):
+        if self.histogram is not None:
+            self.histogram.record(lag)
+        if lag > self.max_lag:
+            self.max_lag = lag
+        if lag < self.slow_threshold:
+            return
+        self.slow_callbacks += 1
+        stack, self._blocked_stack = self._blocked_stack, None
+        if stack:
+            logging.warning(f"[LoopMonitor] Цикл событий стоял {lag * 1000:.0f} мс, блокирующий код:\n{stack}")
+        else:
+            logging.warning(f"[LoopMonitor] Цикл событий стоял {lag * 1000:.0f} мс")
+
+    def _watch(self):
+        """Поток-сторож: снимает стек цикла один раз за каждую остановку."""
+        check = max(self.slow_threshold / 2, 0.005)
+        reported = None
+        while not self._stopped.wait(check):
+            heartbeat = self._heartbeat
+            if time.monotonic() - heartbeat < self.interval + self.slow_threshold or reported == heartbeat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is not None:
+                self._blocked_stack = "".join(traceback.format_stack(frame)[-8:]).rstrip()
+            reported = heartbeat
+
+    def stats(self) -> dict:
+        return {"max_lag_ms": round(self.max_lag * 1000, 3), "slow_callbacks": self.slow_callbacks}
+
+
+class SamplingProfiler:
+    """
+    Выборочный профилировщик стеков всех потоков, запускаемый по сигналу.
+
+    Attributes:
+        seconds (float): Длительность записи
+        hz (float): Частота выборок в секунду
+        directory (str): Каталог для файлов `profile-<время>.folded`
+        last_path (str | None): Путь последнего записанного профиля
+    """
+
+    def __init__(self, seconds: float = PROFILE_SECONDS, hz: float = PROFILE_HZ, directory: str = PROFILE_DIR):
+        self.seconds = seconds
+        self.hz = hz
+        self.directory = directory
+        self.last_path: Optional[str] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def install(self, loop: asyncio.AbstractEventLoop, sig: int = getattr(signal, "SIGUSR1", None)) -> bool:
+        """Подписывает запуск записи на сигнал; False, если платформа его не поддерживает."""
+        if sig is None:
+            return False
+        loop.add_signal_handler(sig, self.trigger)
+        return True
+
+    def trigger(self) -> bool:
+        """Запускает запись в фоне; False, если запись уже идёт."""
+        if self._thread is not None and self._thread.is_alive():
+            logging.info("[Profiler] Запись профиля уже идёт")
+            return False
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return True
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = Counter()
+        period = 1 / self.hz
+        deadline = time.monotonic() + self.seconds
+        logging.info(f"[Profiler] Запись стеков {self.seconds:g} с с частотой {self.hz:g} Гц")
+        samples = 0
+        while time.monotonic() < deadline:
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stacks[collapse_stack(frame, names.get(ident, str(ident)))] += 1
+            samples += 1
+            time.sleep(period)
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+        with open(path, "w", encoding="utf-8") as file:
+            for stack, count in stacks.most_common():
+                file.write(f"{stack} {count}\n")
+        self.last_path = path
+        logging.info(f"[Profiler] {samples} выборок, {len(stacks)} стеков записано в {path}")
@@ -0,0 +1,264 @@
+"""
+Метрики бота: HDR-подобные гистограммы задержек по стадиям, счётчики и HTTP-эндпоинт в формате Prometheus.
+
+Гистограмма лог-линейная: значения в микросекундах раскладываются по
+степеням двойки, каждая делится на SUB_BUCKETS равных частей, поэтому
+относительная погрешность не хуже 1/SUB_BUCKETS, а запись — O(1) без
+аллокаций.
+"""
+import logging
+import os
+from array import array
+from typing import Callable, Iterable
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Порт эндпоинта /metrics (0 — метрики выключены)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+SUB_BITS = 3
+SUB_BUCKETS = 1 << SUB_BITS
+# Значения до 2^36 мкс (~19 часов); всё, что больше, попадает в последний бакет
+MAX_MAGNITUDE = 36
+BUCKET_COUNT = (MAX_MAGNITUDE - SUB_BITS + 2) * SUB_BUCKETS
+
+
+def bucket_index(value: int) -> int:
+    """Номер бакета для неотрицательного целого значения."""
+    if value < SUB_BUCKETS:
+        return value if value > 0 else 0
+    magnitude = value.bit_length() - 1
+    index = (magnitude - SUB_BITS + 1) * SUB_BUCKETS + ((value >> (magnitude - SUB_BITS)) & (SUB_BUCKETS - 1))
+    return index if index < BUCKET_COUNT else BUCKET_COUNT - 1
+
+
+def bucket_upper_bound(index: int) -> int:
+    """Верхняя (исключающая) граница бакета."""
+    if index < SUB_BUCKETS:
+        return index + 1
+    magnitude = index // SUB_BUCKETS + SUB_BITS - 1
+    shift = magnitude - SUB_BITS
+    return ((SUB_BUCKETS + index % SUB_BUCKETS) << shift) + (1 << shift)
+
+
+class LatencyHistogram:
+    """
+    Лог-линейная гистограмма задержек в микросекундах.
+    """
+    __slots__ = ("counts", "count", "total_us", "max_us")
+
+    def __init__(self):
+        self.counts = array("Q", bytes(8 * BUCKET_COUNT))
+        self.count = 0
+        self.total_us = 0
+        self.max_us = 0
+
+    def record(self, seconds: float):
+        """Добавляет наблюдение, заданное в секундах."""
+        value = int(seconds * 1_000_000)
+        if value < 0:
+            value = 0
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total_us += value
+        if value > self.max_us:
+            self.max_us = value
+
+    def percentile(self, q: float) -> float:
+        """Оценка перцентиля `q` (0..1) в секундах по верхней границе бакета."""
+        if not self.count:
+            return 0.0
+        target = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(bucket_upper_bound(index), self.max_us + 1) / 1_000_000
+        return self.max_us / 1_000_000
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{key}="{str(value).replace(chr(34), chr(39))}"' for key, value in labels.items())
+    return "{" + inner + "}"
+
+
+class Metrics:
+    """
+    Реестр метрик: гистограммы по стадиям и меткам, счётчики и сборщики, вызываемые при выгрузке.
+    """
+
+    def __init__(self):
+        self._histograms: dict[tuple, tuple[str, dict, LatencyHistogram]] = {}
+        self._counters: dict[tuple, list] = {}
+        self._collectors: list[Callable[[], Iterable[tuple[str, str, dict, float]]]] = []
+        # Число наблюдений гистограмм на момент прошлого снимка
+        self._sent_counts: dict[tuple, int] = {}
+
+    def histogram(self, stage: str, **labels) -> LatencyHistogram:
+        """
+        Возвращает (создавая при необходимости) гистограмму стадии с метками.
+
+        Объект стоит получить один раз и держать ссылку: на горячем пути
+        остаётся только `record`.
+        """
+        key = (stage, *sorted(labels.items()))
+        entry = self._histograms.get(key)
+        if entry is None:
+            entry = self._histograms[key] = (stage, labels, LatencyHistogram())
+        return entry[2]
+
+    def counter(self, name: str, **labels) -> list:
+        """
+        Возвращает ячейку счётчика — список из одного числа, который можно увеличивать `cell[0] += 1`.
+        """
+        key = (name, *sorted(labels.items()))
+        cell = self._counters.get(key)
+        if cell is None:
+            cell = self._counters[key] = [0, name, labels]
+        return cell
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Увеличивает счётчик по имени и меткам."""
+        self.counter(name, **labels)[0] += value
+
+    def register_collector(self, collector: Callable[[], Iterable[tuple[str, str, dict, float]]]):
+        """
+        Регистрирует функцию, возвращающую (имя, тип, метки, значение) на момент выгрузки.
+        """
+        self._collectors.append(collector)
+
+    def collect(self) -> list[tuple[str, str, dict, float]]:
+        """Сэмплы всех сборщиков; ошибка одного сборщика не мешает остальным."""
+        samples = []
+        for collector in self._collectors:
+            try:
+                samples.extend(collector())
+            except Exception as e:
+                logging.error(f"[Metrics] Ошибка сборщика метрик: {e}")
+        return samples
+
+    def snapshot(self, changed_only: bool = False) -> dict:
+        """
+        Состояние счётчиков, гистограмм и сборщиков для передачи в другой процесс.
+
+        Гистограммы передаются разреженно (только ненулевые бакеты). С
+        `changed_only` в снимок попадают лишь гистограммы, получившие
+        наблюдения с прошлого снимка.
+        """
+        histograms = []
+        for key, (stage, labels, histogram) in self._histograms.items():
+            if not histogram.count or (changed_only and self._sent_counts.get(key) == histogram.count):
+                continue
+            self._sent_counts[key] = histogram.count
+            counts = histogram.counts[:bucket_index(histogram.max_us) + 1]
+            buckets = [(index, count) for index, count in enumerate(counts) if count]
+            histograms.append((stage, labels, buckets, histogram.count, histogram.total_us, histogram.max_us))
+        return {
+            "counters": [(name, labels, value) for value, name, labels in self._counters.values()],
+            "histograms": histograms,
+            "samples": self.collect(),
+        }
+
+    def load_snapshot(self, snapshot: dict, **labels) -> list[tuple[str, str, dict, float]]:
+        """
+        Переносит счётчики и гистограммы снимка к себе, добавляя метки `labels`.
+
+        Значения заменяются, а не складываются: снимок содержит накопленное
+        состояние источника.
+
+        Returns:
+            list: Сэмплы сборщиков источника с добавленными метками.
+        """
+        for name, counter_labels, value in snapshot["counters"]:
+            self.counter(name, **counter_labels, **labels)[0] = value
+        for stage, histogram_labels, buckets, count, total_us, max_us in snapshot["histograms"]:
+            histogram = self.histogram(stage, **histogram_labels, **labels)
+            histogram.counts = array("Q", bytes(8 * BUCKET_COUNT))
+            for index, bucket_count in buckets:
+                histogram.counts[index] = bucket_count
+            histogram.count, histogram.total_us, histogram.max_us = count, total_us, max_us
+        return [(name, kind, {**sample_labels, **labels}, value)
+                for name, kind, sample_labels, value in snapshot["samples"]]
+
+    def render(self) -> str:
+        """Выгружает все метрики в текстовом формате Prometheus."""
+        lines = []
+        typed = set()
+
+        def declare(name: str, kind: str):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for value, name, labels in sorted(self._counters.values(), key=lambda cell: cell[1]):
+            declare(name, "counter")
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        # Сэмплы сборщиков группируются по имени: формат требует, чтобы семейство шло подряд
+        families: dict[str, tuple[str, list[str]]] = {}
+        for name, kind, labels, value in self.collect():
+            families.setdefault(name, (kind, []))[1].append(f"{name}{_format_labels(labels)} {value}")
+        for name, (kind, samples) in families.items():
+            declare(name, kind)
+            lines.extend(samples)
+
+        name = "oshten_stage_latency_seconds"
+        for stage, labels, histogram in self._histograms.values():
+            if not histogram.count:
+                continue
+            declare(name, "histogram")
+            series = {"stage": stage, **labels}
+            cumulative = 0
+            last_index = bucket_index(histogram.max_us)
+            for index in range(last_index + 1):
+                cumulative += histogram.counts[index]
+                # Границы le — только степени двойки, чтобы выгрузка оставалась компактной
+                if (index + 1) % SUB_BUCKETS == 0 or index == last_index:
+                    le = bucket_upper_bound(index) / 1_000_000
+                    lines.append(f"{name}_bucket{_format_labels({**series, 'le': f'{le:g}'})} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels({**series, 'le': '+Inf'})} {histogram.count}")
+            lines.append(f"{name}_sum{_format_labels(series)} {histogram.total_us / 1_000_000}")
+            lines.append(f"{name}_count{_format_labels(series)} {histogram.count}")
+
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str = METRICS_HOST, port: int = METRICS_PORT) -> web.AppRunner:
+        """
+        Запускает HTTP-эндпоинт GET /metrics.
+
+        Returns:
+            web.AppRunner: Раннер, который нужно остановить через `cleanup()`.
+        """
+        async def handle_metrics(request):
+            return web.Response(text=self.render(), content_type="text/plain", charset="utf-8")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle_metrics)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logging.info(f"[Metrics] Эндпоинт метрик: http://{host}:{port}/metrics")
+        return runner
+
+
+class FrameClock:
+    """
+    Время приёма текущего кадра.
+
+    `BaseWSClient.listen` выставляет `received_at` перед декодированием, а
+    обработчик цены читает его синхронно в том же шаге цикла событий, поэтому
+    общий объект безопасен в пределах одного цикла.
+    """
+    __slots__ = ("received_at",)
+
+    def __init__(self):
+        self.received_at = 0.0
+
+
+frame_clock = FrameClock()
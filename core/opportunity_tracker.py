@@ -0,0 +1,317 @@
+"""
+Жизненный цикл арбитражных окон: открытие, обновление, закрытие и журнал в SQLite.
+
+Окно — непрерывный интервал, в течение которого оценка пары раз за разом
+находит возможность в одном направлении (биржа покупки → биржа продажи).
+У пары может быть несколько открытых окон — по одному на направление.
+`OpportunityTracker` обновляет окно за O(1) на каждую оценку и закрывает
+его, когда возможность в этом направлении пропала или котировки пары
+устарели; смена лучшего направления не обрывает окно, которое ещё
+держится. Закрытые окна уходят в `OpportunityJournal`, который пишет их
+в SQLite пачками из фонового потока, поэтому цикл событий диск не ждёт.
+
+Сводка по журналу:
+    python -m core.opportunity_tracker logs/opportunities.db
+"""
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Файл SQLite для закрытых окон (пусто — журнал выключен)
+OPPORTUNITY_JOURNAL_PATH = os.getenv("OPPORTUNITY_JOURNAL_PATH", "")
+
+# Причины закрытия окна
+CLOSED = "closed"
+# Больше не выставляется: окна ведутся по направлениям; оставлена для старых записей журнала
+REVERSED = "reversed"
+STALE = "stale"
+SHUTDOWN = "shutdown"
+REMOVED = "removed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS opportunity_windows (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    buy_exchange TEXT NOT NULL,
+    sell_exchange TEXT NOT NULL,
+    opened_at REAL NOT NULL,
+    closed_at REAL NOT NULL,
+    duration REAL NOT NULL,
+    ticks INTEGER NOT NULL,
+    peak_profit REAL NOT NULL,
+    peak_at REAL NOT NULL,
+    avg_profit REAL NOT NULL,
+    peak_buy_price REAL,
+    peak_sell_price REAL,
+    close_reason TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_opportunity_windows_symbol ON opportunity_windows (symbol, opened_at);
+"""
+_COLUMNS = (
+    "symbol", "buy_exchange", "sell_exchange", "opened_at", "closed_at", "duration", "ticks",
+    "peak_profit", "peak_at", "avg_profit", "peak_buy_price", "peak_sell_price", "close_reason",
+)
+_INSERT = f"INSERT INTO opportunity_windows ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+_STOP = object()
+
+
+class OpportunityWindow:
+    """
+    Открытое окно возможности по паре и направлению.
+    """
+    __slots__ = ("symbol", "buy_exchange", "sell_exchange", "opened_at", "updated_at", "ticks",
+                 "profit_sum", "peak_profit", "peak_at", "peak_buy_price", "peak_sell_price")
+
+    def __init__(self, symbol: str, buy_exchange: str, sell_exchange: str, now: float):
+        self.symbol = symbol
+        self.buy_exchange = buy_exchange
+        self.sell_exchange = sell_exchange
+        self.opened_at = now
+        self.updated_at = now
+        self.ticks = 0
+        self.profit_sum = 0.0
+        self.peak_profit = float("-inf")
+        self.peak_at = now
+        self.peak_buy_price = None
+        self.peak_sell_price = None
+
+    def update(self, opportunity: dict, now: float):
+        profit = opportunity["profit_percent"]
+        self.ticks += 1
+        self.profit_sum += profit
+        self.updated_at = now
+        if profit > self.peak_profit:
+            self.peak_profit = profit
+            self.peak_at = now
+            self.peak_buy_price = opportunity.get("buy_price")
+            self.peak_sell_price = opportunity.get("sell_price")
+
+    def to_record(self, closed_at: float, reason: str) -> tuple:
+        """Строка журнала в порядке колонок таблицы."""
+        return (
+            self.symbol, self.buy_exchange, self.sell_exchange, self.opened_at, closed_at,
+            closed_at - self.opened_at, self.ticks, self.peak_profit, self.peak_at,
+            self.profit_sum / self.ticks, self.peak_buy_price, self.peak_sell_price, reason,
+        )
+
+
+class OpportunityJournal:
+    """
+    Пишет закрытые окна в SQLite пачками из фонового потока.
+
+    `write` только кладёт строку в очередь; соединение с базой живёт в
+    потоке записи, который забирает всё накопившееся и вставляет одной
+    транзакцией.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path (str): Файл базы SQLite; каталог создаётся при необходимости
+        """
+        self.path = path
+        self.rows_written = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="OpportunityJournal", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record: tuple):
+        """Ставит строку закрытого окна в очередь на запись."""
+        self._queue.put(record)
+
+    def _run(self):
+        connection = sqlite3.connect(self.path)
+        connection.executescript(_SCHEMA)
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while True:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = any(record is _STOP for record in batch)
+                rows = [record for record in batch if record is not _STOP]
+                if rows:
+                    try:
+                        with connection:
+                            connection.executemany(_INSERT, rows)
+                        self.rows_written += len(rows)
+                    except sqlite3.Error as e:
+                        logging.error(f"[OpportunityJournal] Ошибка записи окон в {self.path}: {e}")
+                if stop:
+                    return
+        finally:
+            connection.close()
+
+    def close(self):
+        """Дописывает очередь и закрывает базу."""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout=5)
+
+
+class OpportunityTracker:
+    """
+    Открывает, обновляет и закрывает окна возможностей по паре и направлению.
+
+    Attributes:
+        journal (OpportunityJournal | None): Куда отправлять закрытые окна
+        opened (int): Число открытых за всё время окон
+        closed (int): Число закрытых окон
+    """
+
+    def __init__(self, journal: Optional[OpportunityJournal] = None):
+        self.journal = journal
+        self.opened = 0
+        self.closed = 0
+        # Пара -> (биржа покупки, биржа продажи) -> открытое окно; ключ окна — (пара, покупка, продажа)
+        self._open: dict[str, dict[tuple[str, str], OpportunityWindow]] = {}
+
+    def directions(self, symbol: str) -> list[tuple[str, str]]:
+        """Направления (биржа покупки, биржа продажи), по которым у пары открыты окна."""
+        windows = self._open.get(symbol)
+        return list(windows) if windows else []
+
+    def window(self, opportunity: dict) -> Optional[OpportunityWindow]:
+        """Открытое окно пары и направления возможности или None."""
+        windows = self._open.get(opportunity["symbol"])
+        return windows.get((opportunity["buy_exchange"], opportunity["sell_exchange"])) if windows else None
+
+    def observe(self, symbol: str, opportunities, now: float = None):
+        """
+        Учитывает результат очередной оценки пары.
+
+        Каждое сообщённое направление обновляет своё окно; открытые окна
+        пары по направлениям, которых нет среди сообщённых, закрываются
+        как CLOSED.
+
+        Args:
+            symbol (str): Оцениваемая пара
+            opportunities (dict | list[dict] | None): Возможность, все найденные
+                по паре направления или None
+            now (float): Время оценки; по умолчанию `time.time()`
+        """
+        if isinstance(opportunities, dict):
+            opportunities = (opportunities,)
+        windows = self._open.get(symbol)
+        if not opportunities and not windows:
+            return
+
+        if now is None:
+            now = time.time()
+        reported = set()
+        for opportunity in opportunities or ():
+            direction = (opportunity["buy_exchange"], opportunity["sell_exchange"])
+            if direction in reported:
+                continue
+            reported.add(direction)
+            window = windows.get(direction) if windows else None
+            if window is None:
+                if windows is None:
+                    windows = self._open[symbol] = {}
+                window = windows[direction] = OpportunityWindow(symbol, *direction, now)
+                self.opened += 1
+            window.update(opportunity, now)
+        if windows:
+            for direction in [direction for direction in windows if direction not in reported]:
+                self._close(windows[direction], now, CLOSED)
+
+    def observe_batch(self, opportunities: list[dict], now: float = None):
+        """
+        Учитывает результат полного пересчёта: направления без возможностей закрывают свои окна.
+        """
+        if now is None:
+            now = time.time()
+        found: dict[str, list[dict]] = {}
+        for opportunity in opportunities:
+            found.setdefault(opportunity["symbol"], []).append(opportunity)
+        for symbol in [symbol for symbol in self._open if symbol not in found]:
+            self.observe(symbol, None, now)
+        for symbol, reported in found.items():
+            self.observe(symbol, reported, now)
+
+    def close_symbol(self, symbol: str, reason: str = STALE, now: float = None):
+        """Закрывает все окна пары, например при устаревании котировок."""
+        windows = self._open.get(symbol)
+        if windows:
+            now = now if now is not None else time.time()
+            for window in list(windows.values()):
+                self._close(window, now, reason)
+
+    def close_all(self, reason: str = SHUTDOWN):
+        """Закрывает все открытые окна (при остановке)."""
+        now = time.time()
+        for windows in list(self._open.values()):
+            for window in list(windows.values()):
+                self._close(window, now, reason)
+
+    def _close(self, window: OpportunityWindow, now: float, reason: str):
+        windows = self._open[window.symbol]
+        del windows[(window.buy_exchange, window.sell_exchange)]
+        if not windows:
+            del self._open[window.symbol]
+        self.closed += 1
+        if self.journal is not None:
+            self.journal.write(window.to_record(now, reason))
+
+    def open_windows(self) -> list[dict]:
+        """Снимок открытых окон: пара, направление, длительность, пик и число тиков."""
+        now = time.time()
+        return [
+            {
+                "symbol": window.symbol,
+                "buy_exchange": window.buy_exchange,
+                "sell_exchange": window.sell_exchange,
+                "duration": round(now - window.opened_at, 3),
+                "peak_profit": window.peak_profit,
+                "ticks": window.ticks,
+            }
+            for windows in self._open.values() for window in windows.values()
+        ]
+
+    def stats(self) -> dict:
+        """Счётчики окон."""
+        return {"open": self.opened - self.closed, "opened": self.opened, "closed": self.closed}
+
+
+def create_journal() -> Optional[OpportunityJournal]:
+    """
+    Возвращает `OpportunityJournal`, если задан OPPORTUNITY_JOURNAL_PATH, иначе None.
+    """
+    if not OPPORTUNITY_JOURNAL_PATH:
+        return None
+    return OpportunityJournal(OPPORTUNITY_JOURNAL_PATH)
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else OPPORTUNITY_JOURNAL_PATH
+    if not path or not os.path.exists(path):
+        sys.exit("Использование: python -m core.opportunity_tracker <файл журнала>")
+    connection = sqlite3.connect(path)
+    rows = connection.execute(
+        "SELECT symbol, buy_exchange, sell_exchange, COUNT(*), AVG(duration), MAX(duration), "
+        "AVG(avg_profit), MAX(peak_profit), SUM(ticks) FROM opportunity_windows "
+        "GROUP BY symbol, buy_exchange, sell_exchange ORDER BY COUNT(*) DESC"
+    ).fetchall()
+    print(f"{'пара':<14}{'направление':<16}{'окон':>7}{'ср. длит, с':>13}{'макс, с':>10}"
+          f"{'ср. %':>9}{'пик %':>9}{'тиков':>9}")
+    for symbol, buy, sell, count, avg_duration, max_duration, avg_profit, peak, ticks in rows:
+        print(f"{symbol:<14}{buy + '→' + sell:<16}{count:>7}{avg_duration:>13.3f}{max_duration:>10.3f}"
+              f"{avg_profit:>9.4f}{peak:>9.4f}{ticks:>9}")
+    connection.close()
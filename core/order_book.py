@@ -0,0 +1,181 @@
+import zlib
+from bisect import bisect_left, insort
+from typing import Iterator, Optional
+
+
+class OrderBookSide:
+    """
+    Одна сторона стакана: уровни цен в отсортированном списке и их объёмы в словаре.
+
+    Дельта затрагивает только изменившиеся уровни: вставка/удаление цены —
+    bisect по списку, обновление объёма — запись в словарь. Исходные строки
+    цены и объёма хранятся для расчёта контрольной суммы OKX.
+    """
+    def __init__(self, descending: bool):
+        """
+        Args:
+            descending (bool): True для bid (лучшая цена — максимальная), False для ask.
+        """
+        self.descending = descending
+        self.prices: list[float] = []
+        self.levels: dict[float, tuple[float, str, str]] = {}
+
+    def clear(self):
+        self.prices.clear()
+        self.levels.clear()
+
+    def apply(self, levels: list):
+        """
+        Применяет список уровней [[price, size, ...], ...]; нулевой объём удаляет уровень.
+        """
+        for level in levels:
+            price_str, size_str = level[0], level[1]
+            price = float(price_str)
+            size = float(size_str)
+            if size == 0:
+                if self.levels.pop(price, None) is not None:
+                    index = bisect_left(self.prices, price)
+                    del self.prices[index]
+                continue
+            if price not in self.levels:
+                insort(self.prices, price)
+            self.levels[price] = (size, price_str, size_str)
+
+    def __len__(self) -> int:
+        return len(self.prices)
+
+    def best(self) -> Optional[float]:
+        """Лучшая цена стороны или None, если сторона пуста."""
+        if not self.prices:
+            return None
+        return self.prices[-1] if self.descending else self.prices[0]
+
+    def iter_levels(self, limit: int = None) -> Iterator[tuple[float, float]]:
+        """
+        Итерирует (цена, объём) от лучшего уровня к худшему без копирования стакана.
+        """
+        prices = self.prices
+        count = len(prices) if limit is None else min(limit, len(prices))
+        if self.descending:
+            for i in range(len(prices) - 1, len(prices) - 1 - count, -1):
+                yield prices[i], self.levels[prices[i]][0]
+        else:
+            for i in range(count):
+                yield prices[i], self.levels[prices[i]][0]
+
+    def raw_level(self, rank: int) -> Optional[tuple[str, str]]:
+        """Исходные строки (цена, объём) уровня с номером `rank` от лучшего."""
+        if rank >= len(self.prices):
+            return None
+        price = self.prices[-1 - rank] if self.descending else self.prices[rank]
+        _, price_str, size_str = self.levels[price]
+        return price_str, size_str
+
+
+class OrderBook:
+    """
+    Локальный L2 стакан одной пары на одной бирже, поддерживаемый снапшотами и дельтами.
+    """
+    def __init__(self, symbol: str, exchange: str):
+        self.symbol = symbol
+        self.exchange = exchange
+        self.bids = OrderBookSide(descending=True)
+        self.asks = OrderBookSide(descending=False)
+        self.sequence: Optional[int] = None
+        self.timestamp: Optional[float] = None
+        self.ready = False
+
+    def apply_snapshot(self, bids: list, asks: list, sequence: int = None, timestamp: float = None):
+        """
+        Полностью заменяет содержимое стакана.
+        """
+        self.bids.clear()
+        self.asks.clear()
+        self.bids.apply(bids)
+        self.asks.apply(asks)
+        self.sequence = sequence
+        self.timestamp = timestamp
+        self.ready = True
+
+    def apply_delta(self, bids: list, asks: list, sequence: int = None, timestamp: float = None):
+        """
+        Применяет инкрементальное обновление уровней.
+        """
+        self.bids.apply(bids)
+        self.asks.apply(asks)
+        if sequence is not None:
+            self.sequence = sequence
+        if timestamp is not None:
+            self.timestamp = timestamp
+
+    def reset(self):
+        """Сбрасывает стакан до прихода нового снапшота."""
+        self.bids.clear()
+        self.asks.clear()
+        self.sequence = None
+        self.ready = False
+
+    def best_bid(self) -> Optional[float]:
+        return self.bids.best()
+
+    def best_ask(self) -> Optional[float]:
+        return self.asks.best()
+
+    def okx_checksum(self, depth: int = 25) -> int:
+        """
+        Контрольная сумма OKX: CRC32 строки "bidPx:bidSz:askPx:askSz:..." по `depth` лучшим уровням.
+
+        Returns:
+            int: CRC32 как знаковое 32-битное число, в формате поля `checksum` OKX.
+        """
+        parts = []
+        for rank in range(depth):
+            bid = self.bids.raw_level(rank)
+            ask = self.asks.raw_level(rank)
+            if bid is None and ask is None:
+                break
+            if bid is not None:
+                parts.extend(bid)
+            if ask is not None:
+                parts.extend(ask)
+        crc = zlib.crc32(":".join(parts).encode())
+        return crc - (1 << 32) if crc >= (1 << 31) else crc
+
+
+def walk_notional(side: OrderBookSide, notional: float) -> tuple[float, float]:
+    """
+    Проходит уровни стороны, набирая объём на заданную сумму в котируемой валюте.
+
+    Returns:
+        tuple[float, float]: (исполненный объём в базовой валюте, потраченная сумма).
+    """
+    remaining = notional
+    quantity = 0.0
+    for price, size in side.iter_levels():
+        level_notional = price * size
+        if level_notional >= remaining:
+            quantity += remaining / price
+            remaining = 0.0
+            break
+        quantity += size
+        remaining -= level_notional
+    return quantity, notional - remaining
+
+
+def walk_quantity(side: OrderBookSide, quantity: float) -> tuple[float, float]:
+    """
+    Проходит уровни стороны, исполняя заданный объём в базовой валюте.
+
+    Returns:
+        tuple[float, float]: (исполненный объём, полученная сумма в котируемой валюте).
+    """
+    remaining = quantity
+    proceeds = 0.0
+    for price, size in side.iter_levels():
+        if size >= remaining:
+            proceeds += remaining * price
+            remaining = 0.0
+            break
+        proceeds += size * price
+        remaining -= size
+    return quantity - remaining, proceeds
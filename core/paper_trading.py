@@ -51,7 +51,12 @@ class PaperTradeExecutor:
         self.balances[sell_ex]["BTC"] -= btc_to_trade
         self.balances[sell_ex]["USDT"] += usdt_received
 
-        logging.info(f"[PAPER TRADE] BUY {buy_ex} @ {buy_price:.2f} | SELL {sell_ex} @ {sell_price:.2f}")
-        logging.info(f"[PAPER TRADE] BTC: {btc_to_trade:.6f} | Δ USDT: {profit:.4f}")
-        logging.info(f"[BALANCE] {buy_ex}: {self.balances[buy_ex]}")
-        logging.info(f"[BALANCE] {sell_ex}: {self.balances[sell_ex]}")
\ No newline at end of file
+        # Одна запись вместо четырёх: в JSON-логе поля сделки идут отдельными ключами
+        logging.info(
+            f"[PAPER TRADE] BUY {buy_ex} @ {buy_price:.2f} | SELL {sell_ex} @ {sell_price:.2f}\n"
+            f"[PAPER TRADE] BTC: {btc_to_trade:.6f} | Δ USDT: {profit:.4f}\n"
+            f"[BALANCE] {buy_ex}: {self.balances[buy_ex]}\n"
+            f"[BALANCE] {sell_ex}: {self.balances[sell_ex]}",
+            extra={"trade": {"buy_exchange": buy_ex, "sell_exchange": sell_ex, "buy_price": buy_price,
+                             "sell_price": sell_price, "amount": btc_to_trade, "profit_usdt": profit}},
+        )
\ No newline at end of file
@@ -2,83 +2,290 @@ import logging
 import time
 from typing import Dict, Optional
 
+import numpy as np
+
+# Биржи, котировки которых отслеживаются по умолчанию
+DEFAULT_EXCHANGES = ("bybit", "okx")
+
+
 class PriceState:
     """
     Хранит состояние цен (bid/ask) для нескольких валютных пар с разных бирж.
+
+    Котировки лежат в предвыделенных массивах float64 формы (пары × биржи):
+    `bid`, `ask` и `timestamp`. Отсутствующее значение — NaN. Пары и биржи
+    интернируются в целочисленные индексы, которые адаптеры получают один раз
+    при подписке и дальше обновляют состояние через `update_by_id` без
+    поиска по строкам. Словарный API (`get`, `get_all_for_symbol`, `data`)
+    сохранён как тонкое представление поверх массивов.
+
+    Пары можно добавлять и убирать на ходу (`add_symbol`/`remove_symbol`).
+    Индексы остальных пар при этом не меняются: строка убранной пары
+    очищается (в `symbols` на её месте None) и отдаётся следующей добавленной
+    паре, а массивы растут на строку, только если свободных строк нет.
     """
-    def __init__(self, symbols: list[str]):
+    def __init__(self, symbols: list[str], exchanges: tuple[str, ...] = DEFAULT_EXCHANGES):
         """
         Инициализация состояния цен.
 
         Args:
             symbols (list[str]): Список валютных пар для отслеживания.
+            exchanges (tuple[str, ...]): Список бирж для отслеживания.
         """
-        self.symbols = symbols
-        self.data: Dict[str, Dict[str, Dict[str, Optional[float]]]] = {
-            symbol: {
-                "bybit": {"bid": None, "ask": None, "timestamp": None},
-                "okx": {"bid": None, "ask": None, "timestamp": None}
-            }
-            for symbol in symbols
-        }
+        self.symbols: list[Optional[str]] = list(symbols)
+        self.exchanges = tuple(exchanges)
+        self._symbol_ids: Dict[str, int] = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._exchange_ids: Dict[str, int] = {exchange: i for i, exchange in enumerate(self.exchanges)}
+
+        shape = (len(self.symbols), len(self.exchanges))
+        self.bid = np.full(shape, np.nan, dtype=np.float64)
+        self.ask = np.full(shape, np.nan, dtype=np.float64)
+        self.timestamp = np.full(shape, np.nan, dtype=np.float64)
+
+        # Плоские memoryview поверх тех же буферов: скалярная запись/чтение
+        # через них заметно дешевле индексации ndarray на горячем пути
+        self._bind_views()
+        # Число бирж, по которым у пары есть и bid, и ask
+        self._cell_ready = bytearray(shape[0] * shape[1])
+        self._ready_count = [0] * shape[0]
+        # Необязательный получатель обновлений ячеек (например, SharedQuoteWriter)
+        self.publisher = None
+        # Необязательное колесо истечения котировок (QuoteExpiry)
+        self.expiry = None
+        # Необязательные кучи лучших бирж по парам (BestVenues)
+        self.venues = None
+        # Необязательная скользящая статистика спредов (SpreadStats)
+        self.spreads = None
+        # Освобождённые строки убранных пар
+        self._free_ids: list[int] = []
+
+    def _bind_views(self):
+        self._bid = memoryview(self.bid).cast("B").cast("d")
+        self._ask = memoryview(self.ask).cast("B").cast("d")
+        self._ts = memoryview(self.timestamp).cast("B").cast("d")
+
+    def _components(self):
+        """Подключённые компоненты с ячейками по парам (колесо истечения, кучи, статистика)."""
+        return [component for component in (self.expiry, self.venues, self.spreads) if component is not None]
+
+    def active_symbols(self) -> list[str]:
+        """
+        Отслеживаемые сейчас пары в порядке индексов.
+        """
+        return [symbol for symbol in self.symbols if symbol is not None]
+
+    def add_symbol(self, symbol: str) -> int:
+        """
+        Начинает отслеживать пару и возвращает её индекс.
+
+        Занимает освобождённую строку или добавляет новую; подключённые
+        компоненты получают `resize`. С публикацией в разделяемую память
+        (`publisher`) набор пар фиксирован — её раскладка задаётся при создании.
+        """
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is not None:
+            return symbol_id
+        if self.publisher is not None:
+            raise RuntimeError("Набор пар фиксирован, пока котировки публикуются в разделяемую память")
+        if self._free_ids:
+            symbol_id = self._free_ids.pop()
+            self.symbols[symbol_id] = symbol
+        else:
+            symbol_id = len(self.symbols)
+            self.symbols.append(symbol)
+            row = np.full((1, len(self.exchanges)), np.nan, dtype=np.float64)
+            self.bid = np.concatenate([self.bid, row])
+            self.ask = np.concatenate([self.ask, row])
+            self.timestamp = np.concatenate([self.timestamp, row])
+            self._bind_views()
+            self._cell_ready.extend(bytes(len(self.exchanges)))
+            self._ready_count.append(0)
+            for component in self._components():
+                component.resize(len(self.symbols))
+        self._symbol_ids[symbol] = symbol_id
+        return symbol_id
+
+    def remove_symbol(self, symbol: str) -> Optional[int]:
+        """
+        Перестаёт отслеживать пару: очищает её строку и освобождает индекс.
+
+        Returns:
+            int | None: Освобождённый индекс или None, если пара не отслеживалась.
+        """
+        symbol_id = self._symbol_ids.pop(symbol, None)
+        if symbol_id is None:
+            return None
+        if self.publisher is not None:
+            self._symbol_ids[symbol] = symbol_id
+            raise RuntimeError("Набор пар фиксирован, пока котировки публикуются в разделяемую память")
+        self.bid[symbol_id] = np.nan
+        self.ask[symbol_id] = np.nan
+        self.timestamp[symbol_id] = np.nan
+        start = symbol_id * len(self.exchanges)
+        self._cell_ready[start:start + len(self.exchanges)] = bytes(len(self.exchanges))
+        self._ready_count[symbol_id] = 0
+        for component in self._components():
+            component.clear_symbol(symbol_id)
+        self.symbols[symbol_id] = None
+        self._free_ids.append(symbol_id)
+        return symbol_id
+
+    def symbol_id(self, symbol: str) -> Optional[int]:
+        """
+        Возвращает целочисленный индекс пары или None, если пара не отслеживается.
+        """
+        return self._symbol_ids.get(symbol)
+
+    def exchange_id(self, exchange: str) -> Optional[int]:
+        """
+        Возвращает целочисленный индекс биржи или None, если биржа не отслеживается.
+        """
+        return self._exchange_ids.get(exchange)
 
     def update(self, symbol: str, exchange: str, bid: float = None, ask: float = None, timestamp: float = None):
         """
         Обновляет цену для указанной пары и биржи.
         """
-        if symbol not in self.data:
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
             logging.warning(f"[PriceState] Попытка обновить цену для неизвестной пары: {symbol}")
             return
-        if exchange not in self.data[symbol]:
+        exchange_id = self._exchange_ids.get(exchange)
+        if exchange_id is None:
             logging.warning(f"[PriceState] Попытка обновить цену для неизвестной биржи: {exchange}")
             return
 
+        self.update_by_id(symbol_id, exchange_id, bid, ask, timestamp)
+
+    def update_by_id(self, symbol_id: int, exchange_id: int, bid: float = None, ask: float = None, timestamp: float = None):
+        """
+        Обновляет цену по заранее полученным индексам пары и биржи.
+
+        Args:
+            symbol_id (int): Индекс пары из `symbol_id`.
+            exchange_id (int): Индекс биржи из `exchange_id`.
+            bid (float): Лучшая цена покупки.
+            ask (float): Лучшая цена продажи.
+            timestamp (float): Время котировки в секундах.
+        """
+        cell = symbol_id * len(self.exchanges) + exchange_id
         if bid is not None:
-            self.data[symbol][exchange]["bid"] = bid
+            self._bid[cell] = bid
         if ask is not None:
-            self.data[symbol][exchange]["ask"] = ask
+            self._ask[cell] = ask
         if timestamp is not None:
-            self.data[symbol][exchange]["timestamp"] = timestamp
+            self._ts[cell] = timestamp
+
+        # NaN != NaN: опустевшая сторона стакана снимает готовность ячейки
+        complete = self._bid[cell] == self._bid[cell] and self._ask[cell] == self._ask[cell]
+        if complete != self._cell_ready[cell]:
+            self._cell_ready[cell] = complete
+            self._ready_count[symbol_id] += 1 if complete else -1
+        if self.expiry is not None:
+            self.expiry.touch(cell, timestamp)
+        if self.venues is not None:
+            self.venues.update(symbol_id, exchange_id, self._bid[cell], self._ask[cell])
+        if self.spreads is not None:
+            self.spreads.update(symbol_id, exchange_id)
+        if self.publisher is not None:
+            self.publisher.publish(cell, self._bid[cell], self._ask[cell], self._ts[cell])
+
+    def _cell_view(self, symbol_id: int, exchange_id: int) -> Dict[str, Optional[float]]:
+        cell = symbol_id * len(self.exchanges) + exchange_id
+        values = {"bid": self._bid[cell], "ask": self._ask[cell], "timestamp": self._ts[cell]}
+        # NaN != NaN: отсутствующие значения отдаём как None, как раньше
+        return {key: (value if value == value else None) for key, value in values.items()}
 
     def get(self, symbol: str, exchange: str) -> Optional[Dict[str, Optional[float]]]:
         """
         Возвращает данные о цене для указанной пары и биржи.
         """
-        return self.data.get(symbol, {}).get(exchange)
+        symbol_id = self._symbol_ids.get(symbol)
+        exchange_id = self._exchange_ids.get(exchange)
+        if symbol_id is None or exchange_id is None:
+            return None
+        return self._cell_view(symbol_id, exchange_id)
 
     def get_all_for_symbol(self, symbol: str) -> Optional[Dict[str, Dict[str, Optional[float]]]]:
         """
         Возвращает все данные о ценах для указанной пары.
         """
-        return self.data.get(symbol)
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            return None
+        return {
+            exchange: self._cell_view(symbol_id, exchange_id)
+            for exchange, exchange_id in self._exchange_ids.items()
+        }
 
     def get_all(self) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
         """
         Возвращает все данные о ценах.
         """
-        return self.data
+        return {symbol: self.get_all_for_symbol(symbol) for symbol in self.active_symbols()}
+
+    @property
+    def data(self) -> Dict[str, Dict[str, Dict[str, Optional[float]]]]:
+        """
+        Словарное представление состояния (для обратной совместимости).
+        """
+        return self.get_all()
 
     def is_ready(self, symbol: str) -> bool:
         """
-        Проверяет, есть ли полные данные (bid/ask) для пары с обеих бирж.
+        Проверяет, есть ли полные данные (bid/ask) для пары со всех бирж.
         """
-        if symbol not in self.data:
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
             return False
-        
-        return all(
-            self.data[symbol][ex]["bid"] is not None and self.data[symbol][ex]["ask"] is not None
-            for ex in self.data[symbol]
-        )
+        return self._ready_count[symbol_id] == len(self.exchanges)
+
+    def is_ready_by_id(self, symbol_id: int) -> bool:
+        """
+        Аналог `is_ready` по индексу пары.
+        """
+        return self._ready_count[symbol_id] == len(self.exchanges)
 
     def is_stale(self, symbol: str, timeout: int = 10) -> bool:
         """
         Проверяет, не устарели ли данные для указанной пары.
         """
-        now = time.time()
-        if symbol not in self.data:
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
             return True # Если данных нет, считаем их "устаревшими"
+        return self.is_stale_by_id(symbol_id, timeout)
 
-        return any(
-            (now - self.data[symbol][ex].get("timestamp", now)) > timeout
-            for ex in self.data[symbol]
-        )
+    def is_stale_by_id(self, symbol_id: int, timeout: float = 10) -> bool:
+        """
+        Аналог `is_stale` по индексу пары.
+        """
+        deadline = time.time() - timeout
+        start = symbol_id * len(self.exchanges)
+        # NaN < deadline == False: пустой timestamp не считается устаревшим
+        return any(ts < deadline for ts in self._ts[start:start + len(self.exchanges)])
+
+    def newest_timestamp(self, symbol_id: int) -> Optional[float]:
+        """
+        Время самой свежей котировки пары по всем биржам или None.
+        """
+        start = symbol_id * len(self.exchanges)
+        timestamps = [ts for ts in self._ts[start:start + len(self.exchanges)] if ts == ts]
+        return max(timestamps) if timestamps else None
+
+    def ready_mask(self) -> np.ndarray:
+        """
+        Возвращает булеву маску пар, для которых есть bid/ask со всех бирж.
+        """
+        return ~(np.isnan(self.bid) | np.isnan(self.ask)).any(axis=1)
+
+    def stale_mask(self, timeout: float = 10, now: float = None) -> np.ndarray:
+        """
+        Возвращает булеву маску пар, у которых котировка хотя бы одной биржи старше `timeout`.
+
+        Args:
+            timeout (float): Допустимый возраст котировки в секундах.
+            now (float): Текущее время; по умолчанию `time.time()`.
+        """
+        if now is None:
+            now = time.time()
+        return ((now - self.timestamp) > timeout).any(axis=1)
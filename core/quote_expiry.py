@@ -0,0 +1,176 @@
+"""
+Истечение котировок по TTL на хешированном колесе таймеров.
+
+Каждая ячейка (пара × биржа) `PriceState` получает срок годности
+`timestamp + ttl`. Обновление котировки только переписывает срок — ячейка
+остаётся в том слоте колеса, куда попала раньше. Когда колесо доходит до
+слота, ячейка либо истекает (если срок прошёл), либо переносится в слот
+своего нового срока, поэтому на каждую ячейку приходится не больше одной
+перестановки за TTL, а тик не вызывает `time.time()` и не сканирует биржи.
+"""
+import asyncio
+import logging
+import time
+from typing import Callable
+
+# События, передаваемые подписчикам
+EXPIRED = "expired"
+RECOVERED = "recovered"
+
+
+class QuoteExpiry:
+    """
+    Колесо таймеров, помечающее котировки устаревшими в момент истечения TTL.
+
+    Attributes:
+        ttl (float): Допустимый возраст котировки в секундах (по времени биржи)
+        resolution (float): Шаг колеса в секундах — точность момента истечения
+        now (float): Время последнего продвижения колеса
+        expirations (list[int]): Число истечений по биржам (индекс — exchange_id)
+        stale_cells (list[int]): Число устаревших сейчас котировок по биржам
+    """
+
+    def __init__(self, symbol_count: int, exchange_count: int, ttl: float, resolution: float = 0.1,
+                 slots: int = 512):
+        """
+        Args:
+            symbol_count (int): Число пар
+            exchange_count (int): Число бирж
+            ttl (float): Допустимый возраст котировки в секундах
+            resolution (float): Шаг колеса в секундах
+            slots (int): Число слотов; оборот колеса — slots × resolution секунд
+        """
+        self.exchange_count = exchange_count
+        self.ttl = ttl
+        self.resolution = resolution
+        self.now = time.time()
+        self.expirations = [0] * exchange_count
+        self.stale_cells = [0] * exchange_count
+        self.listeners: list[Callable[[str, int, int], None]] = []
+
+        cells = symbol_count * exchange_count
+        self._deadline = [0.0] * cells
+        self._scheduled = bytearray(cells)
+        self._expired = bytearray(cells)
+        # Число устаревших котировок пары: проверка в main — чтение этого значения
+        self._expired_count = [0] * symbol_count
+        self._slots: list[list[int]] = [[] for _ in range(slots)]
+        self._tick = int(self.now / resolution)
+
+    @classmethod
+    def for_price_state(cls, price_state, ttl: float, **kwargs) -> "QuoteExpiry":
+        """
+        Создаёт колесо под размеры `price_state` и подключает его к обновлениям.
+        """
+        expiry = cls(len(price_state.symbols), len(price_state.exchanges), ttl, **kwargs)
+        price_state.expiry = expiry
+        return expiry
+
+    def add_listener(self, listener: Callable[[str, int, int], None]):
+        """
+        Подписывает функцию `listener(event, symbol_id, exchange_id)` на события EXPIRED/RECOVERED.
+        """
+        self.listeners.append(listener)
+
+    def resize(self, symbol_count: int):
+        """
+        Добавляет ячейки под новые пары `PriceState`.
+        """
+        added = symbol_count * self.exchange_count - len(self._deadline)
+        if added <= 0:
+            return
+        self._deadline.extend([0.0] * added)
+        self._scheduled.extend(bytes(added))
+        self._expired.extend(bytes(added))
+        self._expired_count.extend([0] * (symbol_count - len(self._expired_count)))
+
+    def clear_symbol(self, symbol_id: int):
+        """
+        Снимает ячейки убранной пары с отслеживания без событий подписчикам.
+
+        Отрицательный срок — ячейка не отслеживается: колесо выбросит её из слота.
+        """
+        for exchange_id in range(self.exchange_count):
+            cell = symbol_id * self.exchange_count + exchange_id
+            self._deadline[cell] = -1.0
+            if self._expired[cell]:
+                self._expired[cell] = 0
+                self.stale_cells[exchange_id] -= 1
+        self._expired_count[symbol_id] = 0
+
+    def is_expired(self, symbol_id: int) -> bool:
+        """
+        True, если котировка хотя бы одной биржи для пары устарела.
+        """
+        return self._expired_count[symbol_id] > 0
+
+    def is_cell_expired(self, cell: int) -> bool:
+        """
+        True, если котировка ячейки `symbol_id * exchange_count + exchange_id` устарела.
+        """
+        return self._expired[cell] == 1
+
+    def touch(self, cell: int, timestamp: float = None):
+        """
+        Продлевает срок ячейки после обновления котировки.
+
+        Args:
+            cell (int): Индекс ячейки `symbol_id * exchange_count + exchange_id`
+            timestamp (float): Время котировки в секундах; без него отсчёт идёт от `now`
+        """
+        deadline = (self.now if timestamp is None else timestamp) + self.ttl
+        self._deadline[cell] = deadline
+        if not self._scheduled[cell]:
+            self._schedule(cell, deadline)
+        if self._expired[cell] and deadline > self.now:
+            self._expired[cell] = 0
+            self._set_stale(cell, -1, RECOVERED)
+
+    def _schedule(self, cell: int, deadline: float):
+        tick = max(int(deadline / self.resolution) + 1, self._tick + 1)
+        self._slots[tick % len(self._slots)].append(cell)
+        self._scheduled[cell] = 1
+
+    def _set_stale(self, cell: int, delta: int, event: str):
+        symbol_id, exchange_id = divmod(cell, self.exchange_count)
+        self._expired_count[symbol_id] += delta
+        self.stale_cells[exchange_id] += delta
+        if delta > 0:
+            self.expirations[exchange_id] += 1
+        for listener in self.listeners:
+            try:
+                listener(event, symbol_id, exchange_id)
+            except Exception as e:
+                logging.error(f"[QuoteExpiry] Ошибка обработчика события {event}: {e}")
+
+    def advance(self, now: float):
+        """
+        Продвигает колесо до момента `now`, истекая ячейки с прошедшим сроком.
+        """
+        self.now = now
+        target = int(now / self.resolution)
+        # После долгой паузы достаточно одного оборота: каждый слот проверяется один раз
+        self._tick = max(self._tick, target - len(self._slots))
+        while self._tick < target:
+            self._tick += 1
+            index = self._tick % len(self._slots)
+            slot = self._slots[index]
+            if not slot:
+                continue
+            self._slots[index] = []
+            for cell in slot:
+                self._scheduled[cell] = 0
+                deadline = self._deadline[cell]
+                if deadline > now:
+                    self._schedule(cell, deadline)
+                elif deadline >= 0 and not self._expired[cell]:
+                    self._expired[cell] = 1
+                    self._set_stale(cell, 1, EXPIRED)
+
+    async def run(self):
+        """
+        Продвигает колесо каждые `resolution` секунд.
+        """
+        while True:
+            await asyncio.sleep(self.resolution)
+            self.advance(time.time())
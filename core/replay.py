@@ -0,0 +1,192 @@
+"""
+Детерминированное воспроизведение записанных кадров через конвейер разбор → состояние → оценка.
+
+Кадры Bybit и OKX из журналов `FrameRecorder` сливаются по времени приёма
+и подаются в `BybitWS.handle_message` / `OKXWS.handle_message` тем же путём,
+что и в `BaseWSClient.listen` (префильтр + декодер). Сеть не используется.
+Адаптеры собираются в режиме канала, записанном в метаданных журнала
+(`feed_mode`); префильтр берётся у пула адаптера на каждом кадре, поэтому
+переход с bbo на тикеры по записанной ошибке подписки воспроизводится так же.
+Журналы шардов и реплик одной биржи сливаются по времени приёма; копии кадра
+от реплик и от соединений при переезде отбрасываются по `dedup_key` адаптера,
+как в гонке соединений `WSConnectionPool`.
+
+Запуск:
+    python -m core.replay --bybit "logs/frames/Bybit-*.gz" --okx "logs/frames/OKX-*.gz" --fast
+"""
+import argparse
+import asyncio
+import heapq
+import json
+import logging
+import os
+import time
+
+from core.arbitrage_evaluator import ArbitrageEvaluator
+from core.decoder import get_decoder, make_prefilter
+from core.exchange_bybit import BybitWS
+from core.exchange_okx import OKXWS
+from core.frame_recorder import expand_paths, read_all, read_metadata
+from core.metrics import frame_clock
+from core.price_state import PriceState
+from core.ws_pool import first_copy
+
+
+class ReplayPipeline:
+    """
+    Конвейер для воспроизведения: `PriceState`, `ArbitrageEvaluator` и адаптеры бирж без сети.
+
+    Проверка устаревания не выполняется: она зависит от текущего времени и
+    сделала бы прогон недетерминированным.
+
+    Attributes:
+        ticks (int): Число обновлений цен, дошедших до `PriceState`
+        opportunities (list[dict]): Найденные возможности в порядке обнаружения
+    """
+
+    def __init__(self, symbols: list[str], feed_modes: dict[str, str] = None):
+        """
+        Args:
+            symbols (list[str]): Пары
+            feed_modes (dict[str, str], optional): Режим канала по биржам (см. `journal_feed_modes`);
+                для отсутствующих бирж — режим из окружения
+        """
+        feed_modes = feed_modes or {}
+        self.price_state = PriceState(symbols)
+        self.evaluator = ArbitrageEvaluator()
+        self.adapters = {
+            name: adapter(symbols, self.process_price_update, self.price_state,
+                          **({"mode": feed_modes[name]} if name in feed_modes else {}))
+            for name, adapter in (("bybit", BybitWS), ("okx", OKXWS))
+        }
+        self.ticks = 0
+        self.opportunities: list[dict] = []
+
+    async def process_price_update(self, symbol, exchange, timestamp, bid=None, ask=None, symbol_id=None,
+                                   exchange_id=None):
+        if symbol_id is None or exchange_id is None:
+            return
+        self.price_state.update_by_id(symbol_id, exchange_id, bid, ask, timestamp)
+        self.ticks += 1
+        if not self.price_state.is_ready_by_id(symbol_id):
+            return
+        opportunity = self.evaluator.evaluate(symbol, self.price_state.get_all_for_symbol(symbol))
+        if opportunity:
+            opportunity["timestamp"] = timestamp
+            self.opportunities.append(opportunity)
+
+
+def journal_feed_modes(sources: dict[str, list[str]]) -> dict[str, str]:
+    """
+    Режимы канала по биржам из метаданных первых файлов журналов.
+
+    Журналы первой версии режима не содержат — для них биржа не попадает в результат.
+    """
+    modes = {}
+    for exchange, patterns in sources.items():
+        paths = expand_paths(patterns)
+        if not paths:
+            continue
+        mode = read_metadata(paths[0]).get("feed_mode")
+        recorded = {read_metadata(path).get("feed_mode") for path in paths}
+        if len(recorded - {None}) > 1:
+            logging.warning(f"[Replay] В журналах {exchange} разные режимы канала {recorded}, используется {mode}")
+        if mode is not None:
+            modes[exchange] = mode
+    return modes
+
+
+def _tagged_frames(adapter, patterns: list[str]):
+    """Кадры журнала вместе с адаптером, который их разбирает."""
+    for received_at, frame in read_all(patterns):
+        yield received_at, frame, adapter
+
+
+async def replay(pipeline: ReplayPipeline, sources: dict[str, list[str]], fast: bool = True,
+                 speed: float = 1.0) -> dict:
+    """
+    Воспроизводит журналы кадров через конвейер.
+
+    Args:
+        pipeline (ReplayPipeline): Конвейер с адаптерами бирж
+        sources (dict[str, list[str]]): Шаблоны файлов по биржам: {"bybit": [...], "okx": [...]}
+        fast (bool): True — максимально быстро, False — с записанными интервалами
+        speed (float): Множитель скорости при воспроизведении с записанными интервалами
+
+    Returns:
+        dict: Статистика прогона (кадры, отброшенные копии, тики, возможности, время, кадров/сек)
+    """
+    decoder_name, decode = get_decoder()
+    streams = [_tagged_frames(pipeline.adapters[exchange], patterns) for exchange, patterns in sources.items()]
+
+    # Префильтры по набору маркеров: адаптер может сменить канал посреди журнала
+    prefilters = {}
+    # Адаптер -> состояние сверки копий по потокам (см. `first_copy`)
+    last_seen = {adapter: {} for adapter in pipeline.adapters.values()}
+    frames = 0
+    duplicates = 0
+    first_recorded = None
+    started = time.perf_counter()
+    for received_at, frame, adapter in heapq.merge(*streams, key=lambda item: item[0]):
+        if not fast:
+            if first_recorded is None:
+                first_recorded = received_at
+            delay = (received_at - first_recorded) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        frames += 1
+        # Записанное время приёма, как его выставляет `BaseWSClient.listen`
+        frame_clock.received_at = received_at
+        markers = adapter.pool.frame_markers
+        prefilter = prefilters.get(markers)
+        if prefilter is None:
+            prefilter = prefilters[markers] = make_prefilter(markers)
+        if not prefilter(frame):
+            continue
+        try:
+            data = decode(frame)
+            key = adapter.dedup_key(data)
+            if key is not None and not first_copy(last_seen[adapter], key):
+                duplicates += 1
+                continue
+            await adapter.handle_message(data)
+        except Exception as e:
+            logging.error(f"[Replay] Ошибка обработки кадра: {e}")
+    elapsed = time.perf_counter() - started
+
+    return {
+        "decoder": decoder_name,
+        "frames": frames,
+        "duplicates": duplicates,
+        "ticks": pipeline.ticks,
+        "opportunities": len(pipeline.opportunities),
+        "elapsed_s": round(elapsed, 4),
+        "frames_per_s": round(frames / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+async def main(args):
+    symbols = [symbol.strip() for symbol in args.symbols.split(",")]
+    sources = {}
+    if args.bybit:
+        sources["bybit"] = args.bybit
+    if args.okx:
+        sources["okx"] = args.okx
+    pipeline = ReplayPipeline(symbols, journal_feed_modes(sources))
+    stats = await replay(pipeline, sources, fast=args.fast, speed=args.speed)
+    print(json.dumps(stats, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w") as f:
+            for opportunity in pipeline.opportunities:
+                f.write(json.dumps(opportunity, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bybit", nargs="*", default=[], help="Шаблоны файлов журнала Bybit")
+    parser.add_argument("--okx", nargs="*", default=[], help="Шаблоны файлов журнала OKX")
+    parser.add_argument("--symbols", default=os.getenv("SYMBOLS", "BTC-USDT,ETH-USDT"), help="Список пар через запятую")
+    parser.add_argument("--fast", action="store_true", help="Без пауз между кадрами")
+    parser.add_argument("--speed", type=float, default=1.0, help="Множитель скорости для записанного темпа")
+    parser.add_argument("--output", help="Файл JSONL для найденных возможностей (для сравнения прогонов)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,219 @@
+"""
+Таблица котировок в разделяемой памяти для чтения другими процессами.
+
+Раскладка сегмента (little-endian):
+
+    0   magic b"OSHQ", версия раскладки (u32), число пар (u32), число бирж (u32)
+    16  имена пар, по NAME_SIZE байт (ASCII, дополнены нулями)
+    ..  имена бирж, по NAME_SIZE байт
+    ..  строки по 64 байта (каждая в своей кэш-линии, начало выровнено по 64):
+        (пары × биржи) строк вида seq (u64), bid (f64), ask (f64), timestamp (f64)
+        и 32 байта выравнивания
+
+`seq` — seqlock строки: писатель делает его нечётным перед записью и чётным
+после. Читатель повторяет чтение, пока seq чётный и не изменился за время
+чтения. Отсутствующее значение — NaN.
+"""
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+MAGIC = b"OSHQ"
+LAYOUT_VERSION = 2
+NAME_SIZE = 32
+# Строка занимает целую кэш-линию: запись в соседнюю ячейку не инвалидирует линию читателя
+ROW_SIZE = 64
+# Слов по 8 байт в строке
+_ROW_WORDS = ROW_SIZE // 8
+_HEADER = struct.Struct("<4sIII")
+_ROW_DTYPE = np.dtype({"names": ["seq", "bid", "ask", "timestamp"], "formats": ["<u8", "<f8", "<f8", "<f8"],
+                       "offsets": [0, 8, 16, 24], "itemsize": ROW_SIZE})
+
+
+def _rows_offset(n_symbols: int, n_exchanges: int) -> int:
+    names_end = _HEADER.size + NAME_SIZE * (n_symbols + n_exchanges)
+    return (names_end + 63) // 64 * 64
+
+
+def _encode_name(name: str) -> bytes:
+    raw = name.encode("ascii")
+    if len(raw) > NAME_SIZE:
+        raise ValueError(f"Имя длиннее {NAME_SIZE} байт: {name}")
+    return raw.ljust(NAME_SIZE, b"\0")
+
+
+class SharedQuoteWriter:
+    """
+    Публикует котировки `PriceState` в сегмент разделяемой памяти.
+
+    Подключается к `PriceState.publisher`: на каждом обновлении ячейки
+    записывает её bid/ask/timestamp под seqlock — четыре скалярные записи
+    через memoryview, без аллокаций и сериализации.
+    """
+
+    def __init__(self, name: str, symbols: list[str], exchanges: tuple[str, ...]):
+        """
+        Создаёт сегмент разделяемой памяти.
+
+        Args:
+            name (str): Имя сегмента (например, "oshten_quotes")
+            symbols (list[str]): Пары в порядке строк `PriceState`
+            exchanges (tuple[str, ...]): Биржи в порядке столбцов `PriceState`
+        """
+        self.n_symbols = len(symbols)
+        self.n_exchanges = len(exchanges)
+        offset = _rows_offset(self.n_symbols, self.n_exchanges)
+        size = offset + ROW_SIZE * self.n_symbols * self.n_exchanges
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+
+        buf = self.shm.buf
+        _HEADER.pack_into(buf, 0, MAGIC, LAYOUT_VERSION, self.n_symbols, self.n_exchanges)
+        position = _HEADER.size
+        for item in [*symbols, *exchanges]:
+            buf[position:position + NAME_SIZE] = _encode_name(item)
+            position += NAME_SIZE
+
+        rows = buf[offset:size]
+        self._u64 = rows.cast("Q")
+        self._f64 = rows.cast("d")
+        for cell in range(self.n_symbols * self.n_exchanges):
+            self.publish(cell, float("nan"), float("nan"), float("nan"))
+
+    @classmethod
+    def for_price_state(cls, name: str, price_state) -> "SharedQuoteWriter":
+        """
+        Создаёт писатель под раскладку `PriceState` и подключает его к нему.
+        """
+        writer = cls(name, price_state.symbols, price_state.exchanges)
+        price_state.publisher = writer
+        return writer
+
+    def publish(self, cell: int, bid: float, ask: float, timestamp: float):
+        """
+        Записывает строку под seqlock.
+
+        Args:
+            cell (int): Номер ячейки: symbol_id * число бирж + exchange_id
+        """
+        u64, f64 = self._u64, self._f64
+        i = cell * _ROW_WORDS
+        seq = u64[i] + 1
+        u64[i] = seq                  # нечётный — строка пишется
+        f64[i + 1] = bid
+        f64[i + 2] = ask
+        f64[i + 3] = timestamp
+        u64[i] = seq + 1              # чётный — строка согласована
+
+    def close(self):
+        """Освобождает memoryview и удаляет сегмент."""
+        self._u64.release()
+        self._f64.release()
+        self.shm.close()
+        self.shm.unlink()
+
+
+class SharedQuoteReader:
+    """
+    Подключается к сегменту котировок и читает согласованные снимки строк без копирования таблицы.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): Имя сегмента, созданного `SharedQuoteWriter`
+        """
+        # track=False: читатель не должен удалять сегмент при выходе
+        self.shm = shared_memory.SharedMemory(name=name, track=False)
+        buf = self.shm.buf
+        magic, version, self.n_symbols, self.n_exchanges = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            self.shm.close()
+            raise ValueError(f"Неизвестный формат сегмента {name}: {magic!r} v{version}")
+
+        names = []
+        position = _HEADER.size
+        for _ in range(self.n_symbols + self.n_exchanges):
+            names.append(bytes(buf[position:position + NAME_SIZE]).rstrip(b"\0").decode("ascii"))
+            position += NAME_SIZE
+        self.symbols = names[:self.n_symbols]
+        self.exchanges = tuple(names[self.n_symbols:])
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._exchange_ids = {exchange: i for i, exchange in enumerate(self.exchanges)}
+
+        offset = _rows_offset(self.n_symbols, self.n_exchanges)
+        rows = buf[offset:offset + ROW_SIZE * self.n_symbols * self.n_exchanges]
+        self._u64 = rows.cast("Q")
+        self._f64 = rows.cast("d")
+        # Представление таблицы как структурированного массива (пары × биржи) поверх сегмента
+        self.rows = np.frombuffer(rows, dtype=_ROW_DTYPE).reshape(self.n_symbols, self.n_exchanges)
+
+    def read_cell(self, cell: int, retries: int = 1000) -> tuple[float, float, float]:
+        """
+        Читает согласованную строку (bid, ask, timestamp) по номеру ячейки.
+
+        Raises:
+            TimeoutError: Если строка постоянно переписывается дольше `retries` попыток.
+        """
+        i = cell * _ROW_WORDS
+        u64, f64 = self._u64, self._f64
+        for _ in range(retries):
+            seq = u64[i]
+            if seq & 1:
+                continue
+            bid, ask, timestamp = f64[i + 1], f64[i + 2], f64[i + 3]
+            if u64[i] == seq:
+                return bid, ask, timestamp
+        raise TimeoutError(f"Не удалось прочитать согласованную строку {cell}")
+
+    def read(self, symbol: str, exchange: str) -> tuple[float, float, float]:
+        """
+        Читает согласованную котировку (bid, ask, timestamp) для пары и биржи.
+        """
+        return self.read_cell(self._symbol_ids[symbol] * self.n_exchanges + self._exchange_ids[exchange])
+
+    def snapshot(self) -> dict:
+        """
+        Возвращает согласованные по строкам котировки всех пар в словарном формате `PriceState`.
+        """
+        result = {}
+        for symbol_id, symbol in enumerate(self.symbols):
+            result[symbol] = {}
+            for exchange_id, exchange in enumerate(self.exchanges):
+                bid, ask, timestamp = self.read_cell(symbol_id * self.n_exchanges + exchange_id)
+                result[symbol][exchange] = {
+                    "bid": bid if bid == bid else None,
+                    "ask": ask if ask == ask else None,
+                    "timestamp": timestamp if timestamp == timestamp else None,
+                }
+        return result
+
+    def close(self):
+        """Отключается от сегмента, не удаляя его."""
+        self.rows = None
+        self._u64.release()
+        self._f64.release()
+        self.shm.close()
+
+
+if __name__ == "__main__":
+    # Простой просмотрщик: python -m core.shared_quotes [имя сегмента]
+    reader = SharedQuoteReader(sys.argv[1] if len(sys.argv) > 1 else "oshten_quotes")
+    try:
+        while True:
+            now = time.time()
+            for symbol, prices in reader.snapshot().items():
+                line = " | ".join(
+                    f"{exchange}: {quote['bid']} / {quote['ask']} "
+                    f"({(now - quote['timestamp']) * 1000:.0f} мс)" if quote["timestamp"] else f"{exchange}: —"
+                    for exchange, quote in prices.items()
+                )
+                print(f"{symbol:<12} {line}")
+            print()
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reader.close()
@@ -0,0 +1,261 @@
+"""
+Скользящая статистика спреда с учётом комиссий по каждой паре и направлению.
+
+Направление — упорядоченная пара бирж (покупка, продажа). На каждом
+обновлении `PriceState` для бирж тика пересчитываются спреды направлений,
+в которых она участвует, и значение попадает в кольцевой буфер фиксированной
+длины. Среднее и дисперсия окна ведутся скользящим алгоритмом Уэлфорда
+(добавление нового и вычитание вытесненного значения), EWMA и его дисперсия —
+экспоненциально, процентили — по гистограмме окна с фиксированными корзинами.
+Каждое обновление стоит O(1), память не зависит от времени работы.
+"""
+import math
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SPREAD_STATS_ENABLED = os.getenv("SPREAD_STATS_ENABLED", "False").lower() == "true"
+# Длина окна в обновлениях направления
+SPREAD_WINDOW = int(os.getenv("SPREAD_WINDOW", 1000))
+SPREAD_EWMA_ALPHA = float(os.getenv("SPREAD_EWMA_ALPHA", 0.01))
+# Сколько значений нужно в окне, прежде чем z-score считается надёжным
+SPREAD_MIN_SAMPLES = int(os.getenv("SPREAD_MIN_SAMPLES", 100))
+# Гистограмма процентилей: диапазон ±limit процентов с шагом step
+SPREAD_HIST_LIMIT_PERCENT = float(os.getenv("SPREAD_HIST_LIMIT_PERCENT", 2.0))
+SPREAD_HIST_STEP_PERCENT = float(os.getenv("SPREAD_HIST_STEP_PERCENT", 0.001))
+
+
+class SpreadStats:
+    """
+    Окна спредов по направлениям `symbol_id × buy_id × sell_id`.
+
+    Спред — доходность покупки по ask на бирже buy и продажи по bid на бирже
+    sell с учётом комиссий, в процентах (как `profit_percent`).
+
+    Attributes:
+        window (int): Длина окна
+        alpha (float): Коэффициент EWMA
+        min_samples (int): Минимум значений для `zscore`
+        samples (int): Всего добавленных значений
+    """
+
+    def __init__(self, symbol_count: int, exchanges: tuple[str, ...], buy_multipliers: dict,
+                 sell_multipliers: dict, window: int = SPREAD_WINDOW, alpha: float = SPREAD_EWMA_ALPHA,
+                 min_samples: int = SPREAD_MIN_SAMPLES, hist_limit: float = SPREAD_HIST_LIMIT_PERCENT,
+                 hist_step: float = SPREAD_HIST_STEP_PERCENT):
+        """
+        Args:
+            symbol_count (int): Число пар
+            exchanges (tuple[str, ...]): Биржи в порядке exchange_id
+            buy_multipliers (dict): Биржа -> 1 + комиссия покупки
+            sell_multipliers (dict): Биржа -> 1 - комиссия продажи
+            window (int): Длина окна
+            alpha (float): Коэффициент EWMA
+            min_samples (int): Минимум значений для `zscore`
+            hist_limit (float): Граница гистограммы процентилей, проценты
+            hist_step (float): Ширина корзины гистограммы, проценты
+        """
+        self.exchanges = tuple(exchanges)
+        self.exchange_count = len(self.exchanges)
+        self.buy_multipliers = [buy_multipliers.get(exchange, 1.0) for exchange in self.exchanges]
+        self.sell_multipliers = [sell_multipliers.get(exchange, 1.0) for exchange in self.exchanges]
+        self.window = window
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.hist_limit = hist_limit
+        self.hist_step = hist_step
+        self.bins = int(round(2 * hist_limit / hist_step)) + 1
+        self._inv_step = 1 / hist_step
+        self.samples = 0
+        self.price_state = None
+
+        self._ring_array = np.zeros(0, dtype=np.float64)
+        self._hist_array = np.zeros(0, dtype=np.int32)
+        self._position: list[int] = []
+        self._count: list[int] = []
+        self._mean: list[float] = []
+        self._m2: list[float] = []
+        self._ewma: list[float] = []
+        self._ew_var: list[float] = []
+        self._last: list[float] = []
+        self.resize(symbol_count)
+
+    @classmethod
+    def for_price_state(cls, price_state, evaluator, **kwargs) -> "SpreadStats":
+        """
+        Создаёт статистику под размеры `price_state` и подключает её к обновлениям.
+        """
+        stats = cls(len(price_state.symbols), price_state.exchanges, evaluator.buy_multipliers,
+                    evaluator.sell_multipliers, **kwargs)
+        stats.price_state = price_state
+        price_state.spreads = stats
+        return stats
+
+    def resize(self, symbol_count: int):
+        """
+        Добавляет окна под новые пары `PriceState` (память растёт только с числом пар).
+        """
+        per_symbol = self.exchange_count * self.exchange_count
+        added = symbol_count * per_symbol - len(self._count)
+        if added <= 0:
+            return
+        self._ring_array = np.concatenate([self._ring_array, np.zeros(added * self.window, dtype=np.float64)])
+        self._hist_array = np.concatenate([self._hist_array, np.zeros(added * self.bins, dtype=np.int32)])
+        # Плоские memoryview: скалярный доступ дешевле индексации ndarray
+        self._ring = memoryview(self._ring_array).cast("B").cast("d")
+        self._hist = memoryview(self._hist_array).cast("B").cast("i")
+        self._position.extend([0] * added)
+        self._count.extend([0] * added)
+        self._mean.extend([0.0] * added)
+        self._m2.extend([0.0] * added)
+        self._ewma.extend([0.0] * added)
+        self._ew_var.extend([0.0] * added)
+        self._last.extend([math.nan] * added)
+
+    def clear_symbol(self, symbol_id: int):
+        """
+        Обнуляет окна убранной пары.
+        """
+        per_symbol = self.exchange_count * self.exchange_count
+        first = symbol_id * per_symbol
+        self._hist_array[first * self.bins:(first + per_symbol) * self.bins] = 0
+        for direction in range(first, first + per_symbol):
+            self._position[direction] = 0
+            self._count[direction] = 0
+            self._mean[direction] = 0.0
+            self._m2[direction] = 0.0
+            self._ewma[direction] = 0.0
+            self._ew_var[direction] = 0.0
+            self._last[direction] = math.nan
+
+    def direction(self, symbol_id: int, buy_id: int, sell_id: int) -> int:
+        return (symbol_id * self.exchange_count + buy_id) * self.exchange_count + sell_id
+
+    def add(self, direction: int, value: float):
+        """Добавляет значение спреда в окно направления за O(1)."""
+        window = self.window
+        position = self._position[direction]
+        slot = direction * window + position
+        hist = self._hist
+        hist_base = direction * self.bins
+        bins = self.bins
+        count = self._count[direction]
+        mean = self._mean[direction]
+        if count == window:
+            # Скользящий Уэлфорд: вытесняемое значение заменяется новым
+            old = self._ring[slot]
+            index = int((old + self.hist_limit) * self._inv_step + 0.5)
+            hist[hist_base + (0 if index < 0 else bins - 1 if index >= bins else index)] -= 1
+            new_mean = mean + (value - old) / window
+            m2 = self._m2[direction] + (value - old) * (value - new_mean + old - mean)
+            self._m2[direction] = m2 if m2 > 0 else 0.0
+            self._mean[direction] = new_mean
+        else:
+            count += 1
+            self._count[direction] = count
+            delta = value - mean
+            mean += delta / count
+            self._mean[direction] = mean
+            self._m2[direction] += delta * (value - mean)
+        self._ring[slot] = value
+        index = int((value + self.hist_limit) * self._inv_step + 0.5)
+        hist[hist_base + (0 if index < 0 else bins - 1 if index >= bins else index)] += 1
+        self._position[direction] = position + 1 if position + 1 < window else 0
+
+        ewma = self._ewma
+        if count == 1 and self._last[direction] != self._last[direction]:
+            # Первое значение направления
+            ewma[direction] = value
+        else:
+            diff = value - ewma[direction]
+            increment = self.alpha * diff
+            ewma[direction] += increment
+            self._ew_var[direction] = (1 - self.alpha) * (self._ew_var[direction] + diff * increment)
+        self._last[direction] = value
+        self.samples += 1
+
+    def update(self, symbol_id: int, exchange_id: int):
+        """
+        Пересчитывает спреды направлений с биржей `exchange_id` после её тика.
+
+        Направления с отсутствующей или устаревшей котировкой пропускаются.
+        """
+        price_state = self.price_state
+        bids, asks = price_state._bid, price_state._ask
+        expiry = price_state.expiry
+        exchange_count = self.exchange_count
+        row = symbol_id * exchange_count
+        cell = row + exchange_id
+        bid = bids[cell] * self.sell_multipliers[exchange_id]
+        ask = asks[cell] * self.buy_multipliers[exchange_id]
+        if bid != bid or ask != ask:
+            return
+        for other_id in range(exchange_count):
+            if other_id == exchange_id:
+                continue
+            other = row + other_id
+            if expiry is not None and expiry.is_cell_expired(other):
+                continue
+            other_bid = bids[other] * self.sell_multipliers[other_id]
+            other_ask = asks[other] * self.buy_multipliers[other_id]
+            if other_bid == other_bid and ask > 0:
+                self.add((cell * exchange_count) + other_id, (other_bid / ask - 1) * 100)
+            if other_ask == other_ask and other_ask > 0:
+                self.add(other * exchange_count + exchange_id, (bid / other_ask - 1) * 100)
+
+    def std(self, direction: int) -> float:
+        count = self._count[direction]
+        return math.sqrt(self._m2[direction] / (count - 1)) if count > 1 else 0.0
+
+    def zscore(self, symbol_id: int, buy_id: int, sell_id: int, value: float):
+        """
+        z-score значения спреда относительно окна направления.
+
+        Returns:
+            float | None: None, пока в окне меньше `min_samples` значений или разброса нет.
+        """
+        direction = self.direction(symbol_id, buy_id, sell_id)
+        if self._count[direction] < self.min_samples:
+            return None
+        std = self.std(direction)
+        if std <= 0:
+            return None
+        return (value - self._mean[direction]) / std
+
+    def percentile(self, direction: int, q: float) -> float:
+        """
+        Процентиль окна `q` (0..1) с точностью до ширины корзины гистограммы.
+        """
+        count = self._count[direction]
+        if count == 0:
+            return math.nan
+        base = direction * self.bins
+        cumulative = np.cumsum(self._hist_array[base:base + self.bins])
+        index = int(np.searchsorted(cumulative, max(1, math.ceil(q * count))))
+        return -self.hist_limit + index * self.hist_step
+
+    def summary(self, symbol_id: int, buy_id: int, sell_id: int) -> dict:
+        """Статистика окна направления: count, mean, std, ewma, ew_std, p50, p95, last."""
+        direction = self.direction(symbol_id, buy_id, sell_id)
+        return {
+            "count": self._count[direction],
+            "mean": self._mean[direction],
+            "std": self.std(direction),
+            "ewma": self._ewma[direction],
+            "ew_std": math.sqrt(self._ew_var[direction]),
+            "p50": self.percentile(direction, 0.5),
+            "p95": self.percentile(direction, 0.95),
+            "last": self._last[direction],
+        }
+
+    def directions(self):
+        """Направления с данными: (symbol_id, buy_id, sell_id)."""
+        exchange_count = self.exchange_count
+        for direction, count in enumerate(self._count):
+            if count:
+                rest, sell_id = divmod(direction, exchange_count)
+                symbol_id, buy_id = divmod(rest, exchange_count)
+                yield symbol_id, buy_id, sell_id
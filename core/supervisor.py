@@ -0,0 +1,320 @@
+"""
+Многопроцессный режим: пары делятся между процессами-воркерами по хешу.
+
+Каждый воркер запускает полный стек (`BybitWS`/`OKXWS`/`PriceState`/оценка)
+в своём цикле событий только для своей доли пар, поэтому разбор кадров и
+оценка масштабируются по ядрам. Воркер не шлёт уведомления сам: найденные
+возможности и снимки метрик уходят супервизору по однонаправленному каналу
+(`multiprocessing.Pipe`). Супервизор владеет единственным уведомителем
+Telegram, объединяет метрики воркеров с меткой `worker` и перезапускает
+упавший воркер с экспоненциальной задержкой, не трогая остальные.
+
+Отправка в канал идёт из отдельного потока воркера, а приём — из потока на
+каждый воркер в супервизоре, поэтому ни один цикл событий не блокируется на
+записи или чтении канала.
+
+Доли пар стабильны между запусками (crc32 от имени пары). Треугольные циклы
+ищутся только внутри доли воркера.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import threading
+import time
+import zlib
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Число процессов-воркеров (0 или 1 — всё в одном процессе)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", 0))
+# Период отправки метрик воркера супервизору, секунды
+WORKER_METRICS_INTERVAL = float(os.getenv("WORKER_METRICS_INTERVAL", 5))
+# Начальная задержка перезапуска упавшего воркера, секунды (удваивается до 30 с)
+WORKER_RESTART_DELAY = float(os.getenv("WORKER_RESTART_DELAY", 1))
+MAX_RESTART_DELAY = 30.0
+# Воркер, проработавший дольше этого, перезапускается снова с начальной задержкой
+STABLE_RUN_SECONDS = 60.0
+
+# Типы сообщений канала воркер -> супервизор
+OPPORTUNITY = "opportunity"
+METRICS = "metrics"
+
+
+def partition(symbols: list[str], workers: int) -> list[list[str]]:
+    """
+    Делит пары между воркерами по crc32 имени; порядок пар внутри доли сохраняется.
+    """
+    shards = [[] for _ in range(workers)]
+    for symbol in symbols:
+        shards[zlib.crc32(symbol.encode()) % workers].append(symbol)
+    return shards
+
+
+class WorkerChannel:
+    """
+    Сторона воркера: заменяет уведомитель и отправляет возможности и метрики супервизору.
+
+    Повторяет интерфейс `TelegramNotifier` (`submit`, `run`, `stats`), поэтому
+    главная функция использует его на том же месте.
+
+    Attributes:
+        index (int): Номер воркера
+        metrics (Metrics | None): Метрики воркера, снимки которых отправляются
+        forwarded (int): Отправлено возможностей
+    """
+
+    def __init__(self, connection, index: int, metrics_interval: float = WORKER_METRICS_INTERVAL):
+        """
+        Args:
+            connection (multiprocessing.connection.Connection): Пишущий конец канала
+            index (int): Номер воркера
+            metrics_interval (float): Период отправки снимков метрик, секунды
+        """
+        self.connection = connection
+        self.index = index
+        self.metrics_interval = metrics_interval
+        self.metrics = None
+        self.forwarded = 0
+        self._outbox: queue.SimpleQueue = queue.SimpleQueue()
+        self._sender = threading.Thread(target=self._send_loop, name=f"worker-{index}-channel", daemon=True)
+        self._sender.start()
+
+    def _send_loop(self):
+        while True:
+            message = self._outbox.get()
+            if message is None:
+                return
+            try:
+                self.connection.send(message)
+            except (OSError, EOFError, BrokenPipeError):
+                # Супервизор закрыл канал — он же и остановит воркер
+                return
+
+    def submit(self, opportunity: dict):
+        """Передаёт возможность супервизору без ожидания."""
+        self.forwarded += 1
+        self._outbox.put((OPPORTUNITY, opportunity))
+
+    async def run(self):
+        """Периодически отправляет снимок метрик (только изменившиеся гистограммы)."""
+        if self.metrics is None:
+            return
+        first = True
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            self._outbox.put((METRICS, self.metrics.snapshot(changed_only=not first)))
+            first = False
+
+    def close(self):
+        self._outbox.put(None)
+        self._sender.join(timeout=1)
+        self.connection.close()
+
+    def stats(self) -> dict:
+        return {"worker": self.index, "forwarded": self.forwarded}
+
+
+def run_worker(target: Callable, index: int, symbols: list[str], connection):
+    """
+    Точка входа процесса-воркера: `target(symbols, channel)` в собственном цикле событий.
+
+    SIGINT игнорируется (остановкой управляет супервизор), SIGTERM отменяет главную задачу.
+    """
+    from core.async_logging import setup_logging
+    from core.loop_monitor import SamplingProfiler
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(prefix=f"W{index}")
+    channel = WorkerChannel(connection, index)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        task = asyncio.current_task()
+        loop.add_signal_handler(signal.SIGTERM, task.cancel)
+        SamplingProfiler().install(loop)
+        await target(symbols, channel)
+
+    try:
+        asyncio.run(run())
+    except asyncio.CancelledError:
+        pass
+    finally:
+        channel.close()
+
+
+class WorkerProcess:
+    """
+    Процесс-воркер с его долей пар и каналом к супервизору.
+
+    Attributes:
+        index (int): Номер воркера
+        symbols (list[str]): Доля пар
+        restarts (int): Число перезапусков после падения
+        forwarded (int): Принято возможностей от воркера
+        samples (list): Последние сэмплы сборщиков метрик воркера
+    """
+
+    def __init__(self, index: int, symbols: list[str], target: Callable):
+        self.index = index
+        self.symbols = symbols
+        self.target = target
+        self.process: Optional[multiprocessing.Process] = None
+        self.started_at = 0.0
+        self.restarts = 0
+        self.forwarded = 0
+        self.samples: list = []
+
+    def start(self, context, on_message: Callable, on_exit: Callable):
+        """
+        Запускает процесс и поток чтения канала.
+
+        `on_message(worker, message)` и `on_exit(worker)` вызываются из потока
+        чтения; супервизор переносит их в цикл событий.
+        """
+        receiver, sender = context.Pipe(duplex=False)
+        self.process = context.Process(target=run_worker, args=(self.target, self.index, self.symbols, sender),
+                                       name=f"worker-{self.index}", daemon=False)
+        self.process.start()
+        # Пишущий конец остаётся только у воркера: его выход закрывает канал и будит поток чтения
+        sender.close()
+        self.started_at = time.monotonic()
+        process = self.process
+
+        def read():
+            try:
+                while True:
+                    on_message(self, receiver.recv())
+            except (EOFError, OSError):
+                pass
+            finally:
+                receiver.close()
+                process.join()
+                on_exit(self)
+
+        threading.Thread(target=read, name=f"worker-{self.index}-reader", daemon=True).start()
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def terminate(self):
+        """Отправляет SIGTERM, не дожидаясь завершения."""
+        if self.is_alive():
+            self.process.terminate()
+
+    def stop(self, timeout: float = 5.0):
+        """Ждёт завершения после `terminate`; SIGKILL, если воркер не завершился за `timeout`."""
+        if not self.is_alive():
+            return
+        self.process.terminate()
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logging.warning(f"[Supervisor] Воркер {self.index} не остановился за {timeout:g} с, завершаем принудительно")
+            self.process.kill()
+            self.process.join()
+
+
+class Supervisor:
+    """
+    Запускает воркеров по долям пар, принимает их сообщения и перезапускает упавших.
+
+    Attributes:
+        workers (list[WorkerProcess]): Воркеры с непустыми долями
+    """
+
+    def __init__(self, shards: list[list[str]], target: Callable, notifier, metrics=None,
+                 restart_delay: float = WORKER_RESTART_DELAY):
+        """
+        Args:
+            shards (list[list[str]]): Доли пар (пустые пропускаются)
+            target (Callable): Корутина воркера `target(symbols, channel)`; должна быть
+                доступна по имени модуля, так как процессы запускаются через spawn
+            notifier (TelegramNotifier): Единственный уведомитель
+            metrics (Metrics, optional): Реестр, в который сливаются метрики воркеров
+            restart_delay (float): Начальная задержка перезапуска, секунды
+        """
+        self.workers = [WorkerProcess(index, shard, target) for index, shard in enumerate(shards) if shard]
+        self.notifier = notifier
+        self.metrics = metrics
+        self.restart_delay = restart_delay
+        self.context = multiprocessing.get_context("spawn")
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping = False
+        self._delays = {worker.index: restart_delay for worker in self.workers}
+
+    def _start(self, worker: WorkerProcess):
+        worker.start(self.context, self._on_message, self._on_exit)
+        logging.info(f"[Supervisor] Воркер {worker.index} запущен (pid {worker.process.pid}), "
+                     f"пар: {len(worker.symbols)}")
+
+    def _on_message(self, worker: WorkerProcess, message):
+        self._loop.call_soon_threadsafe(self._handle_message, worker, message)
+
+    def _handle_message(self, worker: WorkerProcess, message):
+        kind, payload = message
+        if kind == OPPORTUNITY:
+            worker.forwarded += 1
+            self.notifier.submit(payload)
+        elif kind == METRICS and self.metrics is not None:
+            worker.samples = self.metrics.load_snapshot(payload, worker=str(worker.index))
+
+    def _on_exit(self, worker: WorkerProcess):
+        try:
+            self._loop.call_soon_threadsafe(self._handle_exit, worker)
+        except RuntimeError:
+            # Цикл супервизора уже закрыт
+            pass
+
+    def _handle_exit(self, worker: WorkerProcess):
+        if self._stopping:
+            return
+        exit_code = worker.process.exitcode
+        # Воркер, проработавший долго, перезапускается с начальной задержкой
+        if time.monotonic() - worker.started_at > STABLE_RUN_SECONDS:
+            self._delays[worker.index] = self.restart_delay
+        delay = self._delays[worker.index]
+        self._delays[worker.index] = min(delay * 2, MAX_RESTART_DELAY)
+        worker.restarts += 1
+        logging.error(f"[Supervisor] Воркер {worker.index} завершился с кодом {exit_code}, "
+                      f"перезапуск через {delay:g} с")
+        self._loop.call_later(delay, self._restart, worker)
+
+    def _restart(self, worker: WorkerProcess):
+        if not self._stopping and not worker.is_alive():
+            self._start(worker)
+
+    async def run(self):
+        """Запускает воркеров и работает до отмены; при отмене останавливает их."""
+        self._loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            self._start(worker)
+        try:
+            await asyncio.Future()
+        finally:
+            self._stopping = True
+            # SIGTERM уходит сразу: даже если ожидание ниже будет отменено, воркеры завершатся
+            for worker in self.workers:
+                worker.terminate()
+            await asyncio.gather(*(asyncio.to_thread(worker.stop) for worker in self.workers))
+            logging.info("[Supervisor] Воркеры остановлены")
+
+    def metric_samples(self):
+        """Сэмплы воркеров и состояние процессов для /metrics."""
+        for worker in self.workers:
+            labels = {"worker": str(worker.index)}
+            yield "oshten_worker_up", "gauge", labels, int(worker.is_alive())
+            yield "oshten_worker_restarts_total", "counter", labels, worker.restarts
+            yield "oshten_worker_opportunities_total", "counter", labels, worker.forwarded
+            yield from worker.samples
+
+    def stats(self) -> list[dict]:
+        return [
+            {"worker": worker.index, "alive": worker.is_alive(), "symbols": len(worker.symbols),
+             "restarts": worker.restarts, "forwarded": worker.forwarded}
+            for worker in self.workers
+        ]
@@ -0,0 +1,163 @@
+"""
+Управление набором отслеживаемых пар на ходу через локальный HTTP.
+
+    GET  /symbols                                   -> {"symbols": [...]}
+    POST /symbols {"add": [...], "remove": [...]}   -> {"symbols": [...], "added": [...], "removed": [...]}
+
+Изменения применяются обработчиками приложения (подписка на живых
+соединениях, рост состояния цен) без переподключения. Актуальный набор
+сохраняется в SYMBOLS_STATE_PATH и при следующем запуске заменяет SYMBOLS,
+поэтому после перезапуска подписка идёт только на то, что было активно.
+
+    curl -X POST localhost:8765/symbols -d '{"add": ["SOL-USDT"], "remove": ["ETH-USDT"]}'
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+from typing import Awaitable, Callable, Optional
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Порт управления набором пар (0 — выключено)
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", 0))
+CONTROL_HOST = os.getenv("CONTROL_HOST", "127.0.0.1")
+# Файл с актуальным набором пар (пусто — набор не сохраняется)
+SYMBOLS_STATE_PATH = os.getenv("SYMBOLS_STATE_PATH", "")
+
+SYMBOL_PATTERN = re.compile(r"^[A-Z0-9]+-[A-Z0-9]+$")
+
+
+def load_symbols(path: str = SYMBOLS_STATE_PATH) -> Optional[list[str]]:
+    """
+    Читает сохранённый набор пар.
+
+    Returns:
+        list[str] | None: Пары или None, если файла нет или он повреждён.
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as file:
+            symbols = json.load(file)["symbols"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logging.error(f"[SymbolControl] Не удалось прочитать набор пар из {path}: {e}")
+        return None
+    return [symbol for symbol in symbols if isinstance(symbol, str)]
+
+
+def save_symbols(symbols: list[str], path: str = SYMBOLS_STATE_PATH):
+    """
+    Атомарно сохраняет набор пар (через временный файл и замену).
+    """
+    if not path:
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary = f"{path}.tmp"
+    with open(temporary, "w", encoding="utf-8") as file:
+        json.dump({"symbols": symbols}, file, ensure_ascii=False)
+    os.replace(temporary, path)
+
+
+class SymbolControl:
+    """
+    Набор отслеживаемых пар и HTTP-эндпоинт для его изменения.
+
+    Изменения сериализуются блокировкой: пока обработчики подписывают одну
+    пачку пар, следующий запрос ждёт.
+
+    Attributes:
+        symbols (list[str]): Актуальный набор пар
+    """
+
+    def __init__(self, symbols: list[str], on_add: Callable[[list[str]], Awaitable[None]],
+                 on_remove: Callable[[list[str]], Awaitable[None]], state_path: str = SYMBOLS_STATE_PATH):
+        """
+        Args:
+            symbols (list[str]): Пары, отслеживаемые при запуске
+            on_add (Callable): Корутина, подключающая новые пары
+            on_remove (Callable): Корутина, отключающая пары
+            state_path (str): Файл для сохранения набора (пусто — не сохранять)
+        """
+        self.symbols = list(symbols)
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.state_path = state_path
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def normalize(symbols) -> list[str]:
+        """
+        Приводит пары к виду "BASE-QUOTE" в верхнем регистре.
+
+        Raises:
+            ValueError: Если передан не список строк или пара в неверном формате.
+        """
+        if not isinstance(symbols, list) or not all(isinstance(symbol, str) for symbol in symbols):
+            raise ValueError("ожидается список пар")
+        normalized = [symbol.strip().upper() for symbol in symbols]
+        invalid = [symbol for symbol in normalized if not SYMBOL_PATTERN.match(symbol)]
+        if invalid:
+            raise ValueError(f"неверный формат пар: {invalid}")
+        return list(dict.fromkeys(normalized))
+
+    async def apply(self, add: list[str] = (), remove: list[str] = ()) -> dict:
+        """
+        Убирает и добавляет пары; пары, которые уже в нужном состоянии, пропускаются.
+
+        Returns:
+            dict: Актуальный набор и фактически добавленные/убранные пары.
+        """
+        async with self._lock:
+            removed = [symbol for symbol in remove if symbol in self.symbols]
+            added = [symbol for symbol in add if symbol not in self.symbols or symbol in removed]
+            if removed:
+                await self.on_remove(removed)
+                self.symbols = [symbol for symbol in self.symbols if symbol not in removed]
+            if added:
+                await self.on_add(added)
+                self.symbols.extend(symbol for symbol in added if symbol not in self.symbols)
+            if added or removed:
+                save_symbols(self.symbols, self.state_path)
+                logging.info(f"[SymbolControl] Добавлены: {added}, убраны: {removed}; пар: {len(self.symbols)}")
+            return {"symbols": self.symbols, "added": added, "removed": removed}
+
+    async def handle_get(self, request: web.Request) -> web.Response:
+        return web.json_response({"symbols": self.symbols})
+
+    async def handle_post(self, request: web.Request) -> web.Response:
+        try:
+            body = await request.json()
+            if not isinstance(body, dict):
+                raise ValueError("ожидается объект {\"add\": [...], \"remove\": [...]}")
+            add = self.normalize(body.get("add", []))
+            remove = self.normalize(body.get("remove", []))
+        except ValueError as e:
+            return web.json_response({"error": str(e)}, status=400)
+        try:
+            return web.json_response(await self.apply(add, remove))
+        except RuntimeError as e:
+            # Набор пар нельзя менять в текущей конфигурации (например, с разделяемой памятью)
+            return web.json_response({"error": str(e)}, status=409)
+
+    async def serve(self, host: str = CONTROL_HOST, port: int = CONTROL_PORT) -> web.AppRunner:
+        """
+        Запускает HTTP-эндпоинт /symbols.
+
+        Returns:
+            web.AppRunner: Раннер, который нужно остановить через `cleanup()`.
+        """
+        app = web.Application()
+        app.router.add_get("/symbols", self.handle_get)
+        app.router.add_post("/symbols", self.handle_post)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logging.info(f"[SymbolControl] Управление парами: http://{host}:{port}/symbols")
+        return runner
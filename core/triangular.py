@@ -0,0 +1,175 @@
+"""
+Инкрементальный поиск треугольного арбитража внутри одной биржи.
+
+Пары каждой биржи образуют граф валют: пара BASE-QUOTE даёт ребро
+BASE→QUOTE (продажа по bid) и QUOTE→BASE (покупка по ask), вес ребра —
+`-log(курс с учётом комиссии)`. Цикл прибылен, если сумма весов меньше
+`-log(1 + порог)`. Все треугольники перечисляются один раз при создании,
+и для каждой пары запоминаются циклы, проходящие через неё. Тик пары
+пересчитывает только эти циклы (две суммы из трёх весов на цикл) вместо
+полного Беллмана–Форда по графу.
+"""
+import math
+from collections import Counter, defaultdict
+from typing import Optional
+
+import numpy as np
+
+# Стороны сделки на ребре
+SELL = 0  # BASE -> QUOTE по bid
+BUY = 1   # QUOTE -> BASE по ask
+
+
+class TriangularEngine:
+    """
+    Треугольные циклы по парам `PriceState` на каждой бирже.
+
+    Attributes:
+        cycle_count (int): Число циклов (каждый треугольник в двух направлениях)
+        labels (list[str]): Подпись цикла, например "USDT→BTC→ETH→USDT"
+    """
+
+    def __init__(self, price_state, evaluator):
+        """
+        Args:
+            price_state (PriceState): Состояние цен; пары в формате "BASE-QUOTE"
+            evaluator (ArbitrageEvaluator): Источник комиссий и порога прибыли
+        """
+        self.price_state = price_state
+        self.exchanges = price_state.exchanges
+        self.exchange_count = len(self.exchanges)
+        self.buy_multipliers = [evaluator.buy_multipliers.get(ex, 1.0) for ex in self.exchanges]
+        self.sell_multipliers = [evaluator.sell_multipliers.get(ex, 1.0) for ex in self.exchanges]
+        self.limit = -math.log1p(evaluator.min_profit_percent / 100)
+
+        self.pairs = [tuple(symbol.split("-", 1)) if symbol and "-" in symbol else None
+                      for symbol in price_state.symbols]
+        cycles = self._enumerate_cycles()
+        self.cycle_count = len(cycles)
+        self.labels = [self._label(cycle) for cycle in cycles]
+        # Рёбра цикла: id ребра = 2 * symbol_id + сторона
+        self.cycle_edges = np.array(
+            [[2 * symbol_id + side for symbol_id, side in cycle] for cycle in cycles], dtype=np.intp
+        ).reshape(-1, 3)
+
+        by_pair = defaultdict(list)
+        for cycle_id, cycle in enumerate(cycles):
+            for symbol_id in {symbol_id for symbol_id, _ in cycle}:
+                by_pair[symbol_id].append(cycle_id)
+        self.pair_cycles = {symbol_id: np.array(ids, dtype=np.intp) for symbol_id, ids in by_pair.items()}
+        self._pair_cycle_edges = {symbol_id: self.cycle_edges[ids] for symbol_id, ids in self.pair_cycles.items()}
+
+        self.weights = np.full((self.exchange_count, 2 * len(self.pairs)), np.inf, dtype=np.float64)
+        self.active = np.zeros((self.exchange_count, self.cycle_count), dtype=bool)
+
+    def _enumerate_cycles(self) -> list[tuple]:
+        """Все треугольники графа валют в обоих направлениях: кортежи из трёх (symbol_id, сторона)."""
+        edges = {}
+        neighbours = defaultdict(set)
+        for symbol_id, pair in enumerate(self.pairs):
+            if pair is None:
+                continue
+            base, quote = pair
+            edges[(base, quote)] = (symbol_id, SELL)
+            edges[(quote, base)] = (symbol_id, BUY)
+            neighbours[base].add(quote)
+            neighbours[quote].add(base)
+
+        # Начинаем цикл с валюты, которая чаще всего котирует другие (обычно USDT)
+        quote_rank = Counter(pair[1] for pair in self.pairs if pair is not None)
+        seen = set()
+        cycles = []
+        for a in neighbours:
+            for b in neighbours[a]:
+                for c in neighbours[a] & neighbours[b]:
+                    triangle = frozenset((a, b, c))
+                    if len(triangle) < 3 or triangle in seen:
+                        continue
+                    seen.add(triangle)
+                    start = max(triangle, key=lambda currency: (quote_rank[currency], currency))
+                    x, y = sorted(triangle - {start})
+                    for path in ((start, x, y), (start, y, x)):
+                        cycles.append(tuple(edges[(path[i], path[(i + 1) % 3])] for i in range(3)))
+        return cycles
+
+    def _label(self, cycle: tuple) -> str:
+        currencies = []
+        for symbol_id, side in cycle:
+            base, quote = self.pairs[symbol_id]
+            currencies.append(base if side == SELL else quote)
+        return "→".join(currencies + currencies[:1])
+
+    def _refresh_weights(self, symbol_id: int, exchange_id: int):
+        cell = symbol_id * self.exchange_count + exchange_id
+        expiry = self.price_state.expiry
+        bid = self.price_state._bid[cell]
+        ask = self.price_state._ask[cell]
+        weights = self.weights[exchange_id]
+        if expiry is not None and expiry.is_cell_expired(cell):
+            bid = ask = math.nan
+        # NaN (нет котировки) и неположительные цены отключают ребро весом +inf
+        weights[2 * symbol_id + SELL] = -math.log(bid * self.sell_multipliers[exchange_id]) if bid > 0 else math.inf
+        weights[2 * symbol_id + BUY] = math.log(ask * self.buy_multipliers[exchange_id]) if ask > 0 else math.inf
+
+    def update_symbol(self, symbol_id: int, exchange_id: int = None) -> list[tuple[str, Optional[dict]]]:
+        """
+        Пересчитывает циклы через пару после её обновления.
+
+        Args:
+            symbol_id (int): Индекс обновлённой пары
+            exchange_id (int, optional): Биржа; по умолчанию все биржи
+
+        Returns:
+            list[tuple[str, dict | None]]: (подпись цикла, возможность) для циклов, которые
+                прибыльны сейчас, и (подпись, None) для тех, что перестали быть прибыльными.
+        """
+        cycle_ids = self.pair_cycles.get(symbol_id)
+        if cycle_ids is None:
+            return []
+        edges = self._pair_cycle_edges[symbol_id]
+        exchange_ids = range(self.exchange_count) if exchange_id is None else (exchange_id,)
+        results = []
+        for exchange_id in exchange_ids:
+            self._refresh_weights(symbol_id, exchange_id)
+            sums = self.weights[exchange_id][edges].sum(axis=1)
+            profitable = sums < self.limit
+            active = self.active[exchange_id]
+            changed = profitable | active[cycle_ids]
+            if not changed.any():
+                continue
+            active[cycle_ids] = profitable
+            for index in np.flatnonzero(changed):
+                cycle_id = int(cycle_ids[index])
+                key = f"{self.labels[cycle_id]}@{self.exchanges[exchange_id]}"
+                if profitable[index]:
+                    results.append((key, self._opportunity(cycle_id, exchange_id, float(sums[index]))))
+                else:
+                    results.append((key, None))
+        return results
+
+    def active_keys(self) -> list[str]:
+        """Ключи циклов, прибыльных на момент последнего пересчёта ("подпись@биржа")."""
+        return [f"{self.labels[cycle_id]}@{self.exchanges[exchange_id]}"
+                for exchange_id, cycle_id in zip(*np.nonzero(self.active))]
+
+    def _opportunity(self, cycle_id: int, exchange_id: int, weight_sum: float) -> dict:
+        """Возможность в формате `ArbitrageEvaluator.evaluate` с описанием ног цикла."""
+        legs = []
+        for edge in self.cycle_edges[cycle_id]:
+            symbol_id, side = divmod(int(edge), 2)
+            cell = symbol_id * self.exchange_count + exchange_id
+            legs.append({
+                "symbol": self.price_state.symbols[symbol_id],
+                "side": "sell" if side == SELL else "buy",
+                "price": self.price_state._bid[cell] if side == SELL else self.price_state._ask[cell],
+            })
+        exchange = self.exchanges[exchange_id]
+        return {
+            "symbol": self.labels[cycle_id],
+            "buy_exchange": exchange,
+            "sell_exchange": exchange,
+            "buy_price": legs[0]["price"],
+            "sell_price": legs[-1]["price"],
+            "profit_percent": round(math.expm1(-weight_sum) * 100, 4),
+            "legs": legs,
+        }
@@ -0,0 +1,306 @@
+import asyncio
+import os
+import time
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+
+from core.base_ws_client import BaseWSClient
+from core.decoder import make_prefilter
+
+load_dotenv()
+
+# Число независимых соединений на шард котировок; при 2+ соединения гонятся, дубликаты отбрасываются
+WS_FEED_REDUNDANCY = int(os.getenv("WS_FEED_REDUNDANCY", 1))
+# Соединение без кадров дольше стольких секунд переподключается (0 — выключено)
+WS_SILENCE_TIMEOUT = float(os.getenv("WS_SILENCE_TIMEOUT", 0))
+# Верхняя граница случайной задержки переподключения молчащего соединения, секунды
+WS_FAST_RECONNECT_DELAY = float(os.getenv("WS_FAST_RECONNECT_DELAY", 0.5))
+# Период фоновых замеров эндпоинтов при нескольких URL, секунды (0 — выбор только при подключении)
+WS_PROBE_INTERVAL = float(os.getenv("WS_PROBE_INTERVAL", 60))
+# Переезд на другой эндпоинт, только если его RTT меньше текущего хотя бы на столько мс
+WS_MIGRATION_MIN_GAIN_MS = float(os.getenv("WS_MIGRATION_MIN_GAIN_MS", 5))
+# Максимальное перекрытие старого и нового соединений при переезде, секунды
+WS_MIGRATION_OVERLAP = float(os.getenv("WS_MIGRATION_OVERLAP", 2))
+
+# Режимы канала котировок адаптеров: тикеры или лучший уровень стакана
+TICKERS = "tickers"
+BBO = "bbo"
+
+
+def first_copy(last_seen: dict, key: tuple) -> bool:
+    """
+    Проверяет, что кадр с ключом `dedup_key` по своему потоку ещё не встречался.
+
+    Кадры старше последнего принятого по потоку считаются копиями; при равном
+    времени кадры различаются по отпечатку.
+
+    Args:
+        last_seen (dict): Поток -> [время последнего принятого кадра, отпечатки кадров с этим временем];
+            обновляется при принятии кадра
+        key (tuple): (поток, время, отпечаток)
+
+    Returns:
+        bool: True, если кадр принят
+    """
+    stream, timestamp, fingerprint = key
+    seen = last_seen.get(stream)
+    if seen is None or timestamp > seen[0]:
+        last_seen[stream] = [timestamp, {fingerprint}]
+    elif timestamp < seen[0] or fingerprint in seen[1]:
+        return False
+    else:
+        seen[1].add(fingerprint)
+    return True
+
+
+class WSConnectionPool:
+    """
+    Пул WebSocket соединений одной биржи: символы делятся на шарды по `shard_size`.
+
+    Каждый шард — отдельный `BaseWSClient` со своим payload подписки и своим
+    состоянием переподключения, поэтому обрыв одного сокета переподписывает
+    только его символы, а остальные продолжают получать данные.
+
+    При `redundancy` > 1 на каждый шард открывается несколько независимых
+    соединений с одинаковой подпиской. Кадр передаётся обработчику от того
+    соединения, которое доставило его первым; копии от остальных отбрасываются
+    по ключу `dedup_key` (поток, время биржи, отпечаток) и засчитываются
+    соединению как проигрыш гонки. Кадры старше последнего принятого по потоку
+    отбрасываются; при равном времени различаются по отпечатку, чтобы два
+    разных обновления в одну миллисекунду не склеились.
+
+    Символы добавляются и убираются на ходу (`add_symbols`/`remove_symbols`):
+    живым соединениям шарда уходят инкрементальные subscribe/unsubscribe, а
+    payload подписки шарда пересобирается, чтобы после переподключения
+    подписаться только на актуальный набор. Новые символы занимают шард со
+    свободным местом, при его отсутствии открывается новый шард.
+
+    При нескольких URL каждое соединение само выбирает самый быстрый эндпоинт
+    и переезжает на более быстрый без потери кадров (см. `BaseWSClient`);
+    переезд использует тот же `dedup_key`, что и гонка соединений.
+    """
+
+    def __init__(self, url: str | list[str], symbols: list[str], build_payload: Callable[[list[str]], dict], name: str,
+                 message_handler, shard_size: int = 0, frame_markers: tuple[bytes, ...] = None,
+                 redundancy: int = 1, dedup_key: Optional[Callable[[dict], Optional[tuple]]] = None,
+                 silence_timeout: float = WS_SILENCE_TIMEOUT):
+        """
+        Инициализация пула.
+
+        Args:
+            url (str | list[str]): URL или эндпоинты-кандидаты WebSocket сервера
+            symbols (list[str]): Все символы биржи
+            build_payload (Callable): Строит payload подписки для списка символов шарда
+            name (str): Имя биржи для логирования; шарды получают имена вида "Bybit#0",
+                реплики — "Bybit#0/1"
+            message_handler (callable): Общая функция обработки сообщений
+            shard_size (int): Максимум символов на соединение; 0 — все на одном соединении
+            frame_markers (tuple[bytes, ...], optional): Маркеры префильтра кадров
+            redundancy (int): Число соединений на шард; больше 1 требует `dedup_key`
+            dedup_key (Callable, optional): Возвращает (поток, время, отпечаток) сообщения
+                или None, если сообщение не нужно сверять
+            silence_timeout (float): Порог молчания соединения в секундах (0 — выключено)
+        """
+        # 0 — без ограничения: все символы на одном шарде
+        self.shard_size = shard_size
+        shard_size = shard_size if shard_size > 0 else max(len(symbols), 1)
+        self.redundancy = redundancy if dedup_key is not None else 1
+        self.url = url
+        self.name = name
+        self.build_payload = build_payload
+        self.frame_markers = frame_markers
+        self.silence_timeout = silence_timeout
+        # Соединения шарда гоняются друг с другом
+        self.racing = self.redundancy > 1
+        self.message_handler = message_handler
+        self.dedup_key = dedup_key
+        # Метаданные журналов кадров всех соединений; адаптеры пишут сюда режим канала
+        self.journal_metadata: dict = {}
+        self.shards: list[list[str]] = []
+        # Поток (топик/инструмент) -> [время последнего принятого кадра, отпечатки кадров с этим временем]
+        self._last_seen: dict = {}
+        self.clients: list[BaseWSClient] = []
+        self._client_shard: list[int] = []
+        self._last_sample: list[tuple[float, int]] = []
+        # Символ -> первое соединение его шарда (для переподписки)
+        self._symbol_to_client: dict[str, BaseWSClient] = {}
+        self._started = False
+        self._tasks: set[asyncio.Task] = set()
+        chunks = [symbols[i:i + shard_size] for i in range(0, len(symbols), shard_size)]
+        for chunk in chunks:
+            self._add_shard(chunk, single=len(chunks) == 1)
+
+    def _add_shard(self, symbols: list[str], single: bool = False) -> int:
+        """Создаёт шард и его соединения; возвращает индекс шарда."""
+        index = len(self.shards)
+        self.shards.append(list(symbols))
+        shard_name = self.name if single else f"{self.name}#{index}"
+        for replica in range(self.redundancy):
+            client = BaseWSClient(
+                url=self.url,
+                subscribe_payload=self.build_payload(self.shards[index]),
+                name=shard_name if self.redundancy == 1 else f"{shard_name}/{replica}",
+                message_handler=self.message_handler,
+                frame_markers=self.frame_markers,
+                silence_timeout=self.silence_timeout,
+                fast_reconnect_delay=WS_FAST_RECONNECT_DELAY,
+                dedup_key=self.dedup_key,
+                probe_interval=WS_PROBE_INTERVAL,
+                migration_min_gain_ms=WS_MIGRATION_MIN_GAIN_MS,
+                migration_overlap=WS_MIGRATION_OVERLAP,
+                journal_metadata=self.journal_metadata,
+            )
+            if self.racing:
+                client.message_handler = self._race_handler(client)
+            self.clients.append(client)
+            self._client_shard.append(index)
+            self._last_sample.append((time.monotonic(), 0))
+            if self._started:
+                self._tasks.add(asyncio.create_task(client.connect()))
+        for symbol in symbols:
+            self._symbol_to_client[symbol] = self.shard_clients(index)[0]
+        return index
+
+    def shard_clients(self, index: int) -> list[BaseWSClient]:
+        """Соединения шарда (реплики)."""
+        return [client for client, shard in zip(self.clients, self._client_shard) if shard == index]
+
+    async def _send_op(self, index: int, op: str, symbols: list[str]):
+        """Отправляет op по символам во все живые соединения шарда и обновляет их payload."""
+        payload = {**self.build_payload(symbols), "op": op}
+        current = self.build_payload(self.shards[index])
+        for client in self.shard_clients(index):
+            client.subscribe_payload = current
+            await client.send_json(payload)
+
+    async def add_symbols(self, symbols: list[str]):
+        """
+        Подписывает новые символы без переподключения.
+        """
+        symbols = [symbol for symbol in dict.fromkeys(symbols) if symbol not in self._symbol_to_client]
+        while symbols:
+            index = next((i for i, shard in enumerate(self.shards)
+                          if self.shard_size <= 0 or len(shard) < self.shard_size), None)
+            if index is None:
+                chunk = symbols[:self.shard_size]
+                symbols = symbols[self.shard_size:]
+                # Новый шард подписывается сам при подключении
+                self._add_shard(chunk)
+                continue
+            room = len(symbols) if self.shard_size <= 0 else self.shard_size - len(self.shards[index])
+            chunk, symbols = symbols[:room], symbols[room:]
+            self.shards[index].extend(chunk)
+            for symbol in chunk:
+                self._symbol_to_client[symbol] = self.shard_clients(index)[0]
+            await self._send_op(index, "subscribe", chunk)
+
+    async def resubscribe(self, frame_markers: tuple[bytes, ...], build_unsubscribe: Callable[[list[str]], dict]):
+        """
+        Переключает все соединения на payload из текущего `build_payload` без переподключения.
+
+        Живым соединениям уходит отписка от прежних каналов (`build_unsubscribe`)
+        и подписка на новые; префильтр кадров заменяется на `frame_markers`.
+        """
+        self.frame_markers = frame_markers
+        prefilter = make_prefilter(frame_markers) if frame_markers else None
+        for index, shard in enumerate(self.shards):
+            unsubscribe = build_unsubscribe(shard)
+            for client in self.shard_clients(index):
+                client.prefilter = prefilter
+                client.subscribe_payload = self.build_payload(shard)
+                if client.is_connected() and shard:
+                    await client.send_json(unsubscribe)
+                    await client.subscribe()
+
+    async def remove_symbols(self, symbols: list[str]):
+        """
+        Отписывает символы без переподключения; соединение опустевшего шарда остаётся открытым.
+        """
+        by_shard: dict[int, list[str]] = {}
+        for symbol in dict.fromkeys(symbols):
+            client = self._symbol_to_client.pop(symbol, None)
+            if client is None:
+                continue
+            index = self._client_shard[self.clients.index(client)]
+            self.shards[index].remove(symbol)
+            by_shard.setdefault(index, []).append(symbol)
+        for index, removed in by_shard.items():
+            await self._send_op(index, "unsubscribe", removed)
+
+    def _race_handler(self, client: BaseWSClient):
+        """
+        Обработчик реплики: пропускает кадр, только если такого по потоку ещё не было.
+        """
+        handler = self.message_handler
+        dedup_key = self.dedup_key
+        last_seen = self._last_seen
+
+        async def handle(data):
+            key = dedup_key(data)
+            if key is not None:
+                if not first_copy(last_seen, key):
+                    client.duplicates += 1
+                    return
+                client.wins += 1
+            await handler(data)
+
+        return handle
+
+    def client_for(self, symbol: str) -> BaseWSClient:
+        """
+        Возвращает соединение, на котором подписан символ.
+        """
+        return self._symbol_to_client[symbol]
+
+    def shard_stats(self) -> list[dict]:
+        """
+        Возвращает статистику по соединениям; скорость сообщений считается с прошлого вызова.
+        """
+        now = time.monotonic()
+        stats = []
+        for index, client in enumerate(self.clients):
+            last_time, last_frames = self._last_sample[index]
+            elapsed = now - last_time
+            rate = (client.frames_received - last_frames) / elapsed if elapsed > 0 else 0.0
+            self._last_sample[index] = (now, client.frames_received)
+            shard_stats = {
+                "shard": client.name,
+                "symbols": len(self.shards[self._client_shard[index]]),
+                "connected": client.is_connected(),
+                "reconnects": client.reconnects,
+                "silent_reconnects": client.silent_reconnects,
+                "frames_received": client.frames_received,
+                "frames_filtered": client.frames_filtered,
+                "msg_rate": round(rate, 2),
+            }
+            if self.racing:
+                shard_stats["win_rate"] = round(self.win_rate(client), 4)
+            if len(client.urls) > 1:
+                shard_stats["url"] = client.url
+                shard_stats["rtt_ms"] = round(client.endpoint_rtt.get(client.url, 0.0), 2)
+                shard_stats["migrations"] = client.migrations
+            stats.append(shard_stats)
+        return stats
+
+    @staticmethod
+    def win_rate(client: BaseWSClient) -> float:
+        """
+        Доля сверенных кадров, которые соединение доставило первым.
+        """
+        total = client.wins + client.duplicates
+        return client.wins / total if total else 0.0
+
+    async def start(self):
+        """
+        Запускает все соединения; каждое переподключается независимо.
+        """
+        self._started = True
+        self._tasks.update(asyncio.create_task(client.connect()) for client in self.clients)
+        try:
+            # Соединения работают до отмены; шарды, добавленные позже, запускаются сразу при создании
+            await asyncio.Future()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
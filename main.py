@@ -2,73 +2,544 @@ import asyncio
 import logging
 import os
 import signal
+import time
 
 from dotenv import load_dotenv
 
 from core.arbitrage_evaluator import ArbitrageEvaluator
-from core.exchange_bybit import BybitWS
-from core.exchange_okx import OKXWS
+from core.async_logging import setup_logging
+from core.best_venue import BestVenues
+from core.coalescing_queue import CoalescingQueue
+from core.exchange_bybit import BybitOrderBookWS, BybitWS
+from core.exchange_okx import OKXOrderBookWS, OKXWS
+from core.live_trading import create_executor
+from core.loop_monitor import LOOP_MONITOR_INTERVAL_MS, LoopLagMonitor, SamplingProfiler
+from core.metrics import METRICS_PORT, Metrics, frame_clock
+from core.opportunity_tracker import REMOVED, OpportunityTracker, create_journal
 from core.price_state import PriceState
-from notifier.telegram import (
-    close_telegram_session,
-    pretty_arbitrage_message,
-    send_telegram_message,
-    should_notify,
-)
-
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler()],
-)
+from core.quote_expiry import EXPIRED, QuoteExpiry
+from core.shared_quotes import SharedQuoteWriter
+from core.spread_stats import SPREAD_STATS_ENABLED, SpreadStats
+from core.supervisor import WORKER_PROCESSES, Supervisor, partition
+from core.symbol_control import CONTROL_PORT, SymbolControl, load_symbols
+from core.triangular import TriangularEngine
+from notifier.telegram import TelegramNotifier, close_telegram_session
+
+# Настройка логирования: запись в консоль и logs/ идёт из фонового потока
+setup_logging()
 
 # Загрузка переменных окружения
 load_dotenv()
 
+# Тики старше MAX_TICK_DELAY_MS по времени биржи отбрасываются до оценки
+MAX_TICK_DELAY_MS = float(os.getenv("MAX_TICK_DELAY_MS", 1000))
+ENABLE_LATENCY_CHECK = os.getenv("ENABLE_LATENCY_CHECK", "True").lower() == "true"
+# Котировка без обновлений дольше QUOTE_TTL_SECONDS (по времени биржи) считается устаревшей
+QUOTE_TTL_SECONDS = float(os.getenv("QUOTE_TTL_SECONDS", 5))
+# Период вывода статистики соединений и очереди в лог (0 — выключено)
+STATS_LOG_INTERVAL = float(os.getenv("STATS_LOG_INTERVAL", 60))
+# Имя сегмента разделяемой памяти для публикации котировок (пусто — выключено)
+SHARED_QUOTES_NAME = os.getenv("SHARED_QUOTES_NAME", "")
+# Поиск треугольного арбитража внутри каждой биржи по парам из SYMBOLS
+TRIANGULAR_ENABLED = os.getenv("TRIANGULAR_ENABLED", "False").lower() == "true"
+
 
-async def main():
-    """Главная функция запуска и управления приложением."""
+def load_symbol_list() -> list[str]:
+    """Пары из SYMBOLS или из сохранённого набора SYMBOLS_STATE_PATH."""
     # Загрузка списка валютных пар из .env
     symbols_str = os.getenv("SYMBOLS", "BTC-USDT,ETH-USDT")
     symbols = [symbol.strip() for symbol in symbols_str.split(",")]
+    # Набор, изменённый через управление парами, переживает перезапуск
+    saved_symbols = load_symbols()
+    if saved_symbols is not None:
+        symbols = saved_symbols
+        logging.info("Набор пар восстановлен из SYMBOLS_STATE_PATH")
+    return symbols
+
+
+async def main(symbols: list[str] = None, channel=None):
+    """
+    Главная функция запуска и управления приложением.
+
+    Args:
+        symbols (list[str], optional): Пары; по умолчанию из `load_symbol_list`
+        channel (WorkerChannel, optional): Канал к супервизору в многопроцессном режиме;
+            заменяет уведомитель, метрики уходят супервизору вместо HTTP-эндпоинта
+    """
+    if symbols is None:
+        symbols = load_symbol_list()
     logging.info(f"Запускаем мониторинг для пар: {symbols}")
 
     # Инициализация компонентов
     price_state = PriceState(symbols)
-    arbitrage_evaluator = ArbitrageEvaluator()
+    arbitrage_evaluator = ArbitrageEvaluator(price_state.exchanges)
+    # Лучшие bid/ask по биржам поддерживаются кучами на каждом тике, оценка читает вершины
+    BestVenues.for_price_state(price_state, arbitrage_evaluator)
+    # Скользящие окна спредов по направлениям для фильтра по z-score
+    spread_stats = None
+    if SPREAD_STATS_ENABLED:
+        spread_stats = SpreadStats.for_price_state(price_state, arbitrage_evaluator)
+    elif arbitrage_evaluator.zscore_min > 0:
+        logging.warning("SPREAD_ZSCORE_MIN задан, но SPREAD_STATS_ENABLED выключен — действует THRESHOLD_PERCENT.")
+    # Окна возможностей: открытие/пик/закрытие, закрытые окна пишутся в журнал
+    opportunity_journal = create_journal()
+    opportunity_tracker = OpportunityTracker(opportunity_journal)
+    quote_expiry = QuoteExpiry.for_price_state(price_state, QUOTE_TTL_SECONDS)
+    triangular = None
+    if TRIANGULAR_ENABLED:
+        triangular = TriangularEngine(price_state, arbitrage_evaluator)
+        logging.info(f"Треугольный арбитраж: {triangular.cycle_count} циклов на биржу")
+
+    def log_quote_expiry(event, symbol_id, exchange_id):
+        symbol = price_state.symbols[symbol_id]
+        exchange = price_state.exchanges[exchange_id]
+        if event == EXPIRED:
+            logging.warning(f"Котировка {exchange} для {symbol} устарела, пара исключена из оценки.")
+            opportunity_tracker.close_symbol(symbol)
+            if triangular is not None:
+                report_cycles(triangular.update_symbol(symbol_id, exchange_id))
+        else:
+            logging.info(f"Котировка {exchange} для {symbol} снова актуальна.")
+
+    quote_expiry.add_listener(log_quote_expiry)
+    shared_quotes = None
+    if SHARED_QUOTES_NAME:
+        # У каждого воркера свой сегмент: <имя>-<номер воркера>
+        shared_quotes_name = SHARED_QUOTES_NAME if channel is None else f"{SHARED_QUOTES_NAME}-{channel.index}"
+        shared_quotes = SharedQuoteWriter.for_price_state(shared_quotes_name, price_state)
+        logging.info(f"Котировки публикуются в разделяемую память: {shared_quotes_name}")
+
+    # Интервал полного пересчёта всех пар (0 — оценка на каждом тике)
+    batch_scan_interval_ms = float(os.getenv("BATCH_SCAN_INTERVAL_MS", 0))
+    # Сумма сделки для проверки исполнимости по стаканам (0 — стаканы не используются)
+    depth_notional = float(os.getenv("DEPTH_NOTIONAL_USDT", 0))
+    book_clients = []
+    if depth_notional > 0:
+        book_clients = [
+            BybitOrderBookWS(symbols, depth=int(os.getenv("BYBIT_ORDERBOOK_DEPTH", 50))),
+            OKXOrderBookWS(symbols, channel=os.getenv("OKX_ORDERBOOK_CHANNEL", "books")),
+        ]
+
+    def check_depth(opportunity):
+        """Перепроверяет возможность по L2 стаканам на сумму DEPTH_NOTIONAL_USDT."""
+        if not book_clients:
+            return opportunity
+        symbol = opportunity["symbol"]
+        books = {client.books[symbol].exchange: client.books[symbol] for client in book_clients}
+        return arbitrage_evaluator.evaluate_depth(symbol, books, depth_notional)
+
+    # Очередь "последний побеждает" между приёмом тиков и оценкой
+    evaluation_queue = CoalescingQueue()
+    max_tick_delay = MAX_TICK_DELAY_MS / 1000
+
+    # Гистограммы задержек по стадиям; ссылки получаем заранее, чтобы на горячем пути был только record
+    metrics = Metrics() if METRICS_PORT > 0 else None
+    if metrics:
+        exchange_count = len(price_state.exchanges)
+
+        # Свободные строки убранных пар получают None
+        def cell_histograms(stage):
+            return [
+                metrics.histogram(stage, exchange=exchange, symbol=symbol) if symbol else None
+                for symbol in price_state.symbols for exchange in price_state.exchanges
+            ]
+
+        def symbol_histograms(stage):
+            return [metrics.histogram(stage, symbol=symbol) if symbol else None for symbol in price_state.symbols]
+
+        network_latency, parse_latency, state_latency = [], [], []
+        evaluate_latency, notify_latency, total_latency = [], [], []
+        opportunity_counters = []
+        state_updated_at = []
 
-    # Обратный вызов для обработки обновлений цен
-    async def process_price_update(symbol, exchange, timestamp, bid=None, ask=None):
-        # Обновляем состояние цены
-        price_state.update(symbol, exchange, bid, ask, timestamp)
+        def bind_symbol_metrics():
+            """Ссылки на метрики по индексам пар; пересобираются при изменении набора пар."""
+            # network: время биржи -> приём кадра (включает расхождение часов, точность ts биржи 1 мс)
+            network_latency[:] = cell_histograms("network")
+            # parse: приём кадра -> обработчик цены (декодирование и разбор адаптером)
+            parse_latency[:] = cell_histograms("parse")
+            # state: обновление PriceState
+            state_latency[:] = cell_histograms("state")
+            # evaluate: обновление состояния -> результат оценки (включая ожидание в очереди)
+            evaluate_latency[:] = symbol_histograms("evaluate")
+            # notify: результат оценки -> отправка уведомления (включая окно агрегации и лимиты)
+            notify_latency[:] = symbol_histograms("notify")
+            # total: время биржи у самой свежей котировки -> отправка уведомления
+            total_latency[:] = symbol_histograms("total")
+            opportunity_counters[:] = [
+                metrics.counter("oshten_opportunities_total", symbol=symbol) if symbol else None
+                for symbol in price_state.symbols
+            ]
+            state_updated_at.extend([0.0] * (len(price_state.symbols) - len(state_updated_at)))
+
+        bind_symbol_metrics()
+        batch_latency = metrics.histogram("batch_scan")
+        # loop_lag: насколько позже планового просыпается задача монитора цикла
+        loop_lag = metrics.histogram("loop_lag")
+
+    def record_notified(opportunities):
+        """Задержки до отправки уведомления для /metrics."""
+        notified_at = time.time()
+        for opportunity in opportunities:
+            symbol_id = price_state.symbol_id(opportunity["symbol"])
+            # Пара могла быть убрана, пока уведомление ждало отправки
+            if "detected_at" not in opportunity or symbol_id is None:
+                continue
+            notify_latency[symbol_id].record(notified_at - opportunity["detected_at"])
+            total_latency[symbol_id].record(notified_at - opportunity["quote_timestamp"])
+
+    # Уведомления уходят из фоновой очереди с агрегацией и лимитами Telegram;
+    # воркер передаёт возможности супервизору, который владеет уведомителем
+    if channel is not None:
+        notifier = channel
+        channel.metrics = metrics
+    else:
+        notifier = TelegramNotifier(on_sent=record_notified if metrics else None)
+
+    # Задержка цикла событий и стек блокирующего кода в лог
+    loop_monitor = None
+    if LOOP_MONITOR_INTERVAL_MS > 0:
+        loop_monitor = LoopLagMonitor(histogram=loop_lag if metrics else None)
+
+    # Реальное исполнение (LIVE_TRADING): обе ноги уходят одновременно в фоне
+    executor = create_executor(metrics)
+
+    # Обратный вызов для обработки обновлений цен: только обновляет состояние
+    # и помечает пару, не дожидаясь оценки и отправки уведомлений
+    async def process_price_update(symbol, exchange, timestamp, bid=None, ask=None, symbol_id=None, exchange_id=None):
+        parsed_at = time.time()
+        # Отбрасываем тики, которые уже пришли слишком старыми
+        if ENABLE_LATENCY_CHECK and timestamp is not None and parsed_at - timestamp > max_tick_delay:
+            evaluation_queue.record_shed()
+            return
+
+        # Обновляем состояние цены (по индексам, если адаптер их передал)
+        if symbol_id is None or exchange_id is None:
+            symbol_id = price_state.symbol_id(symbol)
+            exchange_id = price_state.exchange_id(exchange)
+            if symbol_id is None or exchange_id is None:
+                price_state.update(symbol, exchange, bid, ask, timestamp)
+                return
+        price_state.update_by_id(symbol_id, exchange_id, bid, ask, timestamp)
+
+        if metrics:
+            updated_at = time.time()
+            received_at = frame_clock.received_at
+            cell = symbol_id * exchange_count + exchange_id
+            if timestamp is not None:
+                network_latency[cell].record(received_at - timestamp)
+            parse_latency[cell].record(parsed_at - received_at)
+            state_latency[cell].record(updated_at - parsed_at)
+            state_updated_at[symbol_id] = updated_at
+
+        # В пакетном режиме оценку делает отдельная задача
+        if batch_scan_interval_ms > 0:
+            return
+        evaluation_queue.put(symbol_id)
+
+    def report_cycles(cycles):
+        """Передаёт изменившиеся треугольные циклы в трекер окон и очередь уведомлений."""
+        for key, cycle_opportunity in cycles:
+            opportunity_tracker.observe(key, cycle_opportunity)
+            if cycle_opportunity:
+                notifier.submit(cycle_opportunity)
+
+    async def evaluate_symbol(symbol_id):
+        symbol = price_state.symbols[symbol_id]
+        # Пара убрана, пока её индекс ждал в очереди
+        if symbol is None:
+            return
+
+        # Треугольные циклы через пару пересчитываются по каждой бирже отдельно
+        if triangular is not None:
+            report_cycles(triangular.update_symbol(symbol_id))
 
         # Проверяем, готовы ли данные для анализа арбитража
-        if not price_state.is_ready(symbol):
+        if not price_state.is_ready_by_id(symbol_id):
             return
 
-        # Проверяем, не устарели ли данные
-        if price_state.is_stale(symbol, timeout=5):
-            logging.warning(f"Данные для {symbol} устарели, пропускаем оценку.")
+        # Проверяем, не устарели ли данные (флаг выставляет колесо истечения)
+        if quote_expiry.is_expired(symbol_id):
             return
 
-        # Получаем цены и оцениваем возможность арбитража
-        prices = price_state.get_all_for_symbol(symbol)
-        opportunity = arbitrage_evaluator.evaluate(symbol, prices)
+        # Оцениваем возможность арбитража по лучшим биржам пары
+        opportunity = arbitrage_evaluator.evaluate_venues(price_state, symbol_id)
+        if opportunity:
+            opportunity = check_depth(opportunity)
+        # Направления с открытыми окнами, переставшие быть лучшими, проверяются отдельно:
+        # их окна закрываются, только когда пропала возможность в своём направлении
+        directions = [opportunity] if opportunity else []
+        for buy_exchange, sell_exchange in opportunity_tracker.directions(symbol):
+            if opportunity and (opportunity["buy_exchange"], opportunity["sell_exchange"]) == (buy_exchange,
+                                                                                              sell_exchange):
+                continue
+            other = arbitrage_evaluator.evaluate_direction(price_state, symbol_id, buy_exchange, sell_exchange)
+            if other:
+                directions.append(other)
+        opportunity_tracker.observe(symbol, directions)
+        if metrics:
+            evaluated_at = time.time()
+            evaluate_latency[symbol_id].record(evaluated_at - state_updated_at[symbol_id])
+            if opportunity:
+                opportunity_counters[symbol_id][0] += 1
+                opportunity["detected_at"] = evaluated_at
+                opportunity["quote_timestamp"] = price_state.newest_timestamp(symbol_id)
+
+        # Исполнение и отправка идут в фоне: оценка не ждёт бирж и Telegram
+        if opportunity:
+            if executor:
+                executor.submit(opportunity, opportunity_tracker.window(opportunity))
+            notifier.submit(opportunity)
+
+    async def evaluation_loop():
+        """Забирает пары с новыми котировками и оценивает их по самому свежему состоянию."""
+        while True:
+            for symbol_id in await evaluation_queue.drain():
+                try:
+                    await evaluate_symbol(symbol_id)
+                except Exception as e:
+                    logging.error(f"Ошибка оценки для {price_state.symbols[symbol_id]}: {e}",
+                                  extra={"log_key": ("evaluate", symbol_id)})
 
-        if opportunity and should_notify():
-            message = pretty_arbitrage_message(opportunity)
-            await send_telegram_message(message)
+    async def batch_scan_loop():
+        """Периодически пересчитывает все пары за один векторный проход."""
+        interval = batch_scan_interval_ms / 1000
+        while True:
+            await asyncio.sleep(interval)
+            started_at = time.time()
+            # Все прошедшие порог направления идут в трекер окон, лучшее по паре (первое) — дальше
+            directions = arbitrage_evaluator.evaluate_state(price_state, stale_timeout=QUOTE_TTL_SECONDS,
+                                                            all_directions=True)
+            opportunities = []
+            reported = []
+            symbol = None
+            for direction in directions:
+                if direction["symbol"] != symbol:
+                    symbol = direction["symbol"]
+                    direction = check_depth(direction)
+                    if direction:
+                        opportunities.append(direction)
+                if direction:
+                    reported.append(direction)
+            opportunity_tracker.observe_batch(reported)
+            if metrics:
+                batch_latency.record(time.time() - started_at)
+                for opportunity in opportunities:
+                    opportunity_counters[price_state.symbol_id(opportunity["symbol"])][0] += 1
+            for opportunity in opportunities:
+                if executor:
+                    executor.submit(opportunity, opportunity_tracker.window(opportunity))
+                notifier.submit(opportunity)
 
     # Создание и запуск WebSocket клиентов
-    bybit_client = BybitWS(symbols, process_price_update)
-    okx_client = OKXWS(symbols, process_price_update)
+    bybit_client = BybitWS(symbols, process_price_update, price_state)
+    okx_client = OKXWS(symbols, process_price_update, price_state)
+
+    def rebuild_triangular():
+        """Пересобирает треугольные циклы под текущий набор пар и пересчитывает их."""
+        nonlocal triangular
+        if triangular is None:
+            return
+        for key in triangular.active_keys():
+            opportunity_tracker.close_symbol(key, REMOVED)
+        triangular = TriangularEngine(price_state, arbitrage_evaluator)
+        for symbol_id, symbol in enumerate(price_state.symbols):
+            if symbol is not None:
+                report_cycles(triangular.update_symbol(symbol_id))
+        logging.info(f"Треугольный арбитраж: {triangular.cycle_count} циклов на биржу")
+
+    async def add_symbols(added):
+        """Подключает пары на ходу: строки состояния, метрики и подписки на живых соединениях."""
+        for symbol in added:
+            price_state.add_symbol(symbol)
+        if metrics:
+            bind_symbol_metrics()
+        rebuild_triangular()
+        if executor:
+            executor.add_symbols(added)
+        for client in [bybit_client, okx_client, *book_clients]:
+            await client.add_symbols(added)
+
+    async def remove_symbols(removed):
+        """Отписывается от пар и освобождает их строки; кадры в пути адаптеры уже отбрасывают."""
+        for client in [bybit_client, okx_client, *book_clients]:
+            await client.remove_symbols(removed)
+        for symbol in removed:
+            opportunity_tracker.close_symbol(symbol, REMOVED)
+            price_state.remove_symbol(symbol)
+        if metrics:
+            bind_symbol_metrics()
+        rebuild_triangular()
+
+    # Управление набором пар без переподключения (с разделяемой памятью набор фиксирован)
+    symbol_control = None
+    if CONTROL_PORT > 0 and channel is None:
+        if shared_quotes:
+            logging.warning("CONTROL_PORT задан, но набор пар фиксирован при SHARED_QUOTES_NAME — управление выключено.")
+        else:
+            symbol_control = SymbolControl(symbols, add_symbols, remove_symbols)
+
+    async def stats_log_loop():
+        """Периодически пишет в лог скорость сообщений по шардам и счётчики очереди."""
+        while True:
+            await asyncio.sleep(STATS_LOG_INTERVAL)
+            for client in [bybit_client, okx_client, *book_clients]:
+                for shard in client.pool.shard_stats():
+                    logging.info(f"[Stats] {shard}")
+            logging.info(f"[Stats] Очередь оценки: {evaluation_queue.stats()}")
+            logging.info(f"[Stats] Уведомления: {notifier.stats()}")
+            if executor:
+                logging.info(f"[Stats] Исполнение: {executor.stats()}")
+            logging.info(f"[Stats] Окна возможностей: {opportunity_tracker.stats()}")
+            if loop_monitor:
+                logging.info(f"[Stats] Цикл событий: {loop_monitor.stats()}")
+            stale = dict(zip(price_state.exchanges, quote_expiry.stale_cells))
+            logging.info(f"[Stats] Устаревшие котировки по биржам: {stale}")
+
+    def connection_metrics():
+        """Счётчики кадров и переподключений по шардам и состояние очереди оценки для /metrics."""
+        for client in [bybit_client, okx_client, *book_clients]:
+            for shard in client.pool.clients:
+                labels = {"shard": shard.name}
+                yield "oshten_ws_frames_total", "counter", labels, shard.frames_received
+                yield "oshten_ws_frames_filtered_total", "counter", labels, shard.frames_filtered
+                yield "oshten_ws_reconnects_total", "counter", labels, shard.reconnects
+                yield "oshten_ws_silent_reconnects_total", "counter", labels, shard.silent_reconnects
+                if client.pool.racing:
+                    yield "oshten_ws_race_wins_total", "counter", labels, shard.wins
+                    yield "oshten_ws_race_duplicates_total", "counter", labels, shard.duplicates
+                    yield "oshten_ws_race_win_rate", "gauge", labels, client.pool.win_rate(shard)
+                yield "oshten_ws_connected", "gauge", labels, int(shard.is_connected())
+                if len(shard.urls) > 1:
+                    yield "oshten_ws_migrations_total", "counter", labels, shard.migrations
+                    for url, rtt in list(shard.endpoint_rtt.items()):
+                        yield "oshten_ws_endpoint_rtt_ms", "gauge", {**labels, "url": url}, rtt
+        for exchange_id, exchange in enumerate(price_state.exchanges):
+            labels = {"exchange": exchange}
+            yield "oshten_quote_expirations_total", "counter", labels, quote_expiry.expirations[exchange_id]
+            yield "oshten_quotes_stale", "gauge", labels, quote_expiry.stale_cells[exchange_id]
+        queue_stats = evaluation_queue.stats()
+        yield "oshten_ticks_enqueued_total", "counter", {}, queue_stats["enqueued"]
+        yield "oshten_ticks_coalesced_total", "counter", {}, queue_stats["coalesced"]
+        yield "oshten_ticks_shed_total", "counter", {}, queue_stats["shed"]
+        yield "oshten_evaluation_pending", "gauge", {}, queue_stats["pending"]
+        tracker_stats = opportunity_tracker.stats()
+        yield "oshten_opportunity_windows_open", "gauge", {}, tracker_stats["open"]
+        yield "oshten_opportunity_windows_opened_total", "counter", {}, tracker_stats["opened"]
+        yield "oshten_opportunity_windows_closed_total", "counter", {}, tracker_stats["closed"]
+        if channel is None:
+            yield from notification_metrics(notifier)
+        if loop_monitor:
+            yield "oshten_loop_slow_callbacks_total", "counter", {}, loop_monitor.slow_callbacks
+        if spread_stats:
+            for symbol_id, buy_id, sell_id in spread_stats.directions():
+                labels = {"symbol": price_state.symbols[symbol_id], "buy": price_state.exchanges[buy_id],
+                          "sell": price_state.exchanges[sell_id]}
+                for key, value in spread_stats.summary(symbol_id, buy_id, sell_id).items():
+                    if key != "count":
+                        yield "oshten_spread_percent", "gauge", {**labels, "stat": key}, value
 
     # Задачи для асинхронного выполнения
-    tasks = [bybit_client.start(), okx_client.start()]
+    tasks = [bybit_client.start(), okx_client.start(), quote_expiry.run(), notifier.run()]
+    tasks.extend(client.start() for client in book_clients)
+    if batch_scan_interval_ms > 0:
+        logging.info(f"Пакетный пересчёт каждые {batch_scan_interval_ms} мс")
+        tasks.append(batch_scan_loop())
+    else:
+        tasks.append(evaluation_loop())
+    if STATS_LOG_INTERVAL > 0:
+        tasks.append(stats_log_loop())
+    if loop_monitor:
+        tasks.append(loop_monitor.run())
 
     # Ожидание завершения задач
-    await asyncio.gather(*tasks)
+    metrics_runner = None
+    control_runner = None
+    try:
+        if metrics:
+            metrics.register_collector(connection_metrics)
+            if channel is None:
+                metrics_runner = await metrics.serve()
+        if symbol_control:
+            control_runner = await symbol_control.serve()
+        if executor:
+            logging.info("LIVE_TRADING включён: сделки отправляются на биржи")
+            await executor.start(symbols)
+        await asyncio.gather(*tasks)
+    finally:
+        if executor:
+            await executor.close()
+        if control_runner:
+            await control_runner.cleanup()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        if shared_quotes:
+            shared_quotes.close()
+        opportunity_tracker.close_all()
+        if opportunity_journal:
+            opportunity_journal.close()
+
+
+def notification_metrics(notifier):
+    """Счётчики уведомителя для /metrics."""
+    notifier_stats = notifier.stats()
+    for key in ("submitted", "deduplicated", "suppressed", "sent", "failed", "rate_limited"):
+        yield f"oshten_notifications_{key}_total", "counter", {}, notifier_stats[key]
+
+
+async def supervise():
+    """
+    Многопроцессный режим: пары делятся между WORKER_PROCESSES воркерами.
+
+    Супервизор запускает воркеров, владеет уведомителем и отдаёт объединённые
+    метрики воркеров на своём /metrics.
+    """
+    symbols = load_symbol_list()
+    shards = partition(symbols, WORKER_PROCESSES)
+    logging.info(f"Многопроцессный режим: {WORKER_PROCESSES} воркеров, пар по воркерам: "
+                 f"{[len(shard) for shard in shards]}")
+    if TRIANGULAR_ENABLED:
+        logging.warning("TRIANGULAR_ENABLED в многопроцессном режиме: циклы ищутся только внутри доли воркера.")
+    if CONTROL_PORT > 0:
+        logging.warning("CONTROL_PORT не поддерживается в многопроцессном режиме — управление выключено.")
+
+    metrics = Metrics() if METRICS_PORT > 0 else None
+
+    def record_notified(opportunities):
+        """Задержки до отправки уведомления для /metrics."""
+        notified_at = time.time()
+        for opportunity in opportunities:
+            if "detected_at" not in opportunity:
+                continue
+            symbol = opportunity["symbol"]
+            metrics.histogram("notify", symbol=symbol).record(notified_at - opportunity["detected_at"])
+            metrics.histogram("total", symbol=symbol).record(notified_at - opportunity["quote_timestamp"])
+
+    notifier = TelegramNotifier(on_sent=record_notified if metrics else None)
+    supervisor = Supervisor(shards, main, notifier, metrics)
+
+    async def stats_log_loop():
+        while True:
+            await asyncio.sleep(STATS_LOG_INTERVAL)
+            logging.info(f"[Stats] Воркеры: {supervisor.stats()}")
+            logging.info(f"[Stats] Уведомления: {notifier.stats()}")
+
+    def supervisor_metrics():
+        yield from supervisor.metric_samples()
+        yield from notification_metrics(notifier)
+
+    tasks = [supervisor.run(), notifier.run()]
+    if STATS_LOG_INTERVAL > 0:
+        tasks.append(stats_log_loop())
+    metrics_runner = None
+    try:
+        if metrics:
+            metrics.register_collector(supervisor_metrics)
+            metrics_runner = await metrics.serve()
+        await asyncio.gather(*tasks)
+    finally:
+        if metrics_runner:
+            await metrics_runner.cleanup()
 
 
 async def shutdown(loop: asyncio.AbstractEventLoop):
@@ -88,9 +559,11 @@ if __name__ == "__main__":
     # Настройка обработки сигналов для корректного завершения
     for sig in (signal.SIGINT, signal.SIGTERM):
         loop.add_signal_handler(sig, lambda: asyncio.create_task(shutdown(loop)))
+    # kill -USR1 <pid> пишет профиль стеков в PROFILE_DIR без перезапуска
+    SamplingProfiler().install(loop)
 
     try:
-        loop.run_until_complete(main())
+        loop.run_until_complete(supervise() if WORKER_PROCESSES > 1 else main())
     except KeyboardInterrupt:
         pass
     finally:
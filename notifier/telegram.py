@@ -11,10 +11,26 @@ load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}"
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+TELEGRAM_API_URL = f"{TELEGRAM_API_BASE}{TELEGRAM_TOKEN}"
 
 LAST_NOTIFICATION_TIME = 0
 COOLDOWN_SECONDS = float(os.getenv("TELEGRAM_COOLDOWN_SECONDS", 30))
+# Окно, за которое близкие по времени возможности собираются в одно сообщение
+BATCH_WINDOW_MS = float(os.getenv("TELEGRAM_BATCH_WINDOW_MS", 250))
+# Лимиты Bot API: ~1 сообщение/с в один чат и ~30 сообщений/с на бота
+CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", 1))
+GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 30))
+MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", 3))
+# Ограничение Bot API на длину текста сообщения
+MAX_MESSAGE_LENGTH = 4096
+# Пауза перед повторной отправкой возможностей из неудавшегося сообщения, секунды
+FAILED_RETRY_DELAY = 5.0
+
+# Итоги отправки сообщения: доставлено, временная ошибка (повторить позже), отклонено насовсем
+DELIVERED = "delivered"
+TRANSIENT = "transient"
+REJECTED = "rejected"
 
 _session: Optional[aiohttp.ClientSession] = None
 
@@ -76,4 +92,245 @@ def pretty_arbitrage_message(opportunity: dict) -> str:
         f"🟢 Купить: {buy_price}﹩\n"
         f"🔴 Продать: {sell_price}﹩\n\n"
     )
-    return message
\ No newline at end of file
+    return message
+
+
+class TokenBucket:
+    """
+    Ведро токенов: `rate` токенов в секунду, не больше `capacity` подряд.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Сколько секунд ждать до появления токена (0 — токен есть)."""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def take(self):
+        self._refill(time.monotonic())
+        self.tokens -= 1
+
+    def block(self, seconds: float):
+        """Запрещает отправку на `seconds` секунд (ответ 429 с retry_after)."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+
+class TelegramNotifier:
+    """
+    Очередь исходящих уведомлений с фоновой отправкой.
+
+    `submit` не ждёт сеть: возможность кладётся в очередь с ключом
+    (пара, биржа покупки, биржа продажи), повтор по тому же ключу заменяет
+    ожидающую запись. Фоновый `run` собирает всё, что пришло за окно
+    BATCH_WINDOW_MS, в одно сообщение, соблюдает лимиты чата и бота через
+    ведра токенов и ждёт `retry_after` при ответе 429. Кулдаун
+    TELEGRAM_COOLDOWN_SECONDS действует отдельно для каждого ключа, поэтому
+    сигнал по BTC не глушит сигнал по ETH. Кулдаун отсчитывается от успешной
+    доставки: возможности из сообщения, которое не удалось отправить из-за
+    сети, 5xx или исчерпанных повторов после 429, возвращаются в очередь и
+    уходят повторно через FAILED_RETRY_DELAY. Сообщение, отклонённое с другим
+    кодом 4xx (ошибка разметки, неверный токен или чат), не повторяется.
+
+    Attributes:
+        submitted (int): Число переданных в `submit` возможностей
+        deduplicated (int): Заменены ожидающей записью с тем же ключом
+        suppressed (int): Отброшены кулдауном ключа
+        sent (int): Отправлено сообщений
+        failed (int): Сообщений, которые не удалось отправить
+        rate_limited (int): Получено ответов 429
+    """
+
+    def __init__(self, token: str = None, chat_id: str = None, api_base: str = None, cooldown: float = COOLDOWN_SECONDS,
+                 batch_window_ms: float = BATCH_WINDOW_MS, chat_rate: float = CHAT_RATE,
+                 global_rate: float = GLOBAL_RATE, on_sent=None):
+        """
+        Args:
+            token (str): Токен бота (TELEGRAM_TOKEN)
+            chat_id (str): Чат для уведомлений (TELEGRAM_CHAT_ID)
+            api_base (str): Адрес Bot API без токена (TELEGRAM_API_URL)
+            cooldown (float): Пауза между уведомлениями по одной паре и направлению, секунды
+            batch_window_ms (float): Окно агрегации возможностей в одно сообщение
+            chat_rate (float): Сообщений в секунду в один чат
+            global_rate (float): Сообщений в секунду на бота
+            on_sent (callable, optional): `on_sent(opportunities)` после успешной отправки
+        """
+        self.token = token or TELEGRAM_TOKEN
+        self.chat_id = chat_id or TELEGRAM_CHAT_ID
+        self.api_url = f"{api_base or TELEGRAM_API_BASE}{self.token}"
+        self.cooldown = cooldown
+        self.batch_window = batch_window_ms / 1000
+        self.chat_rate = chat_rate
+        self.global_bucket = TokenBucket(global_rate, capacity=global_rate)
+        self.chat_buckets: dict[str, TokenBucket] = {}
+        self.on_sent = on_sent
+
+        self.submitted = 0
+        self.deduplicated = 0
+        self.suppressed = 0
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+
+        self._pending: dict[tuple, dict] = {}
+        self._last_sent: dict[tuple, float] = {}
+        self._wakeup = asyncio.Event()
+
+    def submit(self, opportunity: dict):
+        """
+        Ставит возможность в очередь на отправку, не дожидаясь сети.
+        """
+        self.submitted += 1
+        key = self._key(opportunity)
+        if key in self._pending:
+            self.deduplicated += 1
+        elif time.monotonic() - self._last_sent.get(key, float("-inf")) < self.cooldown:
+            self.suppressed += 1
+            return
+        self._pending[key] = opportunity
+        self._wakeup.set()
+
+    def stats(self) -> dict:
+        """Счётчики очереди уведомлений."""
+        return {
+            "pending": len(self._pending),
+            "submitted": self.submitted,
+            "deduplicated": self.deduplicated,
+            "suppressed": self.suppressed,
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+        }
+
+    def _chat_bucket(self, chat_id: str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self.chat_buckets[chat_id] = TokenBucket(self.chat_rate)
+        return bucket
+
+    @staticmethod
+    def _key(opportunity: dict) -> tuple:
+        return opportunity.get("symbol"), opportunity.get("buy_exchange"), opportunity.get("sell_exchange")
+
+    @staticmethod
+    def format_batch(opportunities: list[dict]) -> list[tuple[str, list[dict]]]:
+        """
+        Собирает возможности в сообщения не длиннее MAX_MESSAGE_LENGTH, лучшие — первыми.
+
+        Returns:
+            list[tuple[str, list[dict]]]: Текст каждого сообщения и возможности, которые в него вошли.
+        """
+        opportunities = sorted(opportunities, key=lambda o: o.get("profit_percent", 0), reverse=True)
+        parts = [pretty_arbitrage_message(opportunity) for opportunity in opportunities]
+        if len(parts) == 1:
+            return [(parts[0], opportunities)]
+        messages = []
+        current = f"🔔 <b>Возможностей: {len(parts)}</b>\n\n"
+        included = []
+        for part, opportunity in zip(parts, opportunities):
+            if len(current) + len(part) > MAX_MESSAGE_LENGTH:
+                messages.append((current, included))
+                current = ""
+                included = []
+            current += part
+            included.append(opportunity)
+        messages.append((current, included))
+        return messages
+
+    def _requeue(self, opportunities: list[dict]):
+        """Возвращает возможности неотправленного сообщения в очередь; более свежая запись по ключу важнее."""
+        for opportunity in opportunities:
+            self._pending.setdefault(self._key(opportunity), opportunity)
+        asyncio.get_running_loop().call_later(FAILED_RETRY_DELAY, self._wakeup.set)
+
+    async def _post(self, chat_id: str, text: str) -> str:
+        """
+        Отправляет одно сообщение с учётом лимитов и повторов после 429.
+
+        Returns:
+            str: DELIVERED, если Telegram принял сообщение; REJECTED при ответе 4xx
+                (кроме 429), повтор которого не поможет; TRANSIENT при ошибке сети,
+                5xx или исчерпании повторов.
+        """
+        chat_bucket = self._chat_bucket(chat_id)
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "HTML"}
+        url = f"{self.api_url}/sendMessage"
+        for _ in range(MAX_RETRIES + 1):
+            delay = max(chat_bucket.delay(), self.global_bucket.delay())
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = max(chat_bucket.delay(), self.global_bucket.delay())
+            chat_bucket.take()
+            self.global_bucket.take()
+            try:
+                session = await _get_session()
+                async with session.post(url, data=payload) as resp:
+                    if resp.status == 200:
+                        return DELIVERED
+                    body = await resp.json(content_type=None)
+                    if resp.status == 429:
+                        self.rate_limited += 1
+                        retry_after = float((body.get("parameters") or {}).get("retry_after", 1))
+                        logging.warning(f"Telegram ограничил частоту, повтор через {retry_after} с")
+                        chat_bucket.block(retry_after)
+                        continue
+                    logging.error(f"Ошибка отправки сообщения в Telegram: {resp.status}, {body}")
+                    return REJECTED if 400 <= resp.status < 500 else TRANSIENT
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.error(f"Ошибка при отправке сообщения в Telegram: {e}")
+                chat_bucket.block(1)
+        return TRANSIENT
+
+    async def run(self):
+        """
+        Фоновая отправка: ждёт возможности, собирает окно и отправляет пачкой.
+        """
+        enabled = bool(self.token and self.chat_id)
+        if not enabled:
+            logging.warning("Telegram токен или chat ID не установлен.")
+        while True:
+            await self._wakeup.wait()
+            if self.batch_window > 0:
+                await asyncio.sleep(self.batch_window)
+            self._wakeup.clear()
+            batch = list(self._pending.values())
+            self._pending.clear()
+            if not batch or not enabled:
+                continue
+            delivered = []
+            failed = []
+            for text, opportunities in self.format_batch(batch):
+                result = await self._post(self.chat_id, text)
+                if result == DELIVERED:
+                    self.sent += 1
+                    # Кулдаун ключа начинается только после доставки
+                    sent_at = time.monotonic()
+                    for opportunity in opportunities:
+                        self._last_sent[self._key(opportunity)] = sent_at
+                    delivered.extend(opportunities)
+                elif result == REJECTED:
+                    # Повтор получит тот же отказ и будет тянуть за собой соседей по пачке
+                    self.failed += 1
+                    logging.error(f"Telegram отклонил сообщение, возможностей отброшено: {len(opportunities)}")
+                else:
+                    self.failed += 1
+                    failed.extend(opportunities)
+            if failed:
+                logging.warning(f"Не доставлено возможностей: {len(failed)}, повтор через {FAILED_RETRY_DELAY:g} с")
+                self._requeue(failed)
+            if delivered and self.on_sent is not None:
+                self.on_sent(delivered)